@@ -0,0 +1,134 @@
+'''駒の動きのアニメーションを glutTimerFunc で進めるモジュール
+
+経過時間は単調な時計で測るので，描画の速さによらず同じ時間で動き終わる．
+アニメーションがない間はタイマーを止め，再描画もしない．
+'''
+
+from math import pi, cos
+from time import monotonic
+
+from OpenGL.GL import *
+from OpenGL.GLUT import *
+
+from utils import draw_img
+
+
+class Animation:
+    '''
+    駒の画像を start から end へ動かす．
+    start と end が同じときは，終わるまでその位置に表示し続ける (取られる駒など)．
+
+    Parameters
+    ----------
+    start, end : tuple > (float, float)
+        開始位置，終了位置．
+    imgID : int
+        画像ID．
+    started : float
+        開始時刻 (time.monotonic)．
+    duration : float
+        かかる時間 (秒)．
+    '''
+
+    def __init__(self, start, end, imgID, started, duration):
+        self.start = start
+        self.end = end
+        self.imgID = imgID
+        self.started = started
+        self.duration = duration
+
+    def progress(self, now):
+        '''進み具合 (0.0 から 1.0)'''
+        if self.duration <= 0:
+            return 1.0
+        return min(max((now - self.started) / self.duration, 0.0), 1.0)
+
+    def position(self, now):
+        '''now における位置．はじめと終わりはゆっくり動く．'''
+        rate = (1 - cos(pi * self.progress(now))) / 2
+        return (self.start[0] + (self.end[0] - self.start[0]) * rate,
+                self.start[1] + (self.end[1] - self.start[1]) * rate)
+
+    def done(self, now):
+        return self.progress(now) >= 1.0
+
+
+class Animator:
+    '''
+    複数のアニメーションを同時に進める
+
+    Parameters
+    ----------
+    duration : float, default 0.15
+        1つのアニメーションにかかる時間 (秒)．
+    interval : int, default 16
+        再描画の間隔 (ミリ秒)．
+    clock : callable, default time.monotonic
+        時計．
+
+    Attributes
+    ----------
+    animations : list > [Animation, ...]
+        進行中のアニメーション．
+    '''
+
+    def __init__(self, duration=0.15, interval=16, clock=monotonic):
+        self.duration = duration
+        self.interval = interval
+        self.clock = clock
+        self.animations = []
+        self.callbacks = []
+        self.running = False
+
+    def add(self, start, end, imgID, duration=None):
+        '''アニメーションを加える'''
+        self.animations.append(Animation(start, end, imgID, self.clock(),
+                                         self.duration if duration is None else duration))
+
+    def when_done(self, callback):
+        '''すべてのアニメーションが終わったときに callback() を呼ぶ'''
+        self.callbacks.append(callback)
+
+    def active(self):
+        '''アニメーション中なら True'''
+        return bool(self.animations)
+
+    def start(self):
+        '''タイマーを動かし始める'''
+        if not self.running:
+            self.running = True
+            glutTimerFunc(self.interval, self.tick, 0)
+        glutPostRedisplay()
+
+    def tick(self, value):
+        '''タイマーのコールバック．終わるまで自分自身を登録し直す．'''
+        glutPostRedisplay()
+        now = self.clock()
+        if all(animation.done(now) for animation in self.animations):
+            self.running = False
+            self.animations = []
+            callbacks, self.callbacks = self.callbacks, []
+            for callback in callbacks:
+                callback()
+        else:
+            glutTimerFunc(self.interval, self.tick, 0)
+
+    def hidden(self):
+        '''
+        動いている駒の行先のマス．盤面の駒はここには描画しない．
+
+        Returns
+        -------
+        set > {(int, int), ...}
+        '''
+        return {animation.end for animation in self.animations}
+
+    def draw(self):
+        '''動いている駒を描画する．取られる駒を先に描く．'''
+        if not self.animations:
+            return
+        now = self.clock()
+        glEnable(GL_TEXTURE_2D)
+        for animation in sorted(self.animations, key=lambda a: a.start != a.end):
+            draw_img(*animation.position(now), animation.imgID)
+        glDisable(GL_TEXTURE_2D)
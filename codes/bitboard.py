@@ -0,0 +1,620 @@
+'''ビットボードによる盤面表現と駒の利きの計算を行うモジュール
+
+大きさ size の盤面のマス (x, y) はビット番号 x + size*y に対応する．
+利きの表などは盤面の大きさごとに Geometry にまとめ，大きさごとに一度だけ作る．
+'''
+
+from piece_square import square_values
+from zobrist import PIECE_KEYS, MAX_SIZE
+
+# 通常の盤面の大きさ
+SIZE = 8
+
+# ライダーの方向
+CARDINALS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+DIAGONALS = ((1, 1), (-1, 1), (1, -1), (-1, -1))
+NIGHTRIDER = ((1, 2), (-1, 2), (1, -2), (-1, -2),
+              (2, 1), (-2, 1), (2, -1), (-2, -1))
+
+
+class SliderTable:
+    '''
+    ライダーの利きの表．
+    マスごとに，利きに影響しうるマスの駒の有無から利きを引く．
+    表は必要になった組み合わせから順に埋めていく．
+
+    Parameters
+    ----------
+    geometry : Geometry
+        盤面の大きさごとの表．
+    directions : tuple > ((int, int), ...)
+        進む方向．
+    '''
+
+    def __init__(self, geometry, directions):
+        self.geometry = geometry
+        self.directions = directions
+        self.masks = tuple(geometry.relevant_mask(sq, directions)
+                           for sq in range(len(geometry.squares)))
+        self.tables = tuple({} for _ in geometry.squares)
+
+    def __call__(self, sq, occupied):
+        key = occupied & self.masks[sq]
+        table = self.tables[sq]
+        attacks = table.get(key)
+        if attacks is None:
+            attacks = table[key] = self.geometry.rider_attacks(sq, key, self.directions)
+        return attacks
+
+
+class Geometry:
+    '''
+    大きさ size の正方形の盤面について，マスと利きの表をまとめたもの．
+    geometry(size) で大きさごとに共有したものを得る．
+
+    Parameters
+    ----------
+    size : int
+        盤面の大きさ．
+
+    Attributes
+    ----------
+    squares : tuple > ((int, int), ...)
+        ビット番号から座標への変換表．
+    knight, king : tuple > (int, ...)
+        マスごとのナイト・キングの利き．
+    pawn : dict > {str: tuple}
+        色ごと・マスごとのポーンの斜め前の利き．
+    rays : dict > {(int, int): (tuple, bool)}
+        方向ごとの (盤端まで伸びる利きの表, ビット番号が増える向きか)．
+    dark, light : int
+        暗いマス・明るいマスのビットボード．a1 は暗いマス．
+    leapers, sliders : dict
+        駒の略号ごとの利きの表．
+    '''
+
+    def __init__(self, size):
+        if not 1 <= size <= MAX_SIZE:
+            raise ValueError(f'board size must be 1-{MAX_SIZE}: {size}')
+        self.size = size
+        self.squares = tuple((sq % size, sq // size) for sq in range(size * size))
+        self.knight = self.leaper_table(NIGHTRIDER)
+        self.king = self.leaper_table(CARDINALS + DIAGONALS)
+        self.pawn = {'W': self.leaper_table(((1, 1), (-1, 1))),
+                     'B': self.leaper_table(((1, -1), (-1, -1)))}
+        self.rays = {d: (self.ray_table(d), d[0] + size*d[1] > 0)
+                     for d in CARDINALS + DIAGONALS + NIGHTRIDER}
+        self.dark = 0
+        for x, y in self.squares:
+            if (x + y) % 2 == 0:
+                self.dark |= self.bit(x, y)
+        self.light = ((1 << (size * size)) - 1) ^ self.dark
+
+        self.rook_attacks = SliderTable(self, CARDINALS)
+        self.bishop_attacks = SliderTable(self, DIAGONALS)
+        self.queen_attacks = SliderTable(self, CARDINALS + DIAGONALS)
+        self.unicorn_attacks = SliderTable(self, NIGHTRIDER)
+        self.leapers = {'N': self.knight, 'K': self.king}
+        self.sliders = {'R': self.rook_attacks, 'B': self.bishop_attacks,
+                        'Q': self.queen_attacks, 'Un': self.unicorn_attacks}
+
+        # ビットボードから座標のタプルへの変換結果の記録
+        self._squares_cache = {}
+
+    def in_bounds(self, x, y):
+        '''(x, y) が盤上にあるとき True'''
+        return 0 <= x < self.size and 0 <= y < self.size
+
+    def bit(self, x, y):
+        '''(x, y) に対応するビットを返す'''
+        return 1 << (x + self.size*y)
+
+    def leaper_table(self, offsets):
+        '''各マスからの跳躍先をビットボードにした表を作る'''
+        table = []
+        for x, y in self.squares:
+            bb = 0
+            for dx, dy in offsets:
+                if self.in_bounds(x + dx, y + dy):
+                    bb |= self.bit(x + dx, y + dy)
+            table.append(bb)
+        return tuple(table)
+
+    def ray_table(self, direction):
+        '''各マスから direction の方向へ盤端まで伸びる利きの表を作る'''
+        dx, dy = direction
+        table = []
+        for x, y in self.squares:
+            bb = 0
+            xx, yy = x + dx, y + dy
+            while self.in_bounds(xx, yy):
+                bb |= self.bit(xx, yy)
+                xx, yy = xx + dx, yy + dy
+            table.append(bb)
+        return tuple(table)
+
+    def rider_attacks(self, sq, occupied, directions):
+        '''
+        sq にあるライダーの利きを返す．最初にぶつかった駒のマスまでを含む．
+
+        Parameters
+        ----------
+        sq : int
+            ビット番号．
+        occupied : int
+            駒のあるマスのビットボード．
+        directions : tuple > ((int, int), ...)
+            進む方向．
+
+        Returns
+        -------
+        int
+        '''
+        attacks = 0
+        for d in directions:
+            table, positive = self.rays[d]
+            ray = table[sq]
+            blockers = ray & occupied
+            if blockers:
+                if positive:
+                    first = (blockers & -blockers).bit_length() - 1
+                else:
+                    first = blockers.bit_length() - 1
+                ray ^= table[first]
+            attacks |= ray
+        return attacks
+
+    def relevant_mask(self, sq, directions):
+        '''利きに影響しうるマス (各方向の盤端のマスを除いた利き) のビットボード'''
+        mask = 0
+        for d in directions:
+            table, positive = self.rays[d]
+            ray = table[sq]
+            if ray:
+                last = ray.bit_length() - 1 if positive else (ray & -ray).bit_length() - 1
+                mask |= ray ^ (1 << last)
+        return mask
+
+    def squares_of(self, bb):
+        '''
+        ビットボードに含まれるマスの座標を返す
+
+        Parameters
+        ----------
+        bb : int
+            ビットボード．
+
+        Returns
+        -------
+        tuple > ((int, int), ...)
+        '''
+        result = self._squares_cache.get(bb)
+        if result is None:
+            found = []
+            rest = bb
+            while rest:
+                low = rest & -rest
+                found.append(self.squares[low.bit_length() - 1])
+                rest ^= low
+            result = tuple(found)
+            if len(self._squares_cache) > 1 << 16:
+                self._squares_cache.clear()
+            self._squares_cache[bb] = result
+        return result
+
+    def pawn_moves(self, position, sq, color, occupied):
+        '''ポーンの移動先のビットボード'''
+        x, y = self.squares[sq]
+        direction = 1 if color == 'W' else -1
+        bb = self.pawn[color][sq] & position.occupied['B' if color == 'W' else 'W']
+        if self.in_bounds(x, y + direction):
+            step = self.bit(x, y + direction)
+            if not step & occupied:
+                bb |= step
+                if (color == 'W' and y == 1) or (color == 'B' and y == self.size - 2):
+                    step2 = self.bit(x, y + 2*direction)
+                    if not step2 & occupied:
+                        bb |= step2
+        return bb
+
+
+# 大きさごとの Geometry
+_geometries = {}
+
+
+def geometry(size=SIZE):
+    '''
+    大きさ size の盤面の Geometry を返す．一度作ったものは使い回す．
+
+    Parameters
+    ----------
+    size : int, default SIZE
+        盤面の大きさ．
+
+    Returns
+    -------
+    Geometry
+    '''
+    geo = _geometries.get(size)
+    if geo is None:
+        geo = _geometries[size] = Geometry(size)
+    return geo
+
+
+# 通常の大きさの盤面の表
+STANDARD = geometry(SIZE)
+SQUARES = STANDARD.squares
+KNIGHT_ATTACKS = STANDARD.knight
+KING_ATTACKS = STANDARD.king
+PAWN_ATTACKS = STANDARD.pawn
+RAYS = STANDARD.rays
+rook_attacks = STANDARD.rook_attacks
+bishop_attacks = STANDARD.bishop_attacks
+queen_attacks = STANDARD.queen_attacks
+unicorn_attacks = STANDARD.unicorn_attacks
+LEAPERS = STANDARD.leapers
+SLIDERS = STANDARD.sliders
+in_bounds = STANDARD.in_bounds
+bit = STANDARD.bit
+squares_of = STANDARD.squares_of
+
+
+_OPPONENT = {'W': 'B', 'B': 'W'}
+# 色ごとの駒の名前
+_NAMES = {color: tuple(color + abbr for abbr in ('N', 'K', 'P', 'R', 'B', 'Q', 'Un'))
+          for color in ('W', 'B')}
+
+
+def _position(items, size):
+    return Position(items, size=size)
+
+
+class Position(dict):
+    '''
+    {(int, int): obj} の盤面と同じように扱え，
+    色ごと・駒ごとのビットボードを同時に管理する盤面
+
+    Attributes
+    ----------
+    occupied : dict > {str: int}
+        色ごとの駒のあるマス．
+    bitboards : dict > {str: int}
+        駒の名前 ('WN' など) ごとの駒のあるマス．
+        キングの位置もここから盤面を走査せずに得られる．
+    hash : int
+        盤面のゾブリストハッシュ．
+    score : int
+        白から見た駒の価値と駒の位置の表の和 (piece_square.square_values)．
+    geometry : Geometry
+        盤面の大きさごとの利きの表．
+    size : int
+        盤面の大きさ．Position(..., size=10) のように指定する．
+    '''
+
+    __slots__ = ('occupied', 'bitboards', 'hash', 'score', 'square_values', 'geometry', 'size')
+
+    def __init__(self, *args, size=SIZE, **kwargs):
+        super().__init__()
+        self.geometry = geometry(size)
+        self.size = size
+        self.square_values = square_values(size)
+        self.occupied = {'W': 0, 'B': 0}
+        self.bitboards = {}
+        self.hash = 0
+        self.score = 0
+        for pos, piece in dict(*args, **kwargs).items():
+            self[pos] = piece
+
+    def __setitem__(self, pos, piece):
+        if dict.__contains__(self, pos):
+            self._unset(pos, dict.__getitem__(self, pos))
+        dict.__setitem__(self, pos, piece)
+        sq = pos[0] + self.size*pos[1]
+        b = 1 << sq
+        self.occupied[piece.color] |= b
+        self.bitboards[piece.name] = self.bitboards.get(piece.name, 0) | b
+        self.hash ^= PIECE_KEYS[piece.name][pos]
+        self.score += self.square_values[piece.name][sq]
+
+    def __delitem__(self, pos):
+        self._unset(pos, dict.__getitem__(self, pos))
+        dict.__delitem__(self, pos)
+
+    def _unset(self, pos, piece):
+        sq = pos[0] + self.size*pos[1]
+        b = 1 << sq
+        self.occupied[piece.color] &= ~b
+        self.bitboards[piece.name] &= ~b
+        self.hash ^= PIECE_KEYS[piece.name][pos]
+        self.score -= self.square_values[piece.name][sq]
+
+    def pop(self, pos, *default):
+        if dict.__contains__(self, pos):
+            piece = dict.__getitem__(self, pos)
+            del self[pos]
+            return piece
+        return dict.pop(self, pos, *default)
+
+    def update(self, *args, **kwargs):
+        for pos, piece in dict(*args, **kwargs).items():
+            self[pos] = piece
+
+    def clear(self):
+        dict.clear(self)
+        self.occupied = {'W': 0, 'B': 0}
+        self.bitboards = {}
+        self.hash = 0
+        self.score = 0
+
+    def copy(self):
+        new = Position.__new__(Position)
+        dict.update(new, self)
+        new.occupied = self.occupied.copy()
+        new.bitboards = self.bitboards.copy()
+        new.hash = self.hash
+        new.score = self.score
+        new.square_values = self.square_values
+        new.geometry = self.geometry
+        new.size = self.size
+        return new
+
+    __copy__ = copy
+
+    def __reduce__(self):
+        # dict の項目はビットボードを作ってから置く
+        return _position, (dict(self), self.size)
+
+    def attacks_from(self, piece, x, y):
+        '''
+        (x, y) にある piece の移動先のビットボード．味方駒のマスは除く．
+
+        Parameters
+        ----------
+        piece : obj
+            駒．
+        x, y : int
+            駒の位置．
+
+        Returns
+        -------
+        int
+        '''
+        geo = self.geometry
+        sq = x + geo.size*y
+        abbr = piece.abbr
+        own = self.occupied[piece.color]
+        leaper = geo.leapers.get(abbr)
+        if leaper is not None:
+            return leaper[sq] & ~own
+        occupied = self.occupied['W'] | self.occupied['B']
+        if abbr == 'P':
+            return geo.pawn_moves(self, sq, piece.color, occupied)
+        slider = geo.sliders[abbr]
+        key = occupied & slider.masks[sq]
+        attacks = slider.tables[sq].get(key)
+        if attacks is None:
+            attacks = slider(sq, occupied)
+        return attacks & ~own
+
+    def moves(self, piece, x, y):
+        '''
+        (x, y) にある piece の移動先．Piece.available_moves と同じ結果を返す．
+
+        Parameters
+        ----------
+        piece : obj
+            駒．
+        x, y : int
+            駒の位置．
+
+        Returns
+        -------
+        list > [(int, int), ...]
+        '''
+        bb = self.attacks_from(piece, x, y)
+        result = self.geometry._squares_cache.get(bb)
+        if result is None:
+            result = self.geometry.squares_of(bb)
+        return list(result)
+
+    def king_square(self, color):
+        '''
+        color 側のキングの位置を返す．キングがいなければ None．
+
+        Parameters
+        ----------
+        color : str > 'W' or 'B'
+            駒色．
+
+        Returns
+        -------
+        tuple > (int, int) or None
+        '''
+        bb = self.bitboards.get(color + 'K')
+        if not bb:
+            return None
+        return self.geometry.squares[bb.bit_length() - 1]
+
+    def attackers_of(self, square, by_color, occupied=None):
+        '''
+        square を攻撃している by_color 側の駒のマスのビットボード
+
+        Parameters
+        ----------
+        square : tuple > (int, int)
+            調べるマス．
+        by_color : str > 'W' or 'B'
+            攻撃する側の駒色．
+        occupied : int or None, default None
+            駒のあるマス．None のときは盤面の駒すべて．
+            ここにない駒は取られたものとして攻撃に数えない．
+
+        Returns
+        -------
+        int
+        '''
+        geo = self.geometry
+        sq = square[0] + geo.size*square[1]
+        if occupied is None:
+            occupied = self.occupied['W'] | self.occupied['B']
+        get = self.bitboards.get
+        knight, king, pawn, rook, bishop, queen, unicorn = _NAMES[by_color]
+        queens = get(queen, 0)
+        attackers = (geo.knight[sq] & get(knight, 0)
+                     | geo.king[sq] & get(king, 0)
+                     | geo.pawn[_OPPONENT[by_color]][sq] & get(pawn, 0))
+        rooks = get(rook, 0) | queens
+        if rooks:
+            attackers |= geo.rook_attacks(sq, occupied) & rooks
+        bishops = get(bishop, 0) | queens
+        if bishops:
+            attackers |= geo.bishop_attacks(sq, occupied) & bishops
+        unicorns = get(unicorn, 0)
+        if unicorns:
+            attackers |= geo.unicorn_attacks(sq, occupied) & unicorns
+        return attackers & occupied
+
+    def pins_and_checks(self, color):
+        '''
+        color 側のキングへの王手とピンを求める．
+        ライダー (ルーク・ビショップ・クイーン・ユニコーン) の利きを
+        キングから各方向へ逆にたどり，最初の駒が相手のライダーなら王手，
+        味方の駒でその先が相手のライダーならピンとする．
+
+        Parameters
+        ----------
+        color : str > 'W' or 'B'
+            駒色．
+
+        Returns
+        -------
+        checkers : int
+            王手をかけている駒のマスのビットボード．
+        evasion : int
+            キング以外の駒が動いて王手を防げるマス (王手をかけている駒と，
+            ライダーとの間のマス) のビットボード．王手でなければ全マス，両王手なら 0．
+        pins : dict > {int: int}
+            ピンされた駒のビット番号ごとの，動いてよいマス (キングとピンしている駒の間と，
+            ピンしている駒のマス) のビットボード．
+        '''
+        geo = self.geometry
+        full = (1 << len(geo.squares)) - 1
+        king_bb = self.bitboards.get(color + 'K')
+        if not king_bb:
+            return 0, full, {}
+        k = king_bb.bit_length() - 1
+        enemy = _OPPONENT[color]
+        get = self.bitboards.get
+        knight, _, pawn, rook, bishop, queen, unicorn = _NAMES[enemy]
+        own = self.occupied[color]
+        occupied = own | self.occupied[enemy]
+        queens = get(queen, 0)
+        checkers = geo.knight[k] & get(knight, 0) | geo.pawn[color][k] & get(pawn, 0)
+        evasion = checkers
+        pins = {}
+        for directions, sliders in ((CARDINALS, get(rook, 0) | queens),
+                                    (DIAGONALS, get(bishop, 0) | queens),
+                                    (NIGHTRIDER, get(unicorn, 0))):
+            if not sliders:
+                continue
+            for d in directions:
+                table, positive = geo.rays[d]
+                ray = table[k]
+                if not ray & sliders:
+                    continue
+                blockers = ray & occupied
+                first = ((blockers & -blockers) if positive else 1 << (blockers.bit_length() - 1))
+                first_sq = first.bit_length() - 1
+                if first & sliders:
+                    checkers |= first
+                    evasion |= ray ^ table[first_sq]
+                elif first & own:
+                    blockers = table[first_sq] & occupied
+                    if not blockers:
+                        continue
+                    second = ((blockers & -blockers) if positive
+                              else 1 << (blockers.bit_length() - 1))
+                    if second & sliders:
+                        pins[first_sq] = ray ^ table[second.bit_length() - 1]
+        if not checkers:
+            evasion = full
+        elif checkers & (checkers - 1):
+            evasion = 0
+        return checkers, evasion, pins
+
+    def legal_targets(self, piece, x, y, evasion, pins):
+        '''
+        (x, y) にある piece の，動いた後に自分のキングが攻撃されない移動先のビットボード．
+        アンパッサンとキャスリングは含まない．
+
+        Parameters
+        ----------
+        piece : obj
+            駒．
+        x, y : int
+            駒の位置．
+        evasion, pins : int, dict
+            pins_and_checks の返り値．
+
+        Returns
+        -------
+        int
+        '''
+        geo = self.geometry
+        sq = x + geo.size*y
+        targets = self.attacks_from(piece, x, y)
+        if piece.abbr != 'K':
+            return targets & evasion & pins.get(sq, evasion)
+        # キングは元のマスを空けたうえで，行先が攻撃されていないか調べる
+        enemy = _OPPONENT[piece.color]
+        occupied = (self.occupied['W'] | self.occupied['B']) ^ (1 << sq)
+        result = 0
+        rest = targets
+        while rest:
+            low = rest & -rest
+            rest ^= low
+            if not self.is_square_attacked(geo.squares[low.bit_length() - 1], enemy, occupied):
+                result |= low
+        return result
+
+    def is_square_attacked(self, square, by_color, occupied=None):
+        '''
+        square が by_color 側の駒に攻撃されていれば True を返す．
+        square から各駒の動きを逆にたどって調べる．
+
+        Parameters
+        ----------
+        square : tuple > (int, int)
+            調べるマス．
+        by_color : str > 'W' or 'B'
+            攻撃する側の駒色．
+        occupied : int or None, default None
+            ライダーの利きを遮る駒のあるマス．None のときは盤面の駒すべて．
+
+        Returns
+        -------
+        bool
+        '''
+        geo = self.geometry
+        sq = square[0] + geo.size*square[1]
+        if occupied is None:
+            occupied = self.occupied['W'] | self.occupied['B']
+        get = self.bitboards.get
+        knight, king, pawn, rook, bishop, queen, unicorn = _NAMES[by_color]
+        if geo.knight[sq] & get(knight, 0):
+            return True
+        if geo.king[sq] & get(king, 0):
+            return True
+        if geo.pawn[_OPPONENT[by_color]][sq] & get(pawn, 0):
+            return True
+        queens = get(queen, 0)
+        rooks = get(rook, 0) | queens
+        if rooks and geo.rook_attacks(sq, occupied) & rooks:
+            return True
+        bishops = get(bishop, 0) | queens
+        if bishops and geo.bishop_attacks(sq, occupied) & bishops:
+            return True
+        unicorns = get(unicorn, 0)
+        if unicorns and geo.unicorn_attacks(sq, occupied) & unicorns:
+            return True
+        return False
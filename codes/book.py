@@ -0,0 +1,335 @@
+'''定跡を扱うモジュール
+
+PGN の対局の序盤から，局面のゾブリストハッシュの順に並べた定跡ファイルを作る．
+対局中は定跡ファイルを mmap で開き，二分探索で局面の手を引くので，
+ファイル全体をメモリに読み込まない．読み込み専用で開くので，
+複数のプロセスで同じファイルを開いても OS のページキャッシュを共有する．
+
+    py book.py games.pgn -o book.bin --plies 20
+    py main.py --computer B --book book.bin
+
+ファイルの形式 (リトルエンディアン)
+
+    ヘッダ (16 バイト): b'CHBK', 版 (uint32), 項目数 (uint64)
+    項目 (16 バイト): 局面のハッシュ (uint64), 開始位置, 終了位置 (x + 16*y, uint8),
+        フラグ (uint8, 1 -- キャスリング), 成り先 (uint8, PROMOTIONS の番号 + 1．成らなければ 0),
+        出現回数 (uint32)
+
+項目はハッシュの昇順，同じハッシュの中では出現回数の多い順に並ぶ．
+'''
+
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+from collections import Counter
+
+from games import Normal, withUnicorn
+from pgn import read_games, open_games, new_rules, parse_san
+from pieces import *
+
+MAGIC = b'CHBK'
+VERSION = 1
+HEADER = struct.Struct('<4sIQ')
+ENTRY = struct.Struct('<QBBBBI')
+_KEY = struct.Struct('<Q')
+
+# 定跡を作るゲームの種類
+BOOK_GAMES = (Normal, withUnicorn)
+# 成り先の駒 (ファイルには番号 + 1 で書く)
+PROMOTIONS = (Knight, Bishop, Rook, Queen, Unicorn)
+# 位置を1バイトにするときの筋の数
+_STRIDE = 16
+
+
+def _square(pos):
+    return pos[0] + _STRIDE*pos[1]
+
+
+def _pos(square):
+    return (square % _STRIDE, square // _STRIDE)
+
+
+def encode_move(move):
+    '''
+    指し手を (開始位置, 終了位置, フラグ, 成り先) の整数にする
+
+    Parameters
+    ----------
+    move : tuple > ((int, int), (int, int), bool, class or None)
+        Rules.legal_moves と同じ形の指し手．
+
+    Returns
+    -------
+    tuple > (int, int, int, int)
+    '''
+    startpos, endpos, castling, promote = move
+    return (_square(startpos), _square(endpos), int(bool(castling)),
+            0 if promote is None else PROMOTIONS.index(promote) + 1)
+
+
+def decode_move(start, end, flags, promote):
+    '''encode_move の逆'''
+    return (_pos(start), _pos(end), bool(flags & 1),
+            None if promote == 0 else PROMOTIONS[promote - 1])
+
+
+def collect(games, plies=20):
+    '''
+    対局の序盤の局面と指し手を数える．
+    BOOK_GAMES 以外のゲームと，合法でない手のある対局はそこで読むのをやめる．
+
+    Parameters
+    ----------
+    games : iterable > PGNGame
+        棋譜．
+    plies : int, default 20
+        1局につき定跡に入れる手数．
+
+    Returns
+    -------
+    counts : collections.Counter > {(int, int, int, int, int): int}
+        (局面のハッシュ, 開始位置, 終了位置, フラグ, 成り先) ごとの出現回数．
+    skipped : int
+        読めなかった対局の数．
+    '''
+    counts = Counter()
+    skipped = 0
+    for game in games:
+        try:
+            rules, _ = new_rules(game.headers)
+        except ValueError:
+            skipped += 1
+            continue
+        if type(rules.kind) not in BOOK_GAMES:
+            skipped += 1
+            continue
+        for text in game.moves[:plies]:
+            try:
+                move = parse_san(rules, text)
+            except ValueError:
+                skipped += 1
+                break
+            counts[(rules.zobrist_hash(rules.gameboard),) + encode_move(move)] += 1
+            rules.make_move(move[0], move[1], rules.gameboard, move[2], move[3])
+    return counts, skipped
+
+
+def write_book(counts, path, min_count=1):
+    '''
+    数えた指し手を定跡ファイルに書く
+
+    Parameters
+    ----------
+    counts : dict > {(int, int, int, int, int): int}
+        collect の出力．
+    path : str
+        定跡ファイル．
+    min_count : int, default 1
+        これより少ない回数しか指されていない手は入れない．
+
+    Returns
+    -------
+    int
+        書いた項目数．
+    '''
+    entries = sorted(((key, min(count, 0xFFFFFFFF)) for key, count in counts.items()
+                      if count >= min_count),
+                     key=lambda item: (item[0][0], -item[1], item[0][1:]))
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(entries)))
+        for key, count in entries:
+            f.write(ENTRY.pack(*key, count))
+    return len(entries)
+
+
+def build_book(games, path, plies=20, min_count=1):
+    '''
+    棋譜から定跡ファイルを作る
+
+    Parameters
+    ----------
+    games : iterable > PGNGame
+        棋譜．
+    path : str
+        定跡ファイル．
+    plies : int, default 20
+        1局につき定跡に入れる手数．
+    min_count : int, default 1
+        これより少ない回数しか指されていない手は入れない．
+
+    Returns
+    -------
+    int
+        書いた項目数．
+    '''
+    counts, _ = collect(games, plies)
+    return write_book(counts, path, min_count)
+
+
+class OpeningBook:
+    '''
+    mmap で開いた定跡ファイル．
+    pickle すると定跡ファイルのパスだけを渡し，受け取ったプロセスで開き直す．
+
+    Parameters
+    ----------
+    path : str
+        定跡ファイル．
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        try:
+            size = os.fstat(self.file.fileno()).st_size
+            if size < HEADER.size:
+                raise ValueError(f'not an opening book: {path}')
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, count = HEADER.unpack_from(self.mmap, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f'not an opening book (or an unsupported version): {path}')
+            if size != HEADER.size + count * ENTRY.size:
+                raise ValueError(f'opening book is truncated: {path}')
+        except BaseException:
+            self.close()
+            raise
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def close(self):
+        mm = getattr(self, 'mmap', None)
+        if mm is not None:
+            mm.close()
+            self.mmap = None
+        self.file.close()
+
+    def _key(self, index):
+        return _KEY.unpack_from(self.mmap, HEADER.size + index * ENTRY.size)[0]
+
+    def entries(self, key):
+        '''
+        局面のハッシュ key の項目を出現回数の多い順に返す
+
+        Returns
+        -------
+        list > [(int, int, int, int, int), ...]
+            (開始位置, 終了位置, フラグ, 成り先, 出現回数) のリスト．
+        '''
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        result = []
+        offset = HEADER.size + lo * ENTRY.size
+        for _ in range(lo, self.count):
+            entry = ENTRY.unpack_from(self.mmap, offset)
+            if entry[0] != key:
+                break
+            result.append(entry[1:])
+            offset += ENTRY.size
+        return result
+
+    def moves(self, rules, legal=None):
+        '''
+        局面の定跡の手を出現回数とあわせて返す．
+        ハッシュの衝突に備えて，合法手 (legal) にない手や
+        手番の側の駒を動かさない手は除く．
+
+        Parameters
+        ----------
+        rules : Rules
+            局面．
+        legal : list or None, default None
+            Rules.legal_moves の出力．None のときは駒の色だけを確かめる．
+
+        Returns
+        -------
+        list > [(tuple, int), ...]
+            (指し手, 出現回数) のリスト．
+        '''
+        if type(rules.kind) not in BOOK_GAMES:
+            return []
+        board = rules.gameboard
+        result = []
+        for start, end, flags, promote, count in self.entries(rules.zobrist_hash(board)):
+            move = decode_move(start, end, flags, promote)
+            if legal is not None:
+                if move not in legal:
+                    continue
+            elif getattr(board.get(move[0]), 'color', None) != rules.playersturn:
+                continue
+            result.append((move, count))
+        return result
+
+    def choose(self, rules, legal=None, rng=None):
+        '''
+        定跡の手から出現回数に比例した確率で1つ選ぶ
+
+        Parameters
+        ----------
+        rules : Rules
+            局面．
+        legal : list or None, default None
+            Rules.legal_moves の出力．
+        rng : random.Random or None, default None
+            乱数．None のときは random モジュールの乱数．
+
+        Returns
+        -------
+        tuple or None
+            指し手．定跡にない局面なら None．
+        '''
+        moves = self.moves(rules, legal)
+        if not moves:
+            return None
+        return (rng or random).choices([move for move, _ in moves],
+                                       [count for _, count in moves])[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compile an opening book from PGN games.')
+    parser.add_argument('pgn', nargs='*', default=['-'],
+                        help='PGN files to read, or - for standard input (default: -)')
+    parser.add_argument('-o', '--output', required=True, help='opening book file to write')
+    parser.add_argument('--plies', type=int, default=20,
+                        help='moves per game to put in the book (default: 20)')
+    parser.add_argument('--min-count', type=int, default=1,
+                        help='leave out moves played fewer times than this (default: 1)')
+    args = parser.parse_args(argv)
+
+    def all_games():
+        for path in args.pgn:
+            if path == '-':
+                yield from read_games(sys.stdin)
+            else:
+                yield from open_games(path)
+
+    counts, skipped = collect(all_games(), args.plies)
+    written = write_book(counts, args.output, args.min_count)
+    print(f'{written} moves written to {args.output} ({skipped} games skipped)',
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
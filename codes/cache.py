@@ -0,0 +1,52 @@
+'''容量に上限のある LRU キャッシュ'''
+
+from collections import OrderedDict
+
+
+class LRUCache:
+    '''
+    最近使われていないものから捨てていくキャッシュ
+
+    Parameters
+    ----------
+    maxsize : int, default 4096
+        保持する項目数の上限．
+
+    Attributes
+    ----------
+    hits, misses : int
+        get で見つかった回数，見つからなかった回数．
+    '''
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key, default=None):
+        '''key に対応する値を返す．なければ default．'''
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        '''key に value を記録する．上限を超えたら最も古いものを捨てる．'''
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def clear(self):
+        '''記録と回数を消す'''
+        self.data.clear()
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,169 @@
+'''NumPy による局面の静的評価
+
+盤面を駒の種類と色ごとの 0/1 の平面 (piece-plane) の配列にし，
+駒の価値と駒の位置の表 (piece-square table) の和で評価する．
+多くの局面をまとめて1回の計算で評価できる．
+
+探索の1局面ごとに呼ぶと配列を作る手間の方が大きいので，
+search の探索では Position が差分で更新する同じ値を使い，
+これは局面の解析などでまとめて評価するときに使う．
+'''
+
+from functools import lru_cache
+
+import numpy as np
+
+from bitboard import Position, SIZE
+from piece_square import square_values
+from pieces import *
+
+# 平面の並び．白の駒，黒の駒の順
+PLANE_NAMES = [color + piece.abbr for color in (W, B) for piece in piece_names]
+PLANE_INDEX = {name: i for i, name in enumerate(PLANE_NAMES)}
+
+
+@lru_cache(maxsize=None)
+def _weights(size=SIZE):
+    '''
+    平面ごとの重み (駒の価値 + 位置の表) を白から見た符号で作る．
+    search の評価関数と同じ piece_square.square_values を使う．
+
+    Returns
+    -------
+    np.ndarray > shape (len(PLANE_NAMES), size, size)
+        [平面, y, x] の順．
+    '''
+    weights = np.zeros((len(PLANE_NAMES), size * size), dtype=np.int32)
+    for name, values in square_values(size).items():
+        weights[PLANE_INDEX[name]] = values
+    return weights.reshape(len(PLANE_NAMES), size, size)
+
+
+WEIGHTS = _weights()
+
+
+def to_planes(gameboard, size=None):
+    '''
+    盤面を駒の平面の配列にする
+
+    Parameters
+    ----------
+    gameboard : Position or dict > {(int, int): Piece, ...}
+        盤面．
+    size : int or None, default None
+        盤面の大きさ．None のときは Position の大きさ (dict なら SIZE)．
+
+    Returns
+    -------
+    np.ndarray > shape (len(PLANE_NAMES), size, size), dtype uint8
+        [平面, y, x] の位置に駒があれば 1．
+
+    Raises
+    ------
+    ValueError
+        size が Position の大きさと違うか，駒が盤の外にある．
+    '''
+    board_size = getattr(gameboard, 'size', None)
+    if size is None:
+        size = board_size or SIZE
+    elif board_size is not None and board_size != size:
+        raise ValueError(f'the board is {board_size}x{board_size}, not {size}x{size}')
+    squares = size * size
+    planes = np.zeros((len(PLANE_NAMES), squares), dtype=np.uint8)
+    if isinstance(gameboard, Position):
+        # ビットボードをバイト列にして，ビットごとに展開する
+        nbytes = (squares + 7) // 8
+        for name, bb in gameboard.bitboards.items():
+            if bb:
+                planes[PLANE_INDEX[name]] = np.unpackbits(
+                    np.frombuffer(bb.to_bytes(nbytes, 'little'), dtype=np.uint8),
+                    bitorder='little')[:squares]
+    else:
+        for (x, y), piece in gameboard.items():
+            if not (0 <= x < size and 0 <= y < size):
+                raise ValueError(f'{(x, y)} is off a {size}x{size} board')
+            planes[PLANE_INDEX[piece.name], x + size*y] = 1
+    return planes.reshape(len(PLANE_NAMES), size, size)
+
+
+def stack_planes(gameboards):
+    '''
+    複数の盤面の平面を1つの配列にまとめる
+
+    Parameters
+    ----------
+    gameboards : iterable > Position or dict
+        盤面．
+
+    Returns
+    -------
+    np.ndarray > shape (局面数, len(PLANE_NAMES), size, size), dtype uint8
+
+    Raises
+    ------
+    ValueError
+        大きさの違う盤面が混ざっている．
+    '''
+    arrays = [to_planes(gameboard) for gameboard in gameboards]
+    if not arrays:
+        return np.zeros((0, len(PLANE_NAMES), SIZE, SIZE), dtype=np.uint8)
+    sizes = {array.shape[-1] for array in arrays}
+    if len(sizes) > 1:
+        raise ValueError(f'boards of different sizes cannot be stacked: {sorted(sizes)}')
+    return np.stack(arrays)
+
+
+def evaluate_batch(planes, turns=None):
+    '''
+    平面の配列でまとめて評価する
+
+    Parameters
+    ----------
+    planes : np.ndarray > shape (局面数, len(PLANE_NAMES), size, size)
+        stack_planes の出力．盤面の大きさに合った位置の表で評価する．
+    turns : sequence > ['W' or 'B', ...] or None, default None
+        各局面の手番．None のときは白から見た評価値を返す．
+
+    Returns
+    -------
+    np.ndarray > shape (局面数,), dtype int64
+    '''
+    weights = _weights(planes.shape[-1])
+    scores = np.tensordot(planes.astype(np.int32), weights, axes=3).astype(np.int64)
+    if turns is not None:
+        sign = np.where(np.asarray(turns) == W, 1, -1)
+        scores *= sign
+    return scores
+
+
+def evaluate_positions(games):
+    '''
+    複数のゲームの局面を，それぞれの手番の側から見てまとめて評価する
+
+    Parameters
+    ----------
+    games : sequence > [Rules, ...]
+        局面．
+
+    Returns
+    -------
+    np.ndarray > shape (局面数,), dtype int64
+    '''
+    return evaluate_batch(stack_planes(game.gameboard for game in games),
+                          [game.playersturn for game in games])
+
+
+def evaluate(rules):
+    '''
+    手番の側から見た局面の評価値．search.evaluate と同じ形で使える．
+
+    Parameters
+    ----------
+    rules : Rules
+        局面．
+
+    Returns
+    -------
+    int
+    '''
+    return int(evaluate_positions([rules])[0])
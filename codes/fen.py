@@ -0,0 +1,287 @@
+'''FEN 形式の局面を読み書きするモジュール
+
+チェス960 のキャスリングは Shredder-FEN (ルークの筋の文字) で書く．
+読むときは KQkq の形も受け付ける．ユニコーンの文字は U．
+'''
+
+from bitboard import Position
+from pieces import *
+
+# FEN の駒の文字
+fen_letters = {'N': Knight, 'R': Rook, 'B': Bishop, 'Q': Queen, 'K': King, 'P': Pawn,
+               'U': Unicorn}
+# 駒の略号から FEN の文字を引く表
+piece_letters = {piece.abbr: letter for letter, piece in fen_letters.items()}
+
+# 通常のチェスの初期局面
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+# 1段目の配置が分からないときに使う並び
+_default_back_rank = [Rook, Knight, Bishop, Queen, King, Bishop, Knight, Rook]
+
+
+def parse_board(field, size=8):
+    '''
+    FEN の駒の配置の部分を盤面にする
+
+    Parameters
+    ----------
+    field : str
+        'rnbqkbnr/pppppppp/8/...' の形の文字列．
+    size : int, default 8
+        盤面の大きさ．
+
+    Returns
+    -------
+    gameboard : Position
+    '''
+    gameboard = Position(size=size)
+    ranks = field.split('/')
+    if len(ranks) != size:
+        raise ValueError(f'FEN must have {size} ranks: {field}')
+    for i, rank in enumerate(ranks):
+        y = size - 1 - i
+        x = 0
+        num = ''
+        for letter in rank:
+            if letter.isdigit():
+                num += letter
+                continue
+            if num:
+                x += int(num)
+                num = ''
+            if letter.upper() not in fen_letters:
+                raise ValueError(f'unknown piece letter in FEN: {letter}')
+            color = W if letter.isupper() else B
+            gameboard[(x, y)] = fen_letters[letter.upper()](color)
+            x += 1
+        if num:
+            x += int(num)
+        if x != size:
+            raise ValueError(f'rank {y + 1} does not have {size} squares: {rank}')
+    return gameboard
+
+
+def board_field(gameboard, size=8):
+    '''
+    盤面を FEN の駒の配置の部分にする
+
+    Parameters
+    ----------
+    gameboard : dict > {(int, int): obj, ...}
+        盤面．
+    size : int, default 8
+        盤面の大きさ．
+
+    Returns
+    -------
+    str
+    '''
+    ranks = []
+    for y in range(size - 1, -1, -1):
+        rank = ''
+        empty = 0
+        for x in range(size):
+            piece = gameboard.get((x, y))
+            if piece is None:
+                empty += 1
+                continue
+            if empty:
+                rank += str(empty)
+                empty = 0
+            letter = piece_letters[piece.abbr]
+            rank += letter if piece.color == W else letter.lower()
+        if empty:
+            rank += str(empty)
+        ranks.append(rank)
+    return '/'.join(ranks)
+
+
+def is_shuffled(kind):
+    '''1段目の配置が対局ごとに変わるゲーム (チェス960) なら True'''
+    return type(kind).__name__ == 'Chess960'
+
+
+def _back_rank_from_board(gameboard, size):
+    '''
+    白の1段目と黒の最奥段が同じ並びの駒で埋まっていれば，その並びを返す．
+    そうでなければ None．
+    '''
+    back_rank = []
+    for x in range(size):
+        white, black = gameboard.get((x, 0)), gameboard.get((x, size - 1))
+        if (white is None or black is None or white.color != W or black.color != B
+                or white.abbr != black.abbr or white.abbr == 'P'):
+            return None
+        back_rank.append(type(white))
+    return back_rank
+
+
+def _castling_rights(field, gameboard, kind):
+    '''
+    キャスリングの欄から，キャスリングのポテンシャルとルークの初期位置を求める
+
+    Returns
+    -------
+    can_castling : dict > {'W': [bool, bool], 'B': [bool, bool]}
+    rook_files : dict > {int: int}
+        キャスリングのできる側 (0 -- クイーンサイド, 1 -- キングサイド) ごとのルークの筋．
+    king_file : int or None
+        キャスリングのできるキングの筋．
+    '''
+    size = kind.size
+    can_castling = {W: [False, False], B: [False, False]}
+    rook_files = {}
+    king_file = None
+    if field == '-':
+        return can_castling, rook_files, king_file
+    for letter in field:
+        color = W if letter.isupper() else B
+        home = 0 if color == W else size - 1
+        if letter.upper() in 'KQ' and not is_shuffled(kind):
+            side = 1 if letter.upper() == 'K' else 0
+            can_castling[color][side] = True
+            continue
+        king_x = next((x for x in range(size)
+                       if getattr(gameboard.get((x, home)), 'name', None) == color + 'K'), None)
+        if king_x is None:
+            raise ValueError(f'castling right {letter} without a king on the home rank')
+        king_file = king_x
+        rooks = [x for x in range(size)
+                 if getattr(gameboard.get((x, home)), 'name', None) == color + 'R']
+        if letter.upper() == 'K':
+            # X-FEN: キングより外側で一番端のルーク
+            side, files = 1, [x for x in rooks if x > king_x][-1:]
+        elif letter.upper() == 'Q':
+            side, files = 0, [x for x in rooks if x < king_x][:1]
+        elif 'a' <= letter.lower() < chr(ord('a') + size):
+            # Shredder-FEN: ルークの筋
+            files = [ord(letter.lower()) - ord('a')]
+            side = 1 if files[0] > king_x else 0
+        else:
+            raise ValueError(f'unknown castling letter in FEN: {letter}')
+        if not files:
+            raise ValueError(f'castling right {letter} without a rook')
+        can_castling[color][side] = True
+        rook_files[side] = files[0]
+    return can_castling, rook_files, king_file
+
+
+def _chess960_back_rank(gameboard, size, rook_files, king_file):
+    '''
+    途中の局面のキャスリングの情報から1段目の配置を組み立てる．
+    キングとルークの位置だけが make_move や castling_requirements で使われる．
+    '''
+    back_rank = _back_rank_from_board(gameboard, size)
+    if back_rank is not None:
+        return back_rank
+    if king_file is None:
+        return list(_default_back_rank)
+    back_rank = [None] * size
+    back_rank[king_file] = King
+    back_rank[rook_files.get(0, 0)] = Rook
+    back_rank[rook_files.get(1, size - 1)] = Rook
+    rest = [Queen, Bishop, Bishop, Knight, Knight]
+    for x in range(size):
+        if back_rank[x] is None:
+            back_rank[x] = rest.pop(0) if rest else None
+    return back_rank
+
+
+def set_fen(game, fen):
+    '''
+    FEN の局面を game に設定する．game.kind は設定済みであること．
+    チェス960 では，局面に合わせて game.kind の1段目の配置を設定し直す．
+
+    Parameters
+    ----------
+    game : Rules
+        設定先のゲーム．
+    fen : str
+        FEN 文字列．手数の欄は省略できる．50手ルールの手数は game.halfmove_clock にする．
+    '''
+    fields = fen.split()
+    if len(fields) < 4:
+        raise ValueError(f'FEN needs at least 4 fields: {fen}')
+    board, turn, castling, en_passant = fields[:4]
+    size = game.kind.size
+
+    game.gameboard = parse_board(board, size)
+    if turn not in ('w', 'b'):
+        raise ValueError(f'side to move must be w or b: {turn}')
+    game.playersturn = W if turn == 'w' else B
+    game.can_castling, rook_files, king_file = _castling_rights(
+        castling, game.gameboard, game.kind)
+    if is_shuffled(game.kind):
+        game.kind.set_back_rank(_chess960_back_rank(game.gameboard, size,
+                                                    rook_files, king_file))
+    # アンパッサンで取れるマスから，直前に2歩進んだポーンの位置を求める
+    if en_passant == '-':
+        game.advanced2_pos = None
+    else:
+        x = ord(en_passant[0]) - ord('a')
+        y = int(en_passant[1:]) - 1
+        game.advanced2_pos = (x, y - 1) if y >= size // 2 else (x, y + 1)
+    # 50手ルールの手数．同じ局面の出現回数はこの局面から数える
+    game.record_position(reset=True)
+    if len(fields) > 4:
+        game.halfmove_clock = int(fields[4])
+
+
+def castling_field(game):
+    '''
+    キャスリングの欄を作る．チェス960 では Shredder-FEN の形にする．
+
+    Parameters
+    ----------
+    game : Rules
+        ゲーム．
+
+    Returns
+    -------
+    str
+    '''
+    rook_init_pos = [x for x, piece in enumerate(game.kind.placers[1]) if piece == Rook]
+    field = ''
+    for color in (W, B):
+        # キングサイド，クイーンサイドの順
+        for side, letter in ((1, 'K'), (0, 'Q')):
+            if not game.can_castling[color][side]:
+                continue
+            if is_shuffled(game.kind):
+                letter = chr(ord('A') + rook_init_pos[side])
+            field += letter if color == W else letter.lower()
+    return field or '-'
+
+
+def get_fen(game, halfmove=None, fullmove=1):
+    '''
+    game の局面を FEN 文字列にする
+
+    Parameters
+    ----------
+    game : Rules
+        ゲーム．
+    halfmove : int or None, default None
+        50手ルールのための手数．None のときは game.halfmove_clock．
+    fullmove : int, default 1
+        手数．
+
+    Returns
+    -------
+    str
+    '''
+    if halfmove is None:
+        halfmove = game.halfmove_clock
+    size = game.kind.size
+    if game.advanced2_pos is None:
+        en_passant = '-'
+    else:
+        x, y = game.advanced2_pos
+        # 2歩進んだポーンの1つ手前のマス
+        y = y - 1 if y < size // 2 else y + 1
+        en_passant = chr(ord('a') + x) + str(y + 1)
+    return ' '.join([board_field(game.gameboard, size),
+                     'w' if game.playersturn == W else 'b',
+                     castling_field(game), en_passant,
+                     str(halfmove), str(fullmove)])
@@ -1,10 +1,78 @@
 '''ゲームの種類によって変わる駒の配置や名前、画像IDを記録したモジュール'''
 
-from random import randint
+import random
 
 from pieces import *
 
 
+def image_ids(placers, size):
+    '''
+    駒の配置から画像IDの割り当てを作る
+
+    Parameters
+    ----------
+    placers : dict > {int: list, ...}
+        段ごとの駒の配置．
+    size : int
+        盤面の大きさ．
+
+    Returns
+    -------
+    dict > {str: int, ...}
+    '''
+    ID = {}
+    for rk in placers:
+        for fl in range(size):
+            if placers[rk][fl] is not None:
+                ID['W' + placers[rk][fl].abbr] = size * rk + fl
+                ID['B' + placers[rk][fl].abbr] = -(size * rk + fl)
+    return ID
+
+
+def scharnagl_setup(pos_id):
+    '''
+    Scharnagl の番号からチェス960 の1段目の配置を求める
+
+    Parameters
+    ----------
+    pos_id : int
+        0 から 959 までの番号．518 が通常のチェスの配置．
+
+    Returns
+    -------
+    list > [class, ...]
+    '''
+    if not 0 <= pos_id < 960:
+        raise ValueError(f'Chess960 position ID must be 0-959: {pos_id}')
+    krn = [
+        [Knight, Knight, Rook, King, Rook],
+        [Knight, Rook, Knight, King, Rook],
+        [Knight, Rook, King, Knight, Rook],
+        [Knight, Rook, King, Rook, Knight],
+        [Rook, Knight, Knight, King, Rook],
+        [Rook, Knight, King, Knight, Rook],
+        [Rook, Knight, King, Rook, Knight],
+        [Rook, King, Knight, Knight, Rook],
+        [Rook, King, Knight, Rook, Knight],
+        [Rook, King, Rook, Knight, Knight]
+    ]
+    setup = [None] * 8
+
+    q, r = pos_id//4, pos_id%4
+    setup[2*r + 1] = Bishop
+
+    q, r = q//4, q%4
+    setup[2*r] = Bishop
+
+    q, r = q//6, q%6
+    empty = [i for i in range(8) if setup[i] is None]
+    setup[empty[r]] = Queen
+
+    for piece in krn[q]:
+        setup[setup.index(None)] = piece
+    return setup
+
+
 class Normal:
     '''通常のチェス'''
     # 盤面のサイズ
@@ -17,69 +85,72 @@ class Normal:
     placers = {1: [Rook, Knight, Bishop, Queen, King, Bishop, Knight, Rook],
         2: [Pawn] * size}
     # 画像IDの割り当て
-    ID = {}
-    for rk in placers:
-        for fl in range(size):
-            if placers[rk][fl] is not None:
-                ID['W' + placers[rk][fl].abbr] = size * rk + fl
-                ID['B' + placers[rk][fl].abbr] = -(size * rk + fl)
+    ID = image_ids(placers, size)
+
+
+# チェス960 の1段目の配置すべて．Scharnagl の番号順で，書き換えられないようにタプルにする
+CHESS960_SETUPS = tuple(tuple(scharnagl_setup(pos_id)) for pos_id in range(960))
+# 配置から Scharnagl の番号を引く表
+CHESS960_IDS = {setup: pos_id for pos_id, setup in enumerate(CHESS960_SETUPS)}
 
 
 class Chess960:
-    '''チェス960'''
+    '''
+    チェス960
+
+    Parameters
+    ----------
+    pos_id : int or None, default None
+        配置の Scharnagl の番号．None のときは，
+        通常のチェスの配置 (518) を除いて乱数で選ぶ．
+    rng : random.Random or None, default None
+        配置を選ぶ乱数．None のときは random モジュールの乱数．
+        random.Random(seed) を渡せば同じ配置を再現できる．
+
+    Raises
+    ------
+    ValueError
+        pos_id が 0 から 959 の範囲にない．
+
+    Attributes
+    ----------
+    pos_id : int or None
+        配置の Scharnagl の番号．途中の局面から組み立てた配置では None．
+    placers, ID : dict
+        インスタンスごとの駒の配置と画像IDの割り当て．
+    '''
     # 盤面のサイズ
     size = 8
     # キャスリングの有無
     castling = True
     # プロモーション先
     promote2 = [Knight, Bishop, Rook, Queen]
-    # 駒の配置
-    placers = {1: [None] * size,
-        2: [Pawn] * size}
-    
-    ID = {}
-    
-    def __init__(self):
+    # 通常のチェスの配置の番号
+    NORMAL_ID = 518
+
+    def __init__(self, pos_id=None, rng=None):
         # 駒の配置の決定
-        pos_id = randint(0, 959)
-        while pos_id == 518:
-            pos_id = randint(0, 959)
-        krn = [
-            [Knight, Knight, Rook, King, Rook],
-            [Knight, Rook, Knight, King, Rook],
-            [Knight, Rook, King, Knight, Rook],
-            [Knight, Rook, King, Rook, Knight],
-            [Rook, Knight, Knight, King, Rook],
-            [Rook, Knight, King, Knight, Rook],
-            [Rook, Knight, King, Rook, Knight],
-            [Rook, King, Knight, Knight, Rook],
-            [Rook, King, Knight, Rook, Knight],
-            [Rook, King, Rook, Knight, Knight]
-        ]
-
-        q, r = pos_id//4, pos_id%4
-        self.placers[1][2*r + 1] = Bishop
-
-        q, r = q//4, q%4
-        self.placers[1][2*r] = Bishop
-
-        q, r = q//6, q%6
-        for i in range(self.size):
-            if self.placers[1][i] is None:
-                if i == r:
-                    self.placers[1][i] = Queen
-                    break
-            else: r += 1
-        
-        for piece in krn[q]:
-            self.placers[1][self.placers[1].index(None)] = piece
-            
+        if pos_id is None:
+            n = (rng or random).randrange(959)
+            pos_id = n + 1 if n >= self.NORMAL_ID else n
+        elif not 0 <= pos_id < 960:
+            raise ValueError(f'Chess960 position ID must be 0-959: {pos_id}')
+        self.set_back_rank(CHESS960_SETUPS[pos_id])
+
+    def set_back_rank(self, back_rank):
+        '''
+        このインスタンスの1段目の配置と画像IDを設定する．クラスの属性は書き換えない．
+
+        Parameters
+        ----------
+        back_rank : sequence > [class, ...]
+            1段目の駒．
+        '''
+        self.pos_id = CHESS960_IDS.get(tuple(back_rank))
+        self.placers = {1: list(back_rank),
+            2: [Pawn] * self.size}
         # 画像IDの割り当て
-        for rk in self.placers:
-            for fl in range(self.size):
-                if self.placers[rk][fl] is not None:
-                    self.ID['W' + self.placers[rk][fl].abbr] = self.size * rk + fl
-                    self.ID['B' + self.placers[rk][fl].abbr] = -(self.size * rk + fl)
+        self.ID = image_ids(self.placers, self.size)
 
 
 class withUnicorn:
@@ -94,12 +165,7 @@ class withUnicorn:
     placers = {1: [Rook, Knight, Bishop, Queen, King, Bishop, Unicorn, Rook],
         2: [Pawn] * size}
     # 画像IDの割り当て
-    ID = {}
-    for rk in placers:
-        for fl in range(size):
-            if placers[rk][fl] is not None:
-                ID['W' + placers[rk][fl].abbr] = size * rk + fl
-                ID['B' + placers[rk][fl].abbr] = -(size * rk + fl)
+    ID = image_ids(placers, size)
 
 
 # ゲーム選択画面に表示するゲーム
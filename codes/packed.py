@@ -0,0 +1,157 @@
+'''局面を小さく詰めて保存するモジュール
+
+Position は dict にビットボードとハッシュを加えたものなので，1局面で数キロバイトになる．
+置換表・棋譜・プロセス間で受け渡す局面のように多くの局面を持つときは，
+1マス1バイトの駒の番号 (piece_ID) に詰めた PackedPosition で持ち，
+指すときだけ Position に戻す．駒は色と種類ごとに1つのオブジェクトを共有するので，
+戻すときにも駒を作らない．
+'''
+
+from bitboard import Position, SIZE
+from pieces import *
+
+# 駒の番号 (& 0xFF) から駒の種類と色へ
+_CODE_PIECES = {}
+for _i, _cls in enumerate(piece_names):
+    _CODE_PIECES[_i + 1] = (_cls, W)
+    _CODE_PIECES[-(_i + 1) & 0xFF] = (_cls, B)
+
+
+def piece_from_code(code):
+    '''
+    駒の番号から駒を返す
+
+    Parameters
+    ----------
+    code : int
+        Piece.code (piece_ID と同じ番号)．負の数は 0xFF との論理積でもよい．
+
+    Returns
+    -------
+    Piece or None
+        0 なら None．
+    '''
+    if code == 0:
+        return None
+    cls, color = _CODE_PIECES[code & 0xFF]
+    return cls(color)
+
+
+class PackedPosition:
+    '''
+    1マス1バイトに詰めた局面．作った後は変更しない．
+    同じ局面どうしは等しく，辞書のキーにも使える．
+
+    Parameters
+    ----------
+    size : int
+        盤面の大きさ．
+    cells : bytes
+        x + size*y 番目のバイトがそのマスの駒の番号 (& 0xFF)．空きマスは 0．
+    turn : str
+        手番．'W' または 'B'．
+    castling : int
+        キャスリングのポテンシャル．白の0, 1 番目，黒の0, 1 番目が下位から1ビットずつ．
+    en_passant : int
+        2歩進んだポーンの位置 x + size*y．ないときは -1．
+    '''
+
+    __slots__ = ('size', 'cells', 'turn', 'castling', 'en_passant')
+
+    def __init__(self, size, cells, turn, castling, en_passant):
+        self.size = size
+        self.cells = cells
+        self.turn = turn
+        self.castling = castling
+        self.en_passant = en_passant
+
+    @classmethod
+    def from_board(cls, board, turn=W, can_castling=None, advanced2_pos=None):
+        '''
+        盤面を詰める
+
+        Parameters
+        ----------
+        board : dict > {(int, int): Piece}
+            盤面．Position なら大きさも受け継ぐ．
+        turn : str, default 'W'
+            手番．
+        can_castling : dict > {str: [bool, bool]} or None, default None
+            Rules.can_castling．None のときはキャスリングできない．
+        advanced2_pos : tuple > (int, int) or None, default None
+            Rules.advanced2_pos．
+
+        Returns
+        -------
+        PackedPosition
+        '''
+        size = getattr(board, 'size', SIZE)
+        cells = bytearray(size * size)
+        for (x, y), piece in board.items():
+            cells[x + size*y] = piece.code & 0xFF
+        castling = 0
+        if can_castling is not None:
+            for i, flag in enumerate(can_castling[W] + can_castling[B]):
+                castling |= bool(flag) << i
+        en_passant = -1 if advanced2_pos is None else advanced2_pos[0] + size*advanced2_pos[1]
+        return cls(size, bytes(cells), turn, castling, en_passant)
+
+    @classmethod
+    def from_rules(cls, rules):
+        '''Rules の局面を詰める'''
+        return cls.from_board(rules.gameboard, rules.playersturn,
+                              rules.can_castling, rules.advanced2_pos)
+
+    def board(self):
+        '''
+        盤面を Position に戻す
+
+        Returns
+        -------
+        Position
+        '''
+        size = self.size
+        board = Position(size=size)
+        for square, code in enumerate(self.cells):
+            if code:
+                board[(square % size, square // size)] = piece_from_code(code)
+        return board
+
+    def can_castling(self):
+        '''キャスリングのポテンシャルを Rules.can_castling の形で返す'''
+        flags = [bool(self.castling >> i & 1) for i in range(4)]
+        return {W: flags[:2], B: flags[2:]}
+
+    def advanced2_pos(self):
+        '''2歩進んだポーンの位置を Rules.advanced2_pos の形で返す'''
+        if self.en_passant < 0:
+            return None
+        return (self.en_passant % self.size, self.en_passant // self.size)
+
+    def restore(self, rules):
+        '''
+        rules の盤面・手番・キャスリングのポテンシャル・アンパッサン用の位置を
+        この局面にする．ゲームの種類は変えない．
+        '''
+        rules.gameboard = self.board()
+        rules.playersturn = self.turn
+        rules.can_castling = self.can_castling()
+        rules.advanced2_pos = self.advanced2_pos()
+
+    def _key(self):
+        return (self.size, self.cells, self.turn, self.castling, self.en_passant)
+
+    def __eq__(self, other):
+        if not isinstance(other, PackedPosition):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __reduce__(self):
+        return PackedPosition, self._key()
+
+    def __repr__(self):
+        return (f'PackedPosition(size={self.size}, turn={self.turn!r}, '
+                f'castling={self.castling:#06b}, en_passant={self.en_passant})')
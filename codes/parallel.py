@@ -0,0 +1,203 @@
+'''探索を複数のプロセスで分担するモジュール
+
+最初の一手の候補をプロセスごとに振り分けて並列に読む．
+局面は Rules.snapshot の小さな形で受け渡す．
+
+    py parallel.py --workers 4 --depth 4
+'''
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from rules import Rules
+from search import Engine
+
+# ワーカープロセスの探索．置換表は同じプロセスの探索どうしで使い回す
+_engine = None
+
+
+def _init_worker(tt_size, tablebase=None):
+    global _engine
+    _engine = Engine(tt_size=tt_size, tablebase=tablebase)
+
+
+def _search_part(snapshot, root_moves, time_limit, node_limit, max_depth):
+    '''
+    ワーカープロセスで最初の一手の候補の一部を読む
+
+    Returns
+    -------
+    tuple > (int, int, list)
+        (プロセス ID, 局面数, 深さごとの (深さ, 評価値, 最善手))．
+    '''
+    rules = Rules.from_snapshot(snapshot)
+    _engine.time_limit = time_limit
+    _engine.node_limit = node_limit
+    _engine.max_depth = max_depth
+    _engine.search(rules, root_moves)
+    return os.getpid(), _engine.nodes, _engine.iterations
+
+
+def _ping():
+    return os.getpid()
+
+
+class ParallelEngine:
+    '''
+    最初の一手の候補をプロセスプールで分担して読む探索．
+    Engine と同じように search で指し手を返す．
+
+    Parameters
+    ----------
+    workers : int or None, default None
+        プロセス数．None のときは CPU の数．
+    time_limit : float or None, default 1.0
+        1手あたりの思考時間 (秒)．
+    node_limit : int or None, default None
+        プロセスごとの局面数の上限．
+    max_depth : int, default 64
+        反復深化の深さの上限．
+    tt_size : int, default 1 << 18
+        プロセスごとの置換表の項目数．
+    book : book.OpeningBook or None, default None
+        定跡．局面が定跡にあれば，ワーカープロセスに渡さずに定跡の手を指す．
+    tablebase : tablebase.Tablebase or None, default None
+        終盤の表．各プロセスの探索が同じ表のファイルを mmap で開いて引く．
+
+    Attributes
+    ----------
+    book_move : bool
+        直前の手が定跡の手なら True．
+    worker_nodes : list > [(int, int), ...]
+        直前の探索のプロセスごとの (プロセス ID, 局面数)．
+    nodes : int
+        直前の探索の局面数の合計．
+    depth : int
+        直前の探索で，1回でも読み終えたプロセスのすべてが読み終えた深さ．
+        どのプロセスも読み終えなかったときは 0．
+    score : int
+        直前の探索の最善手の評価値．探索しなかったときは 0．
+    '''
+
+    def __init__(self, workers=None, time_limit=1.0, node_limit=None,
+                 max_depth=64, tt_size=1 << 18, book=None, tablebase=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.book = book
+        self.book_move = False
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.max_depth = max_depth
+        self.executor = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                            initargs=(tt_size, tablebase))
+        self.worker_nodes = []
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        '''プロセスプールを終了する'''
+        self.executor.shutdown()
+
+    def warm_up(self):
+        '''すべてのプロセスを起動しておく'''
+        for future in [self.executor.submit(_ping) for _ in range(self.workers)]:
+            future.result()
+
+    def search(self, rules):
+        '''
+        手番の側の最善手を探す
+
+        Parameters
+        ----------
+        rules : Rules
+            局面．
+
+        Returns
+        -------
+        move : tuple or None
+            Rules.legal_moves と同じ形の指し手．指せる手がなければ None．
+        '''
+        self.worker_nodes, self.nodes, self.depth, self.score = [], 0, 0, 0
+        self.book_move = False
+        moves = rules.legal_moves(rules.playersturn, rules.gameboard)
+        if len(moves) <= 1:
+            return moves[0] if moves else None
+        if self.book is not None:
+            move = self.book.choose(rules, moves)
+            if move is not None:
+                self.book_move = True
+                return move
+
+        snapshot = rules.snapshot()
+        parts = [moves[i::self.workers] for i in range(min(self.workers, len(moves)))]
+        futures = [self.executor.submit(_search_part, snapshot, part, self.time_limit,
+                                        self.node_limit, self.max_depth)
+                   for part in parts]
+        results = [future.result() for future in futures]
+
+        self.worker_nodes = [(pid, nodes) for pid, nodes, _ in results]
+        self.nodes = sum(nodes for _, nodes, _ in results)
+        # 1回も読み終えなかったプロセスの手は比べずに，ほかのプロセスの結果で決める
+        finished = [iterations for _, _, iterations in results if iterations]
+        if not finished:
+            return moves[0]
+        # 読み終えたプロセスのすべてが読み終えた深さのうち最も深いもので比べる
+        self.depth = min(iterations[-1][0] for iterations in finished)
+        best_score, best_move = None, moves[0]
+        for iterations in finished:
+            depth, score, move = [it for it in iterations if it[0] <= self.depth][-1]
+            if best_score is None or score > best_score:
+                best_score, best_move = score, move
+        self.score = best_score
+        return best_move
+
+
+def benchmark(rules, depth, workers):
+    '''
+    同じ深さまで読む時間を，1プロセスのときと workers プロセスのときで比べる
+
+    Returns
+    -------
+    float
+        速さの比．
+    '''
+    elapsed = {}
+    for n in (1, workers):
+        with ParallelEngine(n, time_limit=None, max_depth=depth) as engine:
+            engine.warm_up()
+            start = perf_counter()
+            move = engine.search(rules)
+            elapsed[n] = perf_counter() - start
+            print(f'{n} worker(s): {elapsed[n]:.3f} s, {engine.nodes} nodes, '
+                  f'depth {engine.depth}, score {engine.score}, move {move[:2]}')
+            for pid, nodes in engine.worker_nodes:
+                print(f'    pid {pid}: {nodes} nodes')
+    speedup = elapsed[1] / elapsed[workers] if elapsed[workers] else 0.0
+    print(f'speedup: {speedup:.2f}x with {workers} workers')
+    return speedup
+
+
+def main(argv=None):
+    from perft import GAMES, new_game
+
+    parser = argparse.ArgumentParser(description='Compare parallel root search with one worker.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='number of worker processes (default: CPU count)')
+    parser.add_argument('--depth', type=int, default=3, help='search depth (default: 3)')
+    parser.add_argument('--game', choices=GAMES, default='Normal')
+    parser.add_argument('--fen', help='start from this FEN instead of the initial position')
+    args = parser.parse_args(argv)
+    benchmark(new_game(GAMES[args.game], args.fen), args.depth, args.workers)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,205 @@
+'''perft: 指定した深さまでの末端の局面数を数えるコマンド
+
+指し手生成が正しいかを既知の値と比べて確かめ，
+1秒あたりの局面数で速さを測る．
+
+    py perft.py 4
+    py perft.py 3 --game Chess960
+    py perft.py 3 --fen "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq -"
+    py perft.py --suite
+'''
+
+import argparse
+from time import perf_counter
+
+from rules import Rules
+from games import Normal, Chess960, withUnicorn
+from fen import set_fen
+
+# --game で指定できるゲーム
+GAMES = {'Normal': Normal, 'Chess960': Chess960, 'withUnicorn': withUnicorn}
+
+# 回帰テスト用の局面: (名前, ゲーム, FEN, 深さ, 局面数)
+SUITE = [
+    ('start', Normal, None, 4, 197281),
+    ('kiwipete', Normal,
+     'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1', 3, 97862),
+    ('position3', Normal, '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', 4, 43238),
+    ('position4', Normal,
+     'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1', 3, 9467),
+    ('position5', Normal, 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', 3, 62379),
+]
+
+
+def new_game(kind, fen=None):
+    '''
+    盤面を用意したゲームを作る
+
+    Parameters
+    ----------
+    kind : class
+        ゲームの種類．
+    fen : str or None, default None
+        開始局面．None のときはゲームの初期配置．
+
+    Returns
+    -------
+    game : Rules
+    '''
+    if fen is None:
+        return Rules(kind())
+    game = Rules()
+    game.kind = kind()
+    set_fen(game, fen)
+    return game
+
+
+def perft(game, depth):
+    '''
+    depth 手先の末端の局面数を数える
+
+    Parameters
+    ----------
+    game : Rules
+        ゲーム．手番は game.playersturn．
+    depth : int
+        深さ．
+
+    Returns
+    -------
+    int
+    '''
+    if depth == 0:
+        return 1
+    moves = game.legal_moves(game.playersturn, game.gameboard)
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for startpos, endpos, castling, promote in moves:
+        undo = game.make_move(startpos, endpos, game.gameboard, castling, promote)
+        nodes += perft(game, depth - 1)
+        game.unmake_move(undo, game.gameboard)
+    return nodes
+
+
+def divide(game, depth):
+    '''
+    最初の一手ごとに末端の局面数を数える
+
+    Parameters
+    ----------
+    game : Rules
+        ゲーム．
+    depth : int
+        深さ．1 以上．
+
+    Returns
+    -------
+    list > [(tuple, int), ...]
+        (指し手, 局面数) のリスト．
+    '''
+    result = []
+    for move in game.legal_moves(game.playersturn, game.gameboard):
+        undo = game.make_move(*move[:2], game.gameboard, *move[2:])
+        result.append((move, perft(game, depth - 1)))
+        game.unmake_move(undo, game.gameboard)
+    return result
+
+
+def square_name(pos):
+    '''(0, 0) -> 'a1\''''
+    return chr(pos[0] + 97) + str(pos[1] + 1)
+
+
+def move_name(move):
+    '''
+    指し手を 'e2e4' の形の文字列にする．
+    キャスリングは 'O-O' または 'O-O-O'，プロモーションは 'e7e8q' の形．
+    '''
+    startpos, endpos, castling, promote = move
+    if castling:
+        return 'O-O-O' if endpos[0] == 2 else 'O-O'
+    name = square_name(startpos) + square_name(endpos)
+    if promote is not None:
+        name += promote.abbr.lower()
+    return name
+
+
+def run_divide(game, depth):
+    '''divide の結果と合計，速さを表示する'''
+    start = perf_counter()
+    result = divide(game, depth)
+    elapsed = perf_counter() - start
+    for move, nodes in sorted(result, key=lambda item: move_name(item[0])):
+        print(f'{move_name(move)}: {nodes}')
+    total = sum(nodes for _, nodes in result)
+    print()
+    print(f'Moves: {len(result)}')
+    print(f'Nodes: {total}')
+    print(f'Time: {elapsed:.3f} s')
+    print(f'NPS: {total / elapsed if elapsed else 0:.0f}')
+    return total
+
+
+def run_suite(max_depth=None):
+    '''
+    SUITE の局面すべてについて局面数を確かめ，速さを表示する
+
+    Parameters
+    ----------
+    max_depth : int or None, default None
+        深さの上限．指定したときは既知の値との比較をしない．
+
+    Returns
+    -------
+    bool
+        すべて既知の値と一致したとき True．
+    '''
+    ok = True
+    total_nodes, total_time = 0, 0.0
+    for name, kind, fen, depth, expected in SUITE:
+        if max_depth is not None and depth > max_depth:
+            depth, expected = max_depth, None
+        game = new_game(kind, fen)
+        start = perf_counter()
+        nodes = perft(game, depth)
+        elapsed = perf_counter() - start
+        total_nodes += nodes
+        total_time += elapsed
+        if expected is None:
+            status = '--'
+        elif nodes == expected:
+            status = 'ok'
+        else:
+            status = f'NG (expected {expected})'
+            ok = False
+        print(f'{name:<10} depth {depth}  {nodes:>9}  {elapsed:8.3f} s  '
+              f'{nodes / elapsed if elapsed else 0:9.0f} nps  {status}')
+    print(f'{"total":<10}          {total_nodes:>9}  {total_time:8.3f} s  '
+          f'{total_nodes / total_time if total_time else 0:9.0f} nps')
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Count leaf nodes of the move tree.')
+    parser.add_argument('depth', type=int, nargs='?', default=3,
+                        help='search depth (default: 3)')
+    parser.add_argument('--game', choices=GAMES, default='Normal',
+                        help='game whose rules and starting position are used')
+    parser.add_argument('--fen', help='start from this FEN instead of the initial position')
+    parser.add_argument('--suite', action='store_true',
+                        help='run the regression suite against known node counts')
+    parser.add_argument('--max-depth', type=int,
+                        help='with --suite, cap the depth of every position')
+    args = parser.parse_args(argv)
+
+    if args.suite:
+        return 0 if run_suite(args.max_depth) else 1
+    if args.depth < 1:
+        parser.error('depth must be at least 1')
+    run_divide(new_game(GAMES[args.game], args.fen), args.depth)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
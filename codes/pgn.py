@@ -0,0 +1,444 @@
+'''PGN 形式の棋譜を読み書きするモジュール
+
+ファイルを1行ずつ読んで1局ずつ出力するので，
+大きなファイルも全体を読み込まずに一定のメモリで扱える．
+
+    for game in open_games('games.pgn'):
+        for rules, move in replay(game):
+            ...
+'''
+
+import re
+
+from fen import get_fen, set_fen, piece_letters, fen_letters, is_shuffled
+from games import Normal, Chess960, withUnicorn
+from rules import Rules
+from pieces import *
+
+# 対局結果
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+# 必ず書く7つのタグ
+SEVEN_TAGS = ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result')
+
+# Variant タグの値 (小文字) とゲームの種類
+variants = {'standard': Normal, 'normal': Normal, 'chess': Normal,
+            'chess960': Chess960, 'chess 960': Chess960,
+            'fischerandom': Chess960, 'fischer random': Chess960,
+            'withunicorn': withUnicorn}
+# ゲームの種類と書き出すときの Variant タグの値
+variant_names = {Chess960: 'Chess960', withUnicorn: 'withUnicorn'}
+
+_tag_re = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+_token_re = re.compile(r'[{}();]|[^\s{}();]+')
+_move_number_re = re.compile(r'^\d+\.+')
+# 駒を取る x は除いてから照合する
+_san_re = re.compile(r'^(?P<piece>Un|[NBRQKU])?(?P<file>[a-z])?(?P<rank>\d+)?'
+                     r'(?P<dest>[a-z]\d+)(?:=?(?P<promote>Un|[NBRQU]))?$')
+
+
+class PGNGame:
+    '''
+    PGN の1局
+
+    Parameters
+    ----------
+    headers : dict or None, default None
+        タグ．
+    moves : list > [str, ...] or None, default None
+        SAN の指し手．
+    result : str, default '*'
+        対局結果．
+
+    Attributes
+    ----------
+    headers : dict > {str: str, ...}
+    moves : list > [str, ...]
+    result : str
+    '''
+
+    def __init__(self, headers=None, moves=None, result='*'):
+        self.headers = dict(headers or {})
+        self.moves = list(moves or [])
+        self.result = result
+
+    def __repr__(self):
+        return f'PGNGame({self.headers!r}, {len(self.moves)} moves, {self.result!r})'
+
+
+def read_games(lines):
+    '''
+    PGN の行を読み，1局ずつ出力する
+
+    Parameters
+    ----------
+    lines : iterable > str
+        PGN の行．ファイルオブジェクトなど．
+
+    Yields
+    ------
+    PGNGame
+    '''
+    game = PGNGame()
+    has_moves = False
+    in_comment = False
+    variation = 0
+    for line in lines:
+        line = line.lstrip('\ufeff').rstrip('\r\n')
+        stripped = line.strip()
+        if not in_comment and variation == 0:
+            if stripped.startswith('%'):
+                continue
+            if stripped.startswith('['):
+                match = _tag_re.match(stripped)
+                if match:
+                    # 結果のないまま次の対局のタグが来た
+                    if has_moves:
+                        yield game
+                        game, has_moves = PGNGame(), False
+                    game.headers[match.group(1)] = re.sub(r'\\(.)', r'\1', match.group(2))
+                    continue
+        for token in _token_re.findall(line):
+            if in_comment:
+                if token == '}' or token.endswith('}'):
+                    in_comment = False
+                continue
+            if token == '{':
+                in_comment = True
+            elif token == ';':
+                break
+            elif token == '(':
+                variation += 1
+            elif token == ')':
+                variation = max(variation - 1, 0)
+            elif variation:
+                continue
+            elif token in RESULTS:
+                game.result = token
+                yield game
+                game, has_moves = PGNGame(), False
+            elif token.startswith('$'):
+                continue
+            else:
+                token = _move_number_re.sub('', token)
+                if token:
+                    game.moves.append(token)
+                    has_moves = True
+    if has_moves or game.headers:
+        if 'Result' in game.headers and game.headers['Result'] in RESULTS:
+            game.result = game.headers['Result']
+        yield game
+
+
+def open_games(path, encoding='utf-8'):
+    '''
+    PGN ファイルを開き，1局ずつ出力する
+
+    Parameters
+    ----------
+    path : str
+        ファイルのパス．
+    encoding : str, default 'utf-8'
+        文字コード．
+
+    Yields
+    ------
+    PGNGame
+    '''
+    with open(path, encoding=encoding, errors='replace') as f:
+        yield from read_games(f)
+
+
+def new_rules(headers):
+    '''
+    タグに合わせてゲームの種類と開始局面を設定した Rules を作る
+
+    Parameters
+    ----------
+    headers : dict
+        タグ．Variant と FEN を使う．
+
+    Returns
+    -------
+    rules : Rules
+    fullmove : int
+        開始局面の手数．
+    '''
+    variant = headers.get('Variant', 'Standard').lower()
+    if variant not in variants:
+        raise ValueError(f'unknown variant: {headers["Variant"]}')
+    kind_cls = variants[variant]
+    fen = headers.get('FEN')
+    if fen is None:
+        if kind_cls is Chess960:
+            raise ValueError('a Chess960 game needs a FEN tag')
+        return Rules(kind_cls()), 1
+    rules = Rules()
+    # 配置は FEN で決まるので，チェス960 の乱数による配置は行わない
+    rules.kind = kind_cls.__new__(kind_cls)
+    set_fen(rules, fen)
+    fields = fen.split()
+    return rules, int(fields[5]) if len(fields) > 5 else 1
+
+
+def _letter(piece_cls):
+    return piece_letters[piece_cls.abbr]
+
+
+def _abbr(letter):
+    '''SAN の駒の文字を駒の略号にする．ユニコーンは Un とも書ける．'''
+    if letter is None or letter == 'Un':
+        return letter
+    return fen_letters[letter].abbr
+
+
+def san(rules, move, moves=None):
+    '''
+    指し手を SAN にする．チェックには +，チェックメイトには # をつける．
+
+    Parameters
+    ----------
+    rules : Rules
+        指す前の局面．
+    move : tuple
+        Rules.legal_moves の形の指し手．
+    moves : list or None, default None
+        局面の合法手．None のときは計算する．
+
+    Returns
+    -------
+    str
+    '''
+    board = rules.gameboard
+    startpos, endpos, castling, promote = move
+    piece = board[startpos]
+    if castling:
+        text = 'O-O-O' if endpos[0] == 2 else 'O-O'
+    else:
+        capture = endpos in board or (piece.abbr == 'P' and startpos[0] != endpos[0])
+        dest = chr(ord('a') + endpos[0]) + str(endpos[1] + 1)
+        if piece.abbr == 'P':
+            text = (chr(ord('a') + startpos[0]) + 'x' if capture else '') + dest
+            if promote is not None:
+                text += '=' + _letter(promote)
+        else:
+            if moves is None:
+                moves = rules.legal_moves(rules.playersturn, board)
+            # 同じ種類の駒が同じマスへ行けるときは，筋・段・その両方で区別する
+            others = [m[0] for m in moves
+                      if m[1] == endpos and m[0] != startpos and not m[2]
+                      and board[m[0]].abbr == piece.abbr]
+            prefix = ''
+            if others:
+                if all(pos[0] != startpos[0] for pos in others):
+                    prefix = chr(ord('a') + startpos[0])
+                elif all(pos[1] != startpos[1] for pos in others):
+                    prefix = str(startpos[1] + 1)
+                else:
+                    prefix = chr(ord('a') + startpos[0]) + str(startpos[1] + 1)
+            text = piece_letters[piece.abbr] + prefix + ('x' if capture else '') + dest
+
+    undo = rules.make_move(startpos, endpos, board, castling, promote)
+    try:
+        color = rules.playersturn
+        if rules.is_check(color, board):
+            text += '#' if not rules.has_legal_move(color, board) else '+'
+    finally:
+        rules.unmake_move(undo, board)
+    return text
+
+
+def parse_san(rules, text, moves=None):
+    '''
+    SAN を手番の側の合法手にする
+
+    Parameters
+    ----------
+    rules : Rules
+        指す前の局面．
+    text : str
+        SAN．
+    moves : list or None, default None
+        局面の合法手．None のときは計算する．
+
+    Returns
+    -------
+    move : tuple
+        Rules.legal_moves の形の指し手．
+
+    Raises
+    ------
+    ValueError
+        合法手でないか，どの手か決まらない．
+    '''
+    if moves is None:
+        moves = rules.legal_moves(rules.playersturn, rules.gameboard)
+    board = rules.gameboard
+    core = text.rstrip('+#!?')
+    if core.startswith('0'):
+        core = core.replace('0', 'O')
+    if core in ('O-O', 'O-O-O'):
+        x = 2 if core == 'O-O-O' else 6
+        found = [m for m in moves if m[2] and m[1][0] == x]
+    else:
+        match = _san_re.match(core.replace('x', ''))
+        if match is None:
+            raise ValueError(f'cannot read SAN: {text}')
+        abbr = _abbr(match['piece']) or 'P'
+        promote = _abbr(match['promote'])
+        endpos = (ord(match['dest'][0]) - ord('a'), int(match['dest'][1:]) - 1)
+        found = [m for m in moves
+                 if m[1] == endpos and not m[2]
+                 and board[m[0]].abbr == abbr
+                 and (match['file'] is None or m[0][0] == ord(match['file']) - ord('a'))
+                 and (match['rank'] is None or m[0][1] == int(match['rank']) - 1)
+                 and (m[3].abbr if m[3] is not None else None) == promote]
+    if len(found) != 1:
+        raise ValueError(f'{"ambiguous" if found else "illegal"} move: {text}')
+    return found[0]
+
+
+def replay(game):
+    '''
+    棋譜の指し手を make_move で順に指し，指した後の局面と指し手を出力する
+
+    Parameters
+    ----------
+    game : PGNGame
+        棋譜．
+
+    Yields
+    ------
+    (Rules, tuple)
+        指した後の局面と指し手．局面は同じオブジェクトを動かしていく．
+
+    Raises
+    ------
+    ValueError
+        合法手でない手があった．
+    '''
+    rules, _ = new_rules(game.headers)
+    for text in game.moves:
+        move = parse_san(rules, text)
+        rules.make_move(move[0], move[1], rules.gameboard, move[2], move[3])
+        yield rules, move
+
+
+def export_game(rules, moves, headers=None, result='*', fullmove=1):
+    '''
+    局面とそこからの指し手を PGN の1局にする．局面は元に戻す．
+
+    Parameters
+    ----------
+    rules : Rules
+        開始局面．
+    moves : iterable > tuple
+        Rules.legal_moves の形の指し手．
+    headers : dict or None, default None
+        タグ．
+    result : str, default '*'
+        対局結果．
+    fullmove : int, default 1
+        開始局面の手数．
+
+    Returns
+    -------
+    PGNGame
+    '''
+    headers = dict(headers or {})
+    kind_cls = type(rules.kind)
+    if kind_cls in variant_names:
+        headers.setdefault('Variant', variant_names[kind_cls])
+    fen = get_fen(rules, fullmove=fullmove)
+    # ゲームの初期配置から始まるときは FEN タグを書かない
+    if is_shuffled(rules.kind) or fen != get_fen(Rules(kind_cls())):
+        headers.setdefault('SetUp', '1')
+        headers.setdefault('FEN', fen)
+    headers['Result'] = result
+
+    sans, undos = [], []
+    try:
+        for move in moves:
+            sans.append(san(rules, move))
+            undos.append(rules.make_move(move[0], move[1], rules.gameboard, move[2], move[3]))
+    finally:
+        for undo in reversed(undos):
+            rules.unmake_move(undo, rules.gameboard)
+    return PGNGame(headers, sans, result)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def format_game(game, width=79):
+    '''
+    PGN の1局を文字列にする
+
+    Parameters
+    ----------
+    game : PGNGame
+        棋譜．
+    width : int, default 79
+        指し手の部分の1行の最大の文字数．
+
+    Returns
+    -------
+    str
+        最後は空行で終わる．
+    '''
+    headers = dict(game.headers)
+    headers['Result'] = game.result
+    lines = [f'[{tag} "{_escape(headers.pop(tag, "?"))}"]' for tag in SEVEN_TAGS]
+    lines += [f'[{tag} "{_escape(value)}"]' for tag, value in headers.items()]
+    lines.append('')
+
+    fen = game.headers.get('FEN')
+    fields = fen.split() if fen else []
+    number = int(fields[5]) if len(fields) > 5 else 1
+    black_first = len(fields) > 1 and fields[1] == 'b'
+    tokens = []
+    for i, text in enumerate(game.moves):
+        white_to_move = (i % 2 == 0) != black_first
+        if white_to_move:
+            tokens.append(f'{number}.')
+        elif i == 0:
+            tokens.append(f'{number}...')
+        tokens.append(text)
+        if not white_to_move:
+            number += 1
+    tokens.append(game.result)
+
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > width:
+            lines.append(line)
+            line = token
+        else:
+            line = f'{line} {token}' if line else token
+    lines.append(line)
+    return '\n'.join(lines) + '\n\n'
+
+
+def write_games(stream, games, width=79):
+    '''
+    PGN の対局を1局ずつ書き出す
+
+    Parameters
+    ----------
+    stream : file-like
+        書き出し先．
+    games : iterable > PGNGame
+        棋譜．ジェネレータでもよい．
+    width : int, default 79
+        指し手の部分の1行の最大の文字数．
+
+    Returns
+    -------
+    int
+        書き出した対局の数．
+    '''
+    count = 0
+    for game in games:
+        stream.write(format_game(game, width))
+        count += 1
+    return count
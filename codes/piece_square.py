@@ -0,0 +1,117 @@
+'''駒の価値と駒の位置の表 (piece-square table) のモジュール
+
+駒の位置の表は8×8の盤面用に作ってあり，ほかの大きさの盤面では
+マスの位置を8×8に縮めて引く．
+bitboard.Position は駒の出し入れのたびに，白から見た価値と位置の表の和を更新するので，
+search の評価関数は盤面を走査せずに値を得られる．
+'''
+
+from functools import lru_cache
+
+# 駒の価値
+piece_values = {'P': 100, 'N': 320, 'B': 330, 'R': 500, 'Q': 900, 'K': 0, 'Un': 400}
+
+# 駒の位置の表．白から見た向きで，1行目が8段目
+tables = {
+    'P': [
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [50, 50, 50, 50, 50, 50, 50, 50],
+        [10, 10, 20, 30, 30, 20, 10, 10],
+        [5, 5, 10, 25, 25, 10, 5, 5],
+        [0, 0, 0, 20, 20, 0, 0, 0],
+        [5, -5, -10, 0, 0, -10, -5, 5],
+        [5, 10, 10, -20, -20, 10, 10, 5],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+    ],
+    'N': [
+        [-50, -40, -30, -30, -30, -30, -40, -50],
+        [-40, -20, 0, 0, 0, 0, -20, -40],
+        [-30, 0, 10, 15, 15, 10, 0, -30],
+        [-30, 5, 15, 20, 20, 15, 5, -30],
+        [-30, 0, 15, 20, 20, 15, 0, -30],
+        [-30, 5, 10, 15, 15, 10, 5, -30],
+        [-40, -20, 0, 5, 5, 0, -20, -40],
+        [-50, -40, -30, -30, -30, -30, -40, -50],
+    ],
+    'B': [
+        [-20, -10, -10, -10, -10, -10, -10, -20],
+        [-10, 0, 0, 0, 0, 0, 0, -10],
+        [-10, 0, 5, 10, 10, 5, 0, -10],
+        [-10, 5, 5, 10, 10, 5, 5, -10],
+        [-10, 0, 10, 10, 10, 10, 0, -10],
+        [-10, 10, 10, 10, 10, 10, 10, -10],
+        [-10, 5, 0, 0, 0, 0, 5, -10],
+        [-20, -10, -10, -10, -10, -10, -10, -20],
+    ],
+    'R': [
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [5, 10, 10, 10, 10, 10, 10, 5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [0, 0, 0, 5, 5, 0, 0, 0],
+    ],
+    'Q': [
+        [-20, -10, -10, -5, -5, -10, -10, -20],
+        [-10, 0, 0, 0, 0, 0, 0, -10],
+        [-10, 0, 5, 5, 5, 5, 0, -10],
+        [-5, 0, 5, 5, 5, 5, 0, -5],
+        [0, 0, 5, 5, 5, 5, 0, -5],
+        [-10, 5, 5, 5, 5, 5, 0, -10],
+        [-10, 0, 5, 0, 0, 0, 0, -10],
+        [-20, -10, -10, -5, -5, -10, -10, -20],
+    ],
+    'K': [
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-20, -30, -30, -40, -40, -30, -30, -20],
+        [-10, -20, -20, -20, -20, -20, -20, -10],
+        [20, 20, 0, 0, 0, 0, 20, 20],
+        [20, 30, 10, 0, 0, 10, 30, 20],
+    ],
+    # ユニコーンはナイトの跳び方を同じ向きに繰り返すナイトライダー．
+    # 空いた盤で動けるマスの数 (隅で 6，中央で 12) から 10 を引いて 5 倍した値
+    'Un': [
+        [-20, -15, -10, -5, -5, -10, -15, -20],
+        [-15, -10, 0, 5, 5, 0, -10, -15],
+        [-10, 0, 10, 10, 10, 10, 0, -10],
+        [-5, 5, 10, 10, 10, 10, 5, -5],
+        [-5, 5, 10, 10, 10, 10, 5, -5],
+        [-10, 0, 10, 10, 10, 10, 0, -10],
+        [-15, -10, 0, 5, 5, 0, -10, -15],
+        [-20, -15, -10, -5, -5, -10, -15, -20],
+    ],
+}
+
+
+@lru_cache(maxsize=None)
+def square_values(size):
+    '''
+    盤面の大きさごとに，駒の名前とマスごとの価値と位置の表の和を作る
+
+    Parameters
+    ----------
+    size : int
+        盤面の大きさ．
+
+    Returns
+    -------
+    dict > {str: tuple > (int, ...)}
+        駒の名前 ('WN' など) ごとの，x + size*y 番目のマスの値．白から見た符号．
+    '''
+    values = {}
+    for abbr, table in tables.items():
+        white, black = [], []
+        for y in range(size):
+            for x in range(size):
+                tx = x * 8 // size
+                # 1行目が8段目．黒は上下に反転した位置を引く
+                white.append(piece_values[abbr] + table[7 - y * 8 // size][tx])
+                black.append(-(piece_values[abbr] + table[7 - (size - 1 - y) * 8 // size][tx]))
+        values['W' + abbr] = tuple(white)
+        values['B' + abbr] = tuple(black)
+    return values
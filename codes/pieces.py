@@ -1,11 +1,42 @@
+from bitboard import Position, SIZE
+
 W = "W"
 B = "B"
 
 
 class Piece:
-    def __init__(self, color):
-        self.color = color
-        self.name = color + self.abbr
+    """a piece. pieces are flyweights: Rook('W') always returns the same
+    immutable object, so boards only hold references to 14 shared objects"""
+    __slots__ = ('color', 'name', 'code')
+
+    # (class, color) -> the shared instance
+    _instances = {}
+
+    def __new__(cls, color):
+        piece = Piece._instances.get((cls, color))
+        if piece is None:
+            piece = object.__new__(cls)
+            object.__setattr__(piece, 'color', color)
+            object.__setattr__(piece, 'name', color + cls.abbr)
+            # small integer code, the same as the image ID in piece_ID
+            code = piece_names.index(cls) + 1
+            object.__setattr__(piece, 'code', code if color == W else -code)
+            piece._setup()
+            Piece._instances[(cls, color)] = piece
+        return piece
+
+    def _setup(self):
+        "sets the extra attributes of a new flyweight"
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} objects are immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} objects are immutable')
+
+    def __reduce__(self):
+        # unpickling and copying return the shared instance
+        return type(self), (self.color,)
 
     def __repr__(self):
         return self.name
@@ -13,14 +44,14 @@ class Piece:
     def __str__(self):
         return self.name
 
-    def rider(self, x, y, gameboard, color, intervals):
+    def rider(self, x, y, gameboard, color, intervals, size=SIZE):
         """repeats the given interval until another piece is run into. 
         if that piece is not of the same color, that square is added and
          then the list is returned"""
         answers = []
         for xint, yint in intervals:
             xtemp, ytemp = x+xint, y+yint
-            while self.is_in_bounds(xtemp, ytemp):
+            while self.is_in_bounds(xtemp, ytemp, size):
 
                 target = gameboard.get((xtemp, ytemp), None)
                 if target is None:
@@ -34,15 +65,15 @@ class Piece:
                 xtemp, ytemp = xtemp + xint, ytemp + yint
         return answers
 
-    def is_in_bounds(self, x, y):
-        "checks if a position is on the board"
-        if x >= 0 and x < 8 and y >= 0 and y < 8:
+    def is_in_bounds(self, x, y, size=SIZE):
+        "checks if a position is on a size x size board"
+        if x >= 0 and x < size and y >= 0 and y < size:
             return True
         return False
 
-    def no_conflict(self, gameboard, initialColor, x, y):
+    def no_conflict(self, gameboard, initialColor, x, y, size=SIZE):
         "checks if a single position poses no conflict to the rules of chess"
-        if self.is_in_bounds(x, y) and (((x, y) not in gameboard) or gameboard[(x, y)].color != initialColor):
+        if self.is_in_bounds(x, y, size) and (((x, y) not in gameboard) or gameboard[(x, y)].color != initialColor):
             return True
         return False
 
@@ -61,62 +92,85 @@ def king_list(x, y):
 
 
 class Knight(Piece):
+    __slots__ = ()
     abbr = 'N'
 
-    def available_moves(self, x, y, gameboard):
-        return [(xx, yy) for xx, yy in leaper(x, y, 2, 1) if self.no_conflict(gameboard, self.color, xx, yy)]
+    def available_moves(self, x, y, gameboard, size=SIZE):
+        if isinstance(gameboard, Position):
+            return gameboard.moves(self, x, y)
+        return [(xx, yy) for xx, yy in leaper(x, y, 2, 1) if self.no_conflict(gameboard, self.color, xx, yy, size)]
 
 
 class Unicorn(Piece):
+    __slots__ = ()
     abbr = 'Un'
 
-    def available_moves(self, x, y, gameboard):
-        return self.rider(x, y, gameboard, self.color, leaper(0, 0, 1, 2))
+    def available_moves(self, x, y, gameboard, size=SIZE):
+        if isinstance(gameboard, Position):
+            return gameboard.moves(self, x, y)
+        return self.rider(x, y, gameboard, self.color, leaper(0, 0, 1, 2), size)
 
 
 class Rook(Piece):
+    __slots__ = ()
     abbr = 'R'
 
-    def available_moves(self, x, y, gameboard):
-        return self.rider(x, y, gameboard, self.color, chess_cardinals)
+    def available_moves(self, x, y, gameboard, size=SIZE):
+        if isinstance(gameboard, Position):
+            return gameboard.moves(self, x, y)
+        return self.rider(x, y, gameboard, self.color, chess_cardinals, size)
 
 
 class Bishop(Piece):
+    __slots__ = ()
     abbr = 'B'
 
-    def available_moves(self, x, y, gameboard):
-        return self.rider(x, y, gameboard, self.color, chess_diagonals)
+    def available_moves(self, x, y, gameboard, size=SIZE):
+        if isinstance(gameboard, Position):
+            return gameboard.moves(self, x, y)
+        return self.rider(x, y, gameboard, self.color, chess_diagonals, size)
 
 
 class Queen(Piece):
+    __slots__ = ()
     abbr = 'Q'
 
-    def available_moves(self, x, y, gameboard):
-        return self.rider(x, y, gameboard, self.color, chess_cardinals+chess_diagonals)
+    def available_moves(self, x, y, gameboard, size=SIZE):
+        if isinstance(gameboard, Position):
+            return gameboard.moves(self, x, y)
+        return self.rider(x, y, gameboard, self.color, chess_cardinals+chess_diagonals, size)
 
 
 class King(Piece):
+    __slots__ = ()
     abbr = 'K'
 
-    def available_moves(self, x, y, gameboard):
-        return [(xx, yy) for xx, yy in king_list(x, y) if self.no_conflict(gameboard, self.color, xx, yy)]
+    def available_moves(self, x, y, gameboard, size=SIZE):
+        if isinstance(gameboard, Position):
+            return gameboard.moves(self, x, y)
+        return [(xx, yy) for xx, yy in king_list(x, y) if self.no_conflict(gameboard, self.color, xx, yy, size)]
 
 
 class Pawn(Piece):
+    __slots__ = ('direction',)
     abbr = 'P'
 
-    def available_moves(self, x, y, gameboard):
-        self.direction = 1 if self.color == 'W' else -1
+    def _setup(self):
+        object.__setattr__(self, 'direction', 1 if self.color == 'W' else -1)
+
+    def available_moves(self, x, y, gameboard, size=SIZE):
+        if isinstance(gameboard, Position):
+            return gameboard.moves(self, x, y)
         answers = []
-        if (x+1, y+self.direction) in gameboard and self.no_conflict(gameboard, self.color, x+1, y+self.direction):
+        if (x+1, y+self.direction) in gameboard and self.no_conflict(gameboard, self.color, x+1, y+self.direction, size):
             answers.append((x+1, y+self.direction))
-        if (x-1, y+self.direction) in gameboard and self.no_conflict(gameboard, self.color, x-1, y+self.direction):
+        if (x-1, y+self.direction) in gameboard and self.no_conflict(gameboard, self.color, x-1, y+self.direction, size):
             answers.append((x-1, y+self.direction))
         if (x, y+self.direction) not in gameboard:
             # the condition after the and is to make sure the non-capturing movement (the only fucking one in the game) is not used in the calculation of checkmate
             answers.append((x, y+self.direction))
         if (((self.color == W and y == 1)
-             or (self.color == B and y == 6))
+             or (self.color == B and y == size - 2))
                 and (x, y + 1*self.direction) not in gameboard
                 and (x, y + 2*self.direction) not in gameboard):
             answers.append((x, y + 2*self.direction))
@@ -0,0 +1,210 @@
+'''処理時間を測るモジュール
+
+環境変数 CHESS_PROFILE または main.py の --profile で有効にする．
+有効でないときは関数を置き換えないので，何の負荷もかからない．
+
+    CHESS_PROFILE=1 py main.py                 # 一定時間ごとに標準エラー出力に表示
+    CHESS_PROFILE=profile.json py main.py      # 終了時に JSON で保存
+    py main.py --profile profile.prof          # cProfile でも測り，pstats の形で保存
+
+保存した .prof は python -m pstats profile.prof で読める．
+'''
+
+import atexit
+import cProfile
+import json
+import os
+import sys
+from bisect import bisect_left
+from functools import wraps
+from time import perf_counter
+
+from rules import Rules
+
+ENV_VAR = 'CHESS_PROFILE'
+
+# 測る Rules の関数
+RULES_METHODS = ('valid_moves', 'is_check', 'game_status',
+                 'castling_requirements', 'make_move')
+
+
+class Stats:
+    '''
+    1つの関数の呼び出し回数と処理時間のヒストグラム
+
+    Attributes
+    ----------
+    calls : int
+        呼び出し回数．
+    total : float
+        処理時間の合計 (秒)．内側で呼んだ関数の時間も含む．
+    max : float
+        最も長かった処理時間 (秒)．
+    histogram : list > [int, ...]
+        BOUNDS で区切った処理時間ごとの回数．最後は BOUNDS[-1] 以上．
+    '''
+
+    # ヒストグラムの区切り (秒)
+    BOUNDS = (1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0)
+    LABELS = ('<1us', '<10us', '<100us', '<1ms', '<10ms', '<100ms', '<1s', '>=1s')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * (len(self.BOUNDS) + 1)
+
+    def add(self, elapsed):
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.histogram[bisect_left(self.BOUNDS, elapsed)] += 1
+
+    def as_dict(self):
+        return {'calls': self.calls, 'total': self.total,
+                'mean': self.total / self.calls if self.calls else 0.0,
+                'max': self.max,
+                'histogram': dict(zip(self.LABELS, self.histogram))}
+
+
+class Profiler:
+    '''
+    関数を置き換えて呼び出し回数と処理時間を記録する
+
+    Parameters
+    ----------
+    output : str or None, default None
+        終了時に保存するファイル．.json なら JSON，
+        .prof または .pstats なら cProfile の結果を pstats の形で保存する．
+        None のときは保存せず，表示だけする．
+    interval : float, default 10.0
+        まとめを表示する間隔 (秒)．0 以下のときは終了時だけ表示する．
+    stream : file-like, default sys.stderr
+        まとめの表示先．
+
+    Attributes
+    ----------
+    stats : dict > {str: Stats, ...}
+        関数の名前ごとの記録．
+    '''
+
+    def __init__(self, output=None, interval=10.0, stream=None):
+        self.output = output
+        self.interval = interval
+        self.stream = stream if stream is not None else sys.stderr
+        self.stats = {}
+        self.started = self.last_report = perf_counter()
+        self.cprofile = None
+        if output is not None and output.endswith(('.prof', '.pstats')):
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def wrap(self, name, func):
+        '''func を，処理時間を記録する関数に置き換えたものを返す'''
+        stats = self.stats.setdefault(name, Stats())
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                end = perf_counter()
+                stats.add(end - start)
+                if 0 < self.interval <= end - self.last_report:
+                    self.last_report = end
+                    self.report()
+
+        return wrapper
+
+    def instrument(self, cls, names):
+        '''
+        クラスのメソッドを置き換える
+
+        Parameters
+        ----------
+        cls : class
+            クラス．
+        names : iterable > str
+            メソッドの名前．
+        '''
+        for name in names:
+            setattr(cls, name, self.wrap(f'{cls.__name__}.{name}', getattr(cls, name)))
+
+    def summary(self):
+        '''記録のまとめを文字列にする'''
+        lines = [f'--- profile ({perf_counter() - self.started:.1f} s) ---',
+                 f'{"function":<32}{"calls":>10}{"total s":>10}{"mean us":>10}{"max ms":>10}  histogram']
+        for name, stats in sorted(self.stats.items(), key=lambda item: -item[1].total):
+            mean = stats.total / stats.calls * 1e6 if stats.calls else 0.0
+            histogram = ' '.join(f'{label}:{count}' for label, count
+                                 in zip(Stats.LABELS, stats.histogram) if count)
+            lines.append(f'{name:<32}{stats.calls:>10}{stats.total:>10.3f}'
+                         f'{mean:>10.1f}{stats.max * 1e3:>10.2f}  {histogram}')
+        return '\n'.join(lines)
+
+    def report(self):
+        '''まとめを表示する'''
+        print(self.summary(), file=self.stream, flush=True)
+
+    def as_dict(self):
+        return {'elapsed': perf_counter() - self.started,
+                'functions': {name: stats.as_dict() for name, stats in self.stats.items()}}
+
+    def dump(self, path=None):
+        '''
+        記録をファイルに保存する
+
+        Parameters
+        ----------
+        path : str or None, default None
+            保存先．None のときは output．
+        '''
+        path = path or self.output
+        if path is None:
+            return
+        if path.endswith(('.prof', '.pstats')):
+            if self.cprofile is not None:
+                self.cprofile.disable()
+                self.cprofile.dump_stats(path)
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.as_dict(), f, indent=2)
+
+    def close(self):
+        '''まとめを表示し，保存する'''
+        self.report()
+        self.dump()
+
+
+def setup(option=None, targets=None, interval=10.0):
+    '''
+    設定が有効なら Profiler を作り，Rules のルールの関数と targets の関数を測るようにする．
+    終了時にまとめを表示し，保存する．
+
+    Parameters
+    ----------
+    option : str or None, default None
+        --profile の値．None のときは環境変数 CHESS_PROFILE を使う．
+        '1' なら表示だけ，それ以外はファイルのパスとして扱う．
+    targets : dict > {class: [str, ...]} or None, default None
+        ほかに測るクラスとメソッドの名前．
+    interval : float, default 10.0
+        まとめを表示する間隔 (秒)．
+
+    Returns
+    -------
+    Profiler or None
+        有効でないときは None．
+    '''
+    if option is None:
+        option = os.environ.get(ENV_VAR)
+    if not option or option == '0':
+        return None
+    profiler = Profiler(None if option == '1' else option, interval)
+    profiler.instrument(Rules, RULES_METHODS)
+    for cls, names in (targets or {}).items():
+        profiler.instrument(cls, names)
+    atexit.register(profiler.close)
+    return profiler
@@ -0,0 +1,182 @@
+'''PGN の対局をまとめて指し直し，合法かどうかを確かめるコマンド
+
+対局を数局ずつに分けてワーカープロセスで指し直し，
+1局ごとの結果を JSON Lines で入力の順に出力する．
+最後に1秒あたりの対局数を標準エラー出力に表示する．
+
+    py replay.py games.pgn --workers 4 > results.jsonl
+'''
+
+import argparse
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from time import perf_counter
+
+from fen import get_fen
+from pgn import read_games, open_games, new_rules, parse_san
+from pieces import *
+from tablebase import Tablebase
+
+# これ以上指せない終わり方
+MATED = ('checkmate', 'stalemate')
+# 棋譜の結果と合わなければ誤りとする終わり方
+FORCED = MATED + ('insufficient material',)
+
+
+def check_game(game, tablebase=None):
+    '''
+    1局を指し直す．
+    指し手は Rules.legal_moves から選ぶので，valid_moves と同じく
+    チェック・キャスリングのポテンシャル・アンパッサンの条件を確かめる．
+
+    Parameters
+    ----------
+    game : PGNGame
+        棋譜．
+    tablebase : tablebase.Tablebase or None, default None
+        終盤の表．与えたときは最後の局面を引く．
+
+    Returns
+    -------
+    dict
+        legal -- すべての手が合法か．
+        error -- 合法でないときの理由．
+        ply -- 指せた手数．
+        fen -- 最後の局面．
+        result -- 棋譜の対局結果．
+        status -- 最後の局面の Rules.game_status が終わりを示していればその状態
+            ('checkmate', 'stalemate', 'insufficient material', 'fifty-move rule',
+            'threefold repetition')，そうでなければ None．
+        tablebase -- 最後の局面を終盤の表で引いた {'result': 1, 0 または -1, 'dtm': 手数}．
+            表にない局面や tablebase を与えないときは None．
+    '''
+    record = {'event': game.headers.get('Event'), 'legal': True, 'error': None,
+              'ply': 0, 'fen': None, 'result': game.result, 'status': None,
+              'tablebase': None}
+    try:
+        rules, fullmove = new_rules(game.headers)
+    except ValueError as e:
+        record.update(legal=False, error=str(e))
+        return record
+
+    # 50手ルールの手数と同じ局面の出現回数は Rules.push が記録する
+    status = rules.game_status()
+    for text in game.moves:
+        if status.status in MATED:
+            record.update(legal=False, error=f'move after the game ended: {text}')
+            break
+        try:
+            move = parse_san(rules, text)
+        except ValueError as e:
+            record.update(legal=False, error=str(e))
+            break
+        if rules.playersturn == B:
+            fullmove += 1
+        status = rules.push(*move)
+        record['ply'] += 1
+
+    if record['legal'] and status.over:
+        record['status'] = status.status
+        # 50手ルールと繰り返しの引き分けは請求するものなので，対局が続いていてもよい
+        if status.status in FORCED and game.result not in (status.result, '*'):
+            record.update(legal=False,
+                          error=f'{status.status} but the result is {game.result}')
+    record['fen'] = get_fen(rules, fullmove=fullmove)
+    if tablebase is not None:
+        found = tablebase.probe(rules)
+        record['tablebase'] = None if found is None else dict(zip(('result', 'dtm'), found))
+    return record
+
+
+def check_batch(batch, tablebase=None):
+    '''ワーカープロセスで数局を指し直す'''
+    return [check_game(game, tablebase) for game in batch]
+
+
+def batches(games, size):
+    '''対局を size 局ずつのリストにする'''
+    games = iter(games)
+    while True:
+        batch = list(islice(games, size))
+        if not batch:
+            return
+        yield batch
+
+
+def replay_games(games, workers=None, batch_size=64, tablebase=None):
+    '''
+    対局をワーカープロセスで指し直し，結果を入力の順に出力する．
+    処理中の対局を workers の数に応じて制限するので，入力全体は読み込まない．
+
+    Parameters
+    ----------
+    games : iterable > PGNGame
+        棋譜．read_games の出力など．
+    workers : int or None, default None
+        プロセス数．None のときは CPU の数．
+    batch_size : int, default 64
+        1回にワーカーへ渡す対局数．
+    tablebase : tablebase.Tablebase or None, default None
+        最後の局面を引く終盤の表．ワーカーごとに mmap で開き直す．
+
+    Yields
+    ------
+    dict
+        check_game の結果．
+    '''
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for batch in batches(games, batch_size):
+            pending.append(executor.submit(check_batch, batch, tablebase))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay PGN games and check that every move is legal.')
+    parser.add_argument('pgn', nargs='*', default=['-'],
+                        help='PGN files to read, or - for standard input (default: -)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='number of worker processes (default: CPU count)')
+    parser.add_argument('--batch-size', type=int, default=64,
+                        help='games sent to a worker at a time (default: 64)')
+    parser.add_argument('--output', help='write JSON lines to this file instead of standard output')
+    parser.add_argument('--tablebase', metavar='DIR',
+                        help='look up the final positions in this endgame tablebase folder')
+    args = parser.parse_args(argv)
+    tablebase = Tablebase(args.tablebase) if args.tablebase else None
+
+    def all_games():
+        for path in args.pgn:
+            if path == '-':
+                yield from read_games(sys.stdin)
+            else:
+                yield from open_games(path)
+
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    count = illegal = 0
+    start = perf_counter()
+    try:
+        for index, record in enumerate(replay_games(all_games(), args.workers, args.batch_size,
+                                                           tablebase)):
+            out.write(json.dumps(dict(index=index, **record), ensure_ascii=False) + '\n')
+            count += 1
+            illegal += not record['legal']
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = perf_counter() - start
+    print(f'{count} games ({illegal} illegal) in {elapsed:.3f} s, '
+          f'{count / elapsed if elapsed else 0:.1f} games/s', file=sys.stderr)
+    return 1 if illegal else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,1038 @@
+'''描画や音声に依存しないチェスのルールを記録したモジュール'''
+
+from bitboard import Position, SIZE
+from cache import LRUCache
+from zobrist import state_hash
+from games import *
+from packed import PackedPosition
+from pieces import *
+
+opponent = {W: B, B: W}
+
+# 名前からゲームの種類，略号から駒を引く表
+game_classes = {kind.__name__: kind for kinds in game_dict.values() for kind in kinds}
+piece_classes = {piece.abbr: piece for piece in piece_names}
+# 駒を取らずポーンも動かさない手がこれだけ (片方の指し手で数える) 続けば引き分け
+FIFTY_MOVES = 100
+# 同じ局面がこれだけ現れれば引き分け
+REPETITIONS = 3
+
+
+class GameResult:
+    '''
+    手番の側から見た対局の状態．Rules.game_status が返す．
+
+    Attributes
+    ----------
+    status : str
+        'ongoing', 'check', 'checkmate', 'stalemate', 'insufficient material',
+        'fifty-move rule' または 'threefold repetition'．
+    winner : str or None
+        勝った側．引き分けか終わっていないときは None．
+    check : bool
+        手番の側がチェックされているか．
+    '''
+
+    __slots__ = ('status', 'winner', 'check')
+
+    def __init__(self, status='ongoing', winner=None, check=False):
+        self.status = status
+        self.winner = winner
+        self.check = check
+
+    @property
+    def over(self):
+        '''対局が終わっているか'''
+        return self.status not in ('ongoing', 'check')
+
+    @property
+    def result(self):
+        '''PGN の結果の形．'1-0', '0-1', '1/2-1/2' または終わっていなければ '*'．'''
+        if not self.over:
+            return '*'
+        if self.winner is None:
+            return '1/2-1/2'
+        return '1-0' if self.winner == W else '0-1'
+
+    def message(self, color):
+        '''
+        表示する文
+
+        Parameters
+        ----------
+        color : str > 'W' or 'B'
+            手番の側．
+        '''
+        if self.status == 'check':
+            return f"{color} player is in check"
+        if self.status == 'checkmate':
+            return f"Checkmate! {self.winner} player won!"
+        if self.status == 'stalemate':
+            return "Stalemate! It's draw."
+        if self.over:
+            return f"Draw by {self.status}."
+        return ''
+
+    def __eq__(self, other):
+        if not isinstance(other, GameResult):
+            return NotImplemented
+        return (self.status, self.winner, self.check) == (other.status, other.winner, other.check)
+
+    def __repr__(self):
+        return f'GameResult({self.status!r}, winner={self.winner!r}, check={self.check})'
+
+
+class Rules:
+    '''
+    盤面と手番などの状態を持ち，ルールに従って駒を動かす
+
+    Parameters
+    ----------
+    kind : obj or None, default None
+        ゲームの種類 (games.Normal() など)．指定したときは駒を初期配置に並べる．
+    '''
+
+    def __init__(self, kind=None):
+        self.playersturn = W
+        self.gameboard = Position(size=kind.size if kind is not None else SIZE)
+        self.kind = kind
+
+        # アンパッサン
+        self.advanced2_pos = None
+        # プロモーション
+        self.prom = False
+        # キャスリング
+        # キャスリングのポテンシャルが残っているか
+        self.can_castling = {'W': [True, True], 'B': [True, True]}
+        # キャスリングするかどうかをプレイヤーに確認するか
+        self.confirm_castling = False
+        # プレイヤーが選んだ，キャスリングするかどうか．None のときは選んでいない
+        self.do_castling = None
+
+        # 局面ごとの動ける位置の記録
+        self.move_cache = LRUCache(maxsize=1024)
+
+        # 対局の終わりの判定
+        # 駒を取らずポーンも動かさない手が続いた数
+        self.halfmove_clock = 0
+        # 最後に駒を取るかポーンが動いてからの，局面のハッシュごとの出現回数
+        self.repetitions = {}
+        # 局面のハッシュごとの (チェックか, 動ける駒があるか, 駒不足か)
+        self.status_cache = LRUCache(maxsize=1024)
+        # 最後に指した後の状態
+        self.result = None
+
+        if kind is not None:
+            self.place_pieces()
+
+    def place_pieces(self):
+        # 盤面の大きさがゲームの種類と違えば作り直す
+        if self.gameboard.size != self.kind.size:
+            self.gameboard = Position(size=self.kind.size)
+        for fl in range(self.kind.size):
+            for rk in self.kind.placers:
+                # None を指定すれば駒が置かれることはなく次のマスへ進む
+                if self.kind.placers[rk][fl] is not None:
+                    # 白の駒
+                    self.gameboard[(fl, rk - 1)] \
+                        = self.kind.placers[rk][fl]('W')
+                    # 黒の駒
+                    self.gameboard[(fl, self.kind.size - rk)] \
+                        = self.kind.placers[rk][fl]('B')
+        self.record_position(reset=True)
+
+    def snapshot(self):
+        '''
+        局面をプロセス間で受け渡すための小さな形にする
+
+        Returns
+        -------
+        tuple
+            (ゲームの種類の名前, 1段目の駒の略号, PackedPosition)
+        '''
+        return (type(self.kind).__name__,
+                tuple(p.abbr if p is not None else None for p in self.kind.placers[1]),
+                PackedPosition.from_rules(self))
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        '''
+        snapshot で作った形から局面を復元する
+
+        Parameters
+        ----------
+        snapshot : tuple
+            Rules.snapshot の返り値．
+
+        Returns
+        -------
+        Rules
+        '''
+        kind_name, back_rank, packed = snapshot
+        kind_cls = game_classes[kind_name]
+        # チェス960 のように配置を乱数で決めるゲームもあるので，初期化せずに配置を設定する
+        kind = kind_cls.__new__(kind_cls)
+        if hasattr(kind, 'set_back_rank'):
+            kind.set_back_rank([piece_classes[abbr] if abbr is not None else None
+                                for abbr in back_rank])
+        rules = cls()
+        rules.kind = kind
+        packed.restore(rules)
+        return rules
+
+    def play(self, startpos, endpos, castling=None):
+        '''
+        手番の側の駒を startpos から endpos へ動かし，手番を交代する
+
+        Parameters
+        ----------
+        startpos, endpos : tuple > (int, int)
+            開始位置，終了位置．絶対座標．
+        castling : bool or None, default None
+            キャスリングするかどうか．None のときは castling_move で決める．
+
+        Returns
+        -------
+        GameResult or None
+            最後に指した後の状態 (self.result)．まだ指していなければ None．
+        '''
+        try:
+            target = self.gameboard[startpos]
+        except:
+            target = None
+
+        if target and target.color == self.playersturn:
+
+            if castling is None:
+                castling = self.castling_move(target, startpos, endpos, self.gameboard)
+            # 50手ルールの手数は，ポーンが動くか駒を取ると 0 に戻る
+            captured = self.gameboard.get(endpos)
+            reset = (target.abbr == 'P'
+                     or captured is not None and captured.color != target.color)
+            # アンパッサン・キャスリングのルークの移動・キャスリングのポテンシャル・
+            # アンパッサン用の位置・手番は，探索と同じ make_move で更新する
+            self.make_move(startpos, endpos, self.gameboard, castling)
+            self.promotion(target, endpos)
+            # プロモーションのときは，プロモーション先が決まってから判定する (promote)
+            if not self.prom:
+                self.end_turn(reset)
+        return self.result
+
+    def promote(self, endpos, piece_cls):
+        '''
+        プロモーション先を決め，手番の終わりの処理をする
+
+        Parameters
+        ----------
+        endpos : tuple > (int, int)
+            プロモーションするポーンの位置．
+        piece_cls : class
+            プロモーション先の駒．
+        '''
+        self.gameboard[endpos] = piece_cls(self.gameboard[endpos].color)
+        self.prom = False
+        self.end_turn(True)
+
+    def end_turn(self, reset):
+        '''
+        指した後の局面を記録し，対局が終わったか判定する．
+        以前のように sys.exit() はせず，結果を self.result に置いて返す．
+
+        Parameters
+        ----------
+        reset : bool
+            ポーンが動いたか駒を取ったか．
+
+        Returns
+        -------
+        GameResult
+        '''
+        self.record_position(reset)
+        self.result = self.game_status()
+        message = self.result.message(self.playersturn)
+        if message:
+            print(message)
+        return self.result
+
+    def valid_moves(self, piece, startpos, gameboard):
+        '''
+        動ける位置を出力．味方駒上には移動不可．
+
+        Parameters
+        ----------
+        piece : obj
+            駒．
+        startpos : tuple > (int, int)
+            開始位置．絶対座標．
+        gameboard : dict > {(int, int): obj, ...}
+            盤面．
+
+        Returns
+        -------
+        result : list > [(int, int), ...]
+
+        Notes
+        -----
+        同じ局面・同じ駒についての結果は self.move_cache に記録しておき，
+        再計算しない．
+        '''
+        if not isinstance(gameboard, Position):
+            legal, _, _ = self.generate_valid_moves(piece, startpos, gameboard)
+        else:
+            key = (self.zobrist_hash(gameboard), piece.name, startpos)
+            cached = self.move_cache.get(key)
+            if cached is None:
+                cached = self.generate_valid_moves(piece, startpos, gameboard)
+                self.move_cache.put(key, cached)
+            legal, _, _ = cached
+        return list(legal)
+
+    def generate_valid_moves(self, piece, startpos, gameboard):
+        '''
+        動ける位置を計算する
+
+        Parameters
+        ----------
+        piece : obj
+            駒．
+        startpos : tuple > (int, int)
+            開始位置．絶対座標．
+        gameboard : dict > {(int, int): obj, ...}
+            盤面．
+
+        Returns
+        -------
+        legal : tuple > ((int, int), ...)
+            動ける位置．
+        en_passant : bool
+            アンパッサンできるか．
+        castling : bool
+            キャスリングできるか．
+        '''
+        if isinstance(gameboard, Position):
+            moves, en_passant, castling = self.strict_moves(piece, startpos, gameboard)
+            return tuple(endpos for endpos, _ in moves), en_passant, castling
+        legal = []
+        en_passant = castling = False
+        for endpos, castling_move in self.candidate_moves(piece, startpos, gameboard):
+            if castling_move:
+                castling = True
+            elif (piece.abbr == 'P' and endpos[0] != startpos[0]
+                    and endpos not in gameboard):
+                en_passant = True
+            # チェック回避のため動き縛り
+            if self.is_legal(startpos, endpos, gameboard, castling_move):
+                legal.append(endpos)
+        return tuple(legal), en_passant, castling
+
+    def strict_moves(self, piece, startpos, gameboard, checks=None):
+        '''
+        Position の盤面で，動ける位置を1手ずつ動かして確かめずに計算する．
+        王手とピンを先に求めておき，キングへの利きを遮らない手や
+        王手を防がない手ははじめから作らない．
+        アンパッサン (取ったポーンの後ろから利きが通ることがある) と
+        キャスリングだけは動かして確かめる．
+
+        Parameters
+        ----------
+        piece : obj
+            駒．
+        startpos : tuple > (int, int)
+            開始位置．絶対座標．
+        gameboard : Position
+            盤面．
+        checks : tuple or None, default None
+            gameboard.pins_and_checks(piece.color) の返り値．None のときは計算する．
+
+        Returns
+        -------
+        moves : list > [((int, int), bool), ...]
+            (終了位置, キャスリングか) のリスト．candidate_moves のうち合法なもの．
+        en_passant : bool
+            アンパッサンの候補があるか．
+        castling : bool
+            キャスリングの候補があるか．
+        '''
+        if checks is None:
+            checks = gameboard.pins_and_checks(piece.color)
+        _, evasion, pins = checks
+        geo = gameboard.geometry
+        targets = gameboard.legal_targets(piece, *startpos, evasion, pins)
+        moves = [(endpos, False) for endpos in geo.squares_of(targets)] if targets else []
+        en_passant = castling = False
+        size = self.kind.size
+        # アンパッサン (行先は2歩進んだポーンのすぐ後ろの，3段目か6段目にあたるマスだけ)
+        if piece.abbr == 'P' and self.advanced2_pos:
+            endpos = (self.advanced2_pos[0], self.advanced2_pos[1] + piece.direction)
+            if (endpos[1] in (2, size - 3) and endpos not in gameboard
+                    and self.en_passant_requirements(piece, startpos, endpos)):
+                en_passant = True
+                # 動かしたポーンと取ったポーンを除いて，キングが攻撃されないか調べる
+                kingpos = gameboard.king_square(piece.color)
+                occupied = ((gameboard.occupied[W] | gameboard.occupied[B])
+                            ^ geo.bit(*startpos) ^ geo.bit(*self.advanced2_pos)
+                            | geo.bit(*endpos))
+                if (kingpos is None
+                        or not gameboard.attackers_of(kingpos, opponent[piece.color], occupied)):
+                    moves.append((endpos, False))
+        # キャスリング
+        if piece.abbr == 'K':
+            for endpos in [(2, 0), (size - 2, 0), (2, size - 1), (size - 2, size - 1)]:
+                for side in (0, 1):
+                    if self.castling_requirements(piece, endpos, side, gameboard):
+                        castling = True
+                        if self.is_legal(startpos, endpos, gameboard, True):
+                            moves.append((endpos, True))
+        return moves, en_passant, castling
+
+    def candidate_moves(self, piece, startpos, gameboard):
+        '''
+        チェックを考えずに動ける位置を，キャスリングかどうかとあわせて出力する
+
+        Parameters
+        ----------
+        piece : obj
+            駒．
+        startpos : tuple > (int, int)
+            開始位置．絶対座標．
+        gameboard : dict > {(int, int): obj, ...}
+            盤面．
+
+        Returns
+        -------
+        result : list > [((int, int), bool), ...]
+            (終了位置, キャスリングか) のリスト．
+        '''
+        size = self.kind.size
+        result = [(endpos, False) for endpos in piece.available_moves(*startpos, gameboard, size)]
+        # アンパッサン (行先は2歩進んだポーンのすぐ後ろの，3段目か6段目にあたるマスだけ)
+        if piece.abbr == 'P' and self.advanced2_pos:
+            endpos = (self.advanced2_pos[0], self.advanced2_pos[1] + piece.direction)
+            if (endpos[1] in (2, size - 3)
+                    and self.en_passant_requirements(piece, startpos, endpos)):
+                result.append((endpos, False))
+        # キャスリング
+        if piece.abbr == 'K':
+            for endpos in [(2, 0), (size - 2, 0), (2, size - 1), (size - 2, size - 1)]:
+                for side in (0, 1):
+                    if self.castling_requirements(piece, endpos, side, gameboard):
+                        result.append((endpos, True))
+        return result
+
+    def is_legal(self, startpos, endpos, gameboard, castling=False):
+        '''
+        動かした後に自分のキングがチェックされていなければ True を返す
+
+        Parameters
+        ----------
+        startpos, endpos : tuple > (int, int)
+            開始位置，終了位置．絶対座標．
+        gameboard : dict > {(int, int): obj, ...}
+            盤面．
+        castling : bool, default False
+            キャスリングか．
+
+        Returns
+        -------
+        bool
+        '''
+        color = gameboard[startpos].color
+        undo = self.make_move(startpos, endpos, gameboard, castling=castling)
+        legal = not self.is_check(color, gameboard)
+        self.unmake_move(undo, gameboard)
+        return legal
+
+    def legal_moves(self, color, gameboard):
+        '''
+        color 側の合法手をすべて出力する．
+        プロモーションは成り先ごとに別の手とする．
+
+        Parameters
+        ----------
+        color : str > 'W' or 'B'
+            駒色．
+        gameboard : dict > {(int, int): obj, ...}
+            盤面．
+
+        Returns
+        -------
+        moves : list > [((int, int), (int, int), bool, class or None), ...]
+            (開始位置, 終了位置, キャスリングか, プロモーション先) のリスト．
+            make_move の引数にそのまま使える．
+        '''
+        last_rank = self.kind.size - 1 if color == W else 0
+        moves = []
+        if isinstance(gameboard, Position):
+            checks = gameboard.pins_and_checks(color)
+            for startpos, piece in list(gameboard.items()):
+                if piece.color != color:
+                    continue
+                for endpos, castling in self.strict_moves(piece, startpos, gameboard, checks)[0]:
+                    if piece.abbr == 'P' and endpos[1] == last_rank:
+                        moves += [(startpos, endpos, False, promote)
+                                  for promote in self.kind.promote2]
+                    else:
+                        moves.append((startpos, endpos, castling, None))
+            return moves
+        for startpos, piece in list(gameboard.items()):
+            if piece.color != color:
+                continue
+            for endpos, castling in self.candidate_moves(piece, startpos, gameboard):
+                if not self.is_legal(startpos, endpos, gameboard, castling):
+                    continue
+                if piece.abbr == 'P' and endpos[1] == last_rank:
+                    moves += [(startpos, endpos, False, promote)
+                              for promote in self.kind.promote2]
+                else:
+                    moves.append((startpos, endpos, castling, None))
+        return moves
+
+    def zobrist_hash(self, gameboard):
+        '''
+        盤面・手番・キャスリングのポテンシャル・アンパッサン用の位置をまとめたハッシュ．
+        盤面の部分は make_move などで駒を動かすたびに
+        Position が差分で更新している．
+
+        Parameters
+        ----------
+        gameboard : Position
+            盤面．
+
+        Returns
+        -------
+        int
+        '''
+        return state_hash(gameboard.hash, self.playersturn,
+                          self.can_castling, self.advanced2_pos)
+
+    def make_move(self, startpos, endpos, gameboard, castling=False, promote=None):
+        '''
+        盤面をその場で更新し，元に戻すための記録を返す．
+        アンパッサン・キャスリングのルークの移動・プロモーションを含み，
+        アンパッサン用の位置，キャスリングのポテンシャル，手番も更新する．
+
+        Parameters
+        ----------
+        startpos, endpos : tuple > (int, int)
+            開始位置，終了位置．絶対座標．
+        gameboard : dict > {(int, int): obj, ...}
+            盤面．
+        castling : bool, default False
+            True のとき，キングの移動をキャスリングとして扱う．
+        promote : class or None, default None
+            プロモーション先の駒．None のときはポーンのまま置く．
+
+        Returns
+        -------
+        undo : tuple
+            (開始位置, 終了位置, 動かした駒, 取った駒, 取った駒の位置,
+             ルークの移動 (開始位置, 終了位置, 駒) または None,
+             アンパッサン用の位置, キャスリングのポテンシャル, 手番)
+        '''
+        piece = gameboard[startpos]
+        color = piece.color
+        undo_state = (self.advanced2_pos,
+                      (tuple(self.can_castling[W]), tuple(self.can_castling[B])),
+                      self.playersturn)
+        captured_pos = endpos
+        # アンパッサン: ポーンが空きマスへ斜めに進む
+        if (piece.abbr == 'P' and startpos[0] != endpos[0]
+                and endpos not in gameboard):
+            captured_pos = (endpos[0], startpos[1])
+        # チェス960 ではキャスリングでキングが動かないこともある
+        captured = gameboard.get(captured_pos) if captured_pos != startpos else None
+        if captured is not None:
+            del gameboard[captured_pos]
+        del gameboard[startpos]
+        gameboard[endpos] = promote(color) if promote is not None else piece
+
+        rook_move = None
+        rook_init_pos = [pos for pos, p in enumerate(self.kind.placers[1]) if p == Rook]
+        if castling and piece.abbr == 'K':
+            side = 0 if endpos[0] == 2 else 1
+            rook_start = (rook_init_pos[side], endpos[1])
+            rook_end = (3 if side == 0 else self.kind.size - 3, endpos[1])
+            rook = gameboard.get(rook_start)
+            # キングがルークの初期位置に入った場合，ルークは盤上にいない
+            if rook is None or rook.abbr != 'R':
+                rook = captured
+                captured, captured_pos = None, endpos
+            else:
+                del gameboard[rook_start]
+            gameboard[rook_end] = rook
+            rook_move = (rook_start, rook_end, rook)
+
+        # アンパッサン用の位置
+        if piece.abbr == 'P' and abs(endpos[1] - startpos[1]) == 2:
+            self.advanced2_pos = endpos
+        else:
+            self.advanced2_pos = None
+        # キャスリングのポテンシャル
+        if piece.abbr == 'K':
+            self.can_castling[color] = [False, False]
+        home = {W: 0, B: self.kind.size - 1}
+        for c in (W, B):
+            for side in (0, 1):
+                if (rook_init_pos[side], home[c]) in (startpos, captured_pos):
+                    self.can_castling[c][side] = False
+        self.playersturn = opponent[color]
+
+        return (startpos, endpos, piece, captured, captured_pos, rook_move) + undo_state
+
+    def unmake_move(self, undo, gameboard):
+        '''
+        make_move による変更を元に戻す
+
+        Parameters
+        ----------
+        undo : tuple
+            make_move の返り値．
+        gameboard : dict > {(int, int): obj, ...}
+            盤面．
+        '''
+        (startpos, endpos, piece, captured, captured_pos, rook_move,
+         self.advanced2_pos, (castling_w, castling_b), self.playersturn) = undo
+        self.can_castling = {W: list(castling_w), B: list(castling_b)}
+        if rook_move is not None:
+            rook_start, rook_end, rook = rook_move
+            del gameboard[rook_end]
+            gameboard[rook_start] = rook
+        if gameboard.get(endpos) is not None and (rook_move is None or endpos != rook_move[0]):
+            del gameboard[endpos]
+        gameboard[startpos] = piece
+        if captured is not None:
+            gameboard[captured_pos] = captured
+
+    def push(self, startpos, endpos, castling=False, promote=None):
+        '''
+        対局の手として手番の側の手を指す．make_move で盤面を更新し，
+        50手ルールの手数と局面の出現回数を記録してから，対局の状態を返す．
+        探索のように後で戻す手には make_move を使う．
+
+        Parameters
+        ----------
+        startpos, endpos : tuple > (int, int)
+            開始位置，終了位置．絶対座標．
+        castling : bool, default False
+            True のとき，キングの移動をキャスリングとして扱う．
+        promote : class or None, default None
+            プロモーション先の駒．
+
+        Returns
+        -------
+        GameResult
+        '''
+        board = self.gameboard
+        piece = board[startpos]
+        captured = board.get(endpos)
+        reset = (piece.abbr == 'P'
+                 or captured is not None and captured.color != piece.color)
+        self.make_move(startpos, endpos, board, castling, promote)
+        self.record_position(reset)
+        self.result = self.game_status()
+        return self.result
+
+    def record_position(self, reset=False):
+        '''
+        指した後の局面を，50手ルールの手数と局面の出現回数に加える．
+        ポーンが動くか駒を取った後の局面は，それより前の局面に戻れないので
+        出現回数を数え直す．
+
+        Parameters
+        ----------
+        reset : bool, default False
+            ポーンが動いたか駒を取ったか．True のときは手数を 0 に戻す．
+        '''
+        if reset:
+            self.halfmove_clock = 0
+            self.repetitions = {}
+        else:
+            self.halfmove_clock += 1
+        key = self.zobrist_hash(self.gameboard)
+        self.repetitions[key] = self.repetitions.get(key, 0) + 1
+
+    def en_passant_requirements(self, piece, startpos, endpos):
+        '''
+        アンパッサンの条件を満たすとき True を返す
+
+        Parameters
+        ----------
+        piece : obj
+            動かす駒．
+        startpos, endpos : tuple > (int, int)
+            開始位置，終了位置．
+
+        Returns
+        -------
+        bool
+        '''
+        return (piece.abbr == 'P'
+            and self.advanced2_pos
+            and startpos[1] == endpos[1] - piece.direction
+            and startpos[1] == self.advanced2_pos[1]
+            and endpos[1] == self.advanced2_pos[1] + piece.direction
+            and abs(startpos[0] - endpos[0]) == 1
+            and abs(startpos[0] - self.advanced2_pos[0]) == 1
+            and endpos[0] == self.advanced2_pos[0])
+
+    def promotion(self, piece, endpos):
+        '''
+        プロモーションできるとき，True
+
+        Parameters
+        ----------
+        piece : obj
+            駒．
+        endpos : tuple > (int, int)
+            終了位置．
+
+        Returns
+        -------
+        bool
+        '''
+        if (piece.name == 'WP' and endpos[1] == self.kind.size - 1
+                or piece.name == 'BP' and endpos[1] == 0):
+            self.prom = True
+
+    def castling_requirements(self, piece, endpos, side, gameboard):
+        '''
+        キャスリングの条件を満たすとき，True
+        side == 0 -> aファイル側
+        side == 1 -> hファイル側
+
+        Parameters
+        ----------
+        piece : obj
+            駒．キングでなければ return は False．
+        endpos : tuple > (int, int)
+            終了位置．絶対座標．
+        side : int > 0, 1
+            0 -- クイーンサイド
+            1 -- キングサイド
+        gameboard : dict > {(int, int): obj, ...}
+            盤面．
+
+        Returns
+        -------
+        bool
+        '''
+        size = self.kind.size
+
+        rook_init_pos = [pos for pos, piece in enumerate(self.kind.placers[1]) if piece == Rook]
+        king_init_pos = self.kind.placers[1].index(King)
+
+        def path_is_not_attacked(startpos_y, king_route):
+            '''
+            キングが通るマスのどれかが相手の駒に攻撃されていれば False を返す
+
+            Parameters
+            ----------
+            startpos_y : int
+                開始位置y座標．
+            king_route : list > [int, ...]
+                キングが通る位置x座標のリスト．
+
+            Returns
+            -------
+            bool
+            '''
+            king_pos = (king_init_pos, startpos_y)
+            if gameboard.get(king_pos) is None:
+                return True
+            if not isinstance(gameboard, Position):
+                # dict の盤面では，キングを通るマスに置いた盤面で is_check を調べる
+                for pos in king_route:
+                    board = {p: q for p, q in gameboard.items() if p != king_pos}
+                    board[(pos, startpos_y)] = gameboard[king_pos]
+                    if self.is_check(piece.color, board):
+                        return False
+                return True
+            # キングのいたマスは空いているものとして利きを調べる
+            occupied = ((gameboard.occupied[W] | gameboard.occupied[B])
+                        & ~gameboard.geometry.bit(*king_pos))
+            return not any(gameboard.is_square_attacked((pos, startpos_y), opponent[piece.color], occupied)
+                           for pos in king_route)
+
+        if (piece.abbr != 'K'
+                # キャスリングに関与する駒が一度も動いていない
+                or not self.can_castling[piece.color][side]
+                # キングがチェックされていない
+                or self.is_check(piece.color, gameboard)):
+            return False
+        # 白のキャスリング
+        if piece.color == 'W':
+            piece_req = (piece.name == 'WK'
+                         and (rook_init_pos[side], 0) in gameboard
+                         and gameboard[(rook_init_pos[side], 0)].name == 'WR')
+            if not piece_req:
+                return False
+            # キャスリングに関与するキングとルークは除外して考える
+            involved = (king_init_pos, rook_init_pos[side])
+            # クイーンサイド
+            if side == 0:
+                # キングとルークの通過するマス
+                king_route = list(range(2, king_init_pos)) + list(range(2, king_init_pos, -1))
+                rook_route = list(range(3, rook_init_pos[side])) + list(range(3, rook_init_pos[side], -1))
+                special_req = (endpos == (2, 0)
+                                # キングとルークの通過するマスに駒がない
+                                and not any((x, 0) in gameboard and x not in involved
+                                    for x in king_route + rook_route)
+                                # キングが通過するマスが敵に攻撃されていない
+                                and path_is_not_attacked(0, list(x for x in range(2, king_init_pos)))
+                                )
+            # キングサイド
+            if side == 1:
+                # キングとルークの通過するマス
+                king_route = list(range(size - 2, king_init_pos)) + list(range(size - 2, king_init_pos, -1))
+                rook_route = list(range(size - 3, rook_init_pos[side])) + list(range(size - 3, rook_init_pos[side], -1))
+                special_req = (endpos == (size - 2, 0)
+                                # キングとルークの通過するマスに駒がない
+                                and not any((x, 0) in gameboard and x not in involved
+                                    for x in king_route + rook_route)
+                                # キングが通過するマスが敵に攻撃されていない
+                                and path_is_not_attacked(0, list(x for x in range(size - 2, king_init_pos, -1)))
+                                )
+        # 黒のキャスリング
+        if piece.color == 'B':
+            piece_req = (piece.name == 'BK'
+                         and (rook_init_pos[side], size - 1) in gameboard
+                         and gameboard[(rook_init_pos[side], size - 1)].name == 'BR')
+            if not piece_req:
+                return False
+            # キャスリングに関与するキングとルークは除外して考える
+            involved = (king_init_pos, rook_init_pos[side])
+            # クイーンサイド
+            if side == 0:
+                # キングとルークの通過するマス
+                king_route = list(range(2, king_init_pos)) + list(range(2, king_init_pos, -1))
+                rook_route = list(range(3, rook_init_pos[side])) + list(range(3, rook_init_pos[side], -1))
+                special_req = (endpos == (2, size - 1)
+                                # キングとルークの通過するマスに駒がない
+                                and not any((x, size - 1) in gameboard and x not in involved
+                                    for x in king_route + rook_route)
+                                # キングが通過するマスが敵に攻撃されていない
+                                and path_is_not_attacked(size - 1, list(x for x in range(2, king_init_pos)))
+                                )
+            # キングサイド
+            if side == 1:
+                # キングとルークの通過するマス
+                king_route = list(range(size - 2, king_init_pos)) + list(range(size - 2, king_init_pos, -1))
+                rook_route = list(range(size - 3, rook_init_pos[side])) + list(range(size - 3, rook_init_pos[side], -1))
+                special_req = (endpos == (size - 2, size - 1)
+                                # キングとルークの通過するマスに駒がない
+                                and not any((x, size - 1) in gameboard and x not in involved
+                                    for x in king_route + rook_route)
+                                # キングが通過するマスが敵に攻撃されていない
+                                and path_is_not_attacked(size - 1, list(x for x in range(size - 2, king_init_pos, -1)))
+                                )
+
+        return bool(piece_req and special_req)
+
+    def castling_move(self, piece, startpos, endpos, gameboard):
+        '''
+        startpos から endpos への手をキャスリングとして指すか．
+        キャスリングとしてもふつうの手としても合法な手 (castle_or_not で確認する手) は
+        ふつうの手とする．
+
+        Parameters
+        ----------
+        piece : obj
+            駒．
+        startpos, endpos : tuple > (int, int)
+            開始位置，終了位置．絶対座標．
+        gameboard : dict > {(int, int): obj, ...}
+            盤面．
+
+        Returns
+        -------
+        bool
+        '''
+        if not self.kind.castling or piece.abbr != 'K':
+            return False
+        options = {castling for pos, castling in self.candidate_moves(piece, startpos, gameboard)
+                   if pos == endpos and self.is_legal(startpos, endpos, gameboard, castling)}
+        return True in options and False not in options
+
+    def castle_or_not(self, piece, endpos):
+        '''
+        キャスリングするかしないかを確認するか
+
+        Parameters
+        ----------
+        piece : obj
+            駒．
+        endpos : tuple > (int, int)
+            終了位置．絶対座標．
+
+        Notes
+        -----
+        if文の条件式について．
+
+        キングの移動終了位置が，キャスリング終了位置としてありうる4つの位置のうちのいずれかにあてはまる
+        and (クイーンサイドキャスリングの条件にあてはまる
+            or キングサイドキャスリングの条件にあてはまる)
+        and キングの初期位置とキャスリング終了位置のx座標の差 == 1
+        and 移動先に駒がない（＝キングが敵駒を取ったのではない）
+        '''
+        if (endpos in [(2, 0), (self.kind.size - 2, 0), (2, self.kind.size - 1), (self.kind.size - 2, self.kind.size - 1)]
+                and (self.castling_requirements(piece, endpos, 0, self.gameboard)
+                    or self.castling_requirements(piece, endpos, 1, self.gameboard))
+                and abs(self.kind.placers[1].index(King) - endpos[0]) == 1
+                and endpos not in self.gameboard):
+            self.confirm_castling = True
+
+    def is_check(self, color, gameboard):
+        '''
+        color 側がチェックされていれば True を返す
+
+        Parameters
+        ----------
+        color : str > 'W' or 'B'
+            駒色．
+        gameboard : dict > {(int, int): obj, ...}
+            盤面．
+        '''
+        if isinstance(gameboard, Position):
+            kingpos = gameboard.king_square(color)
+            return (kingpos is not None
+                    and gameboard.is_square_attacked(kingpos, opponent[color]))
+        kingDict = {}
+        pieceDict = {B: [], W: []}
+        for position, piece in gameboard.items():
+            if piece.abbr == 'K':
+                kingDict[piece.color] = position
+            pieceDict[piece.color].append((piece, position))
+        if self.can_see_king(kingDict[color], pieceDict[opponent[color]], gameboard):
+            return True
+
+    def cannot_move(self, color, gameboard):
+        '''
+        color側が駒を動かせないときTrueを返す
+
+        Parameters
+        ----------
+        color : str > 'W' or 'B'
+            駒色．
+        gameboard : dict > {(int, int): obj, ...}
+            盤面．
+        '''
+        if isinstance(gameboard, Position):
+            _, evasion, pins = gameboard.pins_and_checks(color)
+            return not any(gameboard.legal_targets(piece, *position, evasion, pins)
+                           for position, piece in gameboard.items() if piece.color == color)
+        for position, piece in list(gameboard.items()):
+            if color == piece.color:
+                for dest in piece.available_moves(*position, gameboard, self.kind.size):
+                    undo = self.make_move(position, dest, gameboard)
+                    in_check = self.is_check(color, gameboard)
+                    self.unmake_move(undo, gameboard)
+                    if not in_check:
+                        return False
+        return True
+
+    def has_legal_move(self, color, gameboard, checks=None):
+        '''
+        color 側に合法手が1つでもあれば True を返す．見つかった時点でやめる．
+        アンパッサンとキャスリングも数えるので，cannot_move より正確．
+
+        Parameters
+        ----------
+        color : str > 'W' or 'B'
+            駒色．
+        gameboard : dict > {(int, int): obj, ...}
+            盤面．
+        checks : tuple or None, default None
+            gameboard.pins_and_checks(color) の返り値．None のときは計算する．
+        '''
+        if not isinstance(gameboard, Position):
+            return not self.cannot_move(color, gameboard)
+        if checks is None:
+            checks = gameboard.pins_and_checks(color)
+        _, evasion, pins = checks
+        special = []
+        for position, piece in gameboard.items():
+            if piece.color == color:
+                if gameboard.legal_targets(piece, *position, evasion, pins):
+                    return True
+                if piece.abbr in ('P', 'K'):
+                    special.append((piece, position))
+        # ほかに動ける駒がないときだけ，アンパッサンとキャスリングを確かめる
+        return any(self.strict_moves(piece, position, gameboard, checks)[0]
+                   for piece, position in special)
+
+    def insufficient_material(self, gameboard):
+        '''
+        どちらもチェックメイトできない駒しか残っていなければ True を返す．
+        キングだけ，キングのほかにナイトかビショップが1つだけ，
+        またはビショップがすべて同じ色のマスにあるとき．
+
+        Parameters
+        ----------
+        gameboard : dict > {(int, int): obj, ...}
+            盤面．
+        '''
+        minors = []
+        for position, piece in gameboard.items():
+            if piece.abbr == 'K':
+                continue
+            if piece.abbr not in ('N', 'B'):
+                return False
+            minors.append((position, piece))
+        if len(minors) <= 1:
+            return True
+        return (all(piece.abbr == 'B' for _, piece in minors)
+                and len({(x + y) % 2 for (x, y), _ in minors}) == 1)
+
+    def game_status(self):
+        '''
+        手番の側から見た対局の状態．
+        王手とピンを1度だけ計算してチェックの判定と合法手の有無の両方に使い，
+        合法手は1つ見つかった時点で探すのをやめる．
+        盤面で決まる部分は局面のハッシュごとに覚えておく．
+
+        Returns
+        -------
+        GameResult
+        '''
+        color = self.playersturn
+        board = self.gameboard
+        key = self.zobrist_hash(board)
+        found = self.status_cache.get(key)
+        if found is None:
+            checks = board.pins_and_checks(color)
+            found = (bool(checks[0]), self.has_legal_move(color, board, checks),
+                     self.insufficient_material(board))
+            self.status_cache.put(key, found)
+        check, movable, insufficient = found
+        if not movable:
+            if check:
+                return GameResult('checkmate', opponent[color], check)
+            return GameResult('stalemate')
+        if insufficient:
+            return GameResult('insufficient material', check=check)
+        if self.halfmove_clock >= FIFTY_MOVES:
+            return GameResult('fifty-move rule', check=check)
+        if self.repetitions.get(key, 0) >= REPETITIONS:
+            return GameResult('threefold repetition', check=check)
+        return GameResult('check' if check else 'ongoing', check=check)
+
+    def can_see_king(self, kingpos, piecelist, gameboard):
+        '''
+        piecelist の中の駒で kingpos を攻撃する駒があれば True を返す
+
+        Parameters
+        ----------
+        kingpos : tuple > (int, int)
+            キングの座標．
+        piecelist : list > [(obj, (int, int)), ...]
+            駒とその位置を格納したリスト．
+        gameboard : dict > {(int, int): obj, ...}
+            盤面．
+
+        Returns
+        -------
+        bool
+        '''
+        for piece, position in piecelist:
+            if kingpos in piece.available_moves(*position, gameboard, self.kind.size):
+                return True
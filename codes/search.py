@@ -0,0 +1,407 @@
+'''コンピュータの指し手を探索するモジュール
+
+反復深化のアルファベータ探索に，置換表と
+MVV-LVA・キラームーブ・ヒストリーによる指し手の並べ替えを組み合わせる．
+'''
+
+from time import perf_counter
+
+from piece_square import piece_values
+from pieces import *
+from rules import opponent
+
+INF = 1000000
+# 詰みの評価値．手数だけ小さくして，早い詰みを優先する
+MATE = 100000
+MAX_PLY = 128
+
+# 置換表の評価値の種類
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class SearchAborted(Exception):
+    '''時間または局面数の上限に達した'''
+
+
+def evaluate(rules):
+    '''
+    手番の側から見た局面の評価値．駒の価値と駒の位置の表の和で，
+    Position が駒を動かすたびに差分で更新している値を使う．
+
+    Parameters
+    ----------
+    rules : Rules
+        局面．
+
+    Returns
+    -------
+    int
+    '''
+    score = rules.gameboard.score
+    return score if rules.playersturn == W else -score
+
+
+class TranspositionTable:
+    '''
+    大きさが固定の置換表．
+    同じ位置に別の局面が入るときは，古い探索のものか，
+    新しい方が深く読んでいるときに置き換える．
+
+    Parameters
+    ----------
+    size : int, default 1 << 18
+        項目数．
+    '''
+
+    def __init__(self, size=1 << 18):
+        self.size = size
+        self.table = [None] * size
+        self.generation = 0
+
+    def new_search(self):
+        '''新しい探索を始める．前の探索の項目は置き換えやすくなる．'''
+        self.generation += 1
+
+    def probe(self, key):
+        '''key の項目 (key, 深さ, 評価値, 種類, 最善手, 世代) を返す．なければ None．'''
+        entry = self.table[key % self.size]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, score, flag, move):
+        '''項目を記録する'''
+        index = key % self.size
+        entry = self.table[index]
+        if (entry is None or entry[0] == key
+                or entry[5] != self.generation or depth >= entry[1]):
+            self.table[index] = (key, depth, score, flag, move, self.generation)
+
+    def clear(self):
+        self.table = [None] * self.size
+
+
+def _to_tt(score, ply):
+    '''詰みの評価値を，その局面からの手数に直す'''
+    if score > MATE - MAX_PLY:
+        return score + ply
+    if score < -MATE + MAX_PLY:
+        return score - ply
+    return score
+
+
+def _from_tt(score, ply):
+    if score > MATE - MAX_PLY:
+        return score - ply
+    if score < -MATE + MAX_PLY:
+        return score + ply
+    return score
+
+
+def _tablebase_score(found, ply):
+    '''終盤の表の (結果, 手数) を，詰みまでの手数を反映した評価値にする'''
+    result, dtm = found
+    if result > 0:
+        return MATE - ply - dtm
+    if result < 0:
+        return -MATE + ply + dtm
+    return 0
+
+
+class Engine:
+    '''
+    コンピュータの指し手を決める
+
+    Parameters
+    ----------
+    time_limit : float or None, default 1.0
+        1手あたりの思考時間 (秒)．
+    node_limit : int or None, default None
+        1手あたりの局面数の上限．
+    max_depth : int, default 64
+        反復深化の深さの上限．
+    tt_size : int, default 1 << 18
+        置換表の項目数．
+    book : book.OpeningBook or None, default None
+        定跡．局面が定跡にあれば，読まずに定跡の手を指す．
+    tablebase : tablebase.Tablebase or None, default None
+        終盤の表．最初の局面が表にあれば読まずに表の最善手を指し，
+        読んでいる途中の局面が表にあればそれ以上読まずに表の評価値を使う．
+
+    Attributes
+    ----------
+    book_move : bool
+        直前の手が定跡の手なら True．
+    tablebase_move : bool
+        直前の手が終盤の表の手なら True．
+    nodes : int
+        直前の探索で調べた局面数．
+    depth : int
+        直前の探索で読み終えた深さ．
+    score : int
+        直前の探索の最善手の評価値．
+    iterations : list > [(int, int, tuple), ...]
+        直前の探索で読み終えた深さごとの (深さ, 評価値, 最善手)．
+    '''
+
+    def __init__(self, time_limit=1.0, node_limit=None, max_depth=64, tt_size=1 << 18,
+                 book=None, tablebase=None):
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.max_depth = max_depth
+        self.tt = TranspositionTable(tt_size)
+        self.book = book
+        self.book_move = False
+        self.tablebase = tablebase
+        self.tablebase_move = False
+        self.history = {}
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        self.iterations = []
+
+    def search(self, rules, root_moves=None):
+        '''
+        手番の側の最善手を探す
+
+        Parameters
+        ----------
+        rules : Rules
+            局面．探索中は make_move で動かし，終わると元に戻す．
+        root_moves : list or None, default None
+            最初の一手の候補．None のときは合法手すべて．
+
+        Returns
+        -------
+        move : tuple > ((int, int), (int, int), bool, class or None) or None
+            Rules.legal_moves と同じ形の指し手．指せる手がなければ None．
+        '''
+        self.rules = rules
+        self.nodes = 0
+        self.depth = 0
+        self.iterations = []
+        self.book_move = False
+        self.tablebase_move = False
+        self.start = perf_counter()
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.tt.new_search()
+
+        if root_moves is None:
+            moves = rules.legal_moves(rules.playersturn, rules.gameboard)
+        else:
+            moves = list(root_moves)
+        # 候補を絞ったときの評価値は局面の評価値ではないので，置換表に記録しない
+        self.restricted = root_moves is not None
+        if not moves:
+            return None
+        # 定跡にある局面なら読まない
+        if self.book is not None and root_moves is None:
+            move = self.book.choose(rules, moves)
+            if move is not None:
+                self.book_move = True
+                return move
+        # 終盤の表にある局面なら読まない
+        if self.tablebase is not None and root_moves is None:
+            move = self.tablebase.best_move(rules, moves)
+            if move is not None:
+                self.tablebase_move = True
+                return move
+        best = moves[0]
+        if len(moves) == 1 and root_moves is None:
+            return best
+        for depth in range(1, self.max_depth + 1):
+            try:
+                score, move = self.root(depth, moves)
+            except SearchAborted:
+                break
+            best, self.depth, self.score = move, depth, score
+            self.iterations.append((depth, score, move))
+            # 次の深さでは最善手から調べる
+            moves.remove(move)
+            moves.insert(0, move)
+            if abs(score) > MATE - MAX_PLY:
+                break
+        return best
+
+    def root(self, depth, moves):
+        '''最初の一手ごとに読み，(評価値, 最善手) を返す'''
+        rules = self.rules
+        board = rules.gameboard
+        alpha, beta = -INF, INF
+        best = moves[0]
+        for move in moves:
+            undo = rules.make_move(move[0], move[1], board, move[2], move[3])
+            try:
+                score = -self.negamax(depth - 1, -beta, -alpha, 1)
+            finally:
+                rules.unmake_move(undo, board)
+            if score > alpha:
+                alpha, best = score, move
+        if not self.restricted:
+            self.tt.store(rules.zobrist_hash(board), depth, alpha, EXACT, best)
+        return alpha, best
+
+    def check_limits(self):
+        '''
+        上限に達していれば SearchAborted を送出する．
+        局面数は毎回比べ，時間は 1024 局面ごとにだけ測る．
+        '''
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchAborted
+        if (self.time_limit is not None and self.nodes & 1023 == 0
+                and perf_counter() - self.start >= self.time_limit):
+            raise SearchAborted
+
+    def negamax(self, depth, alpha, beta, ply):
+        '''
+        手番の側から見た評価値を返す
+
+        Parameters
+        ----------
+        depth : int
+            残りの深さ．
+        alpha, beta : int
+            探索窓．
+        ply : int
+            探索開始局面からの手数．
+
+        Returns
+        -------
+        int
+        '''
+        self.nodes += 1
+        self.check_limits()
+        rules = self.rules
+        board = rules.gameboard
+        if depth <= 0 or ply >= MAX_PLY - 1:
+            return self.quiesce(alpha, beta, ply)
+
+        key = rules.zobrist_hash(board)
+        entry = self.tt.probe(key)
+        tt_move = None
+        if entry is not None:
+            tt_move = entry[4]
+            if entry[1] >= depth:
+                score = _from_tt(entry[2], ply)
+                flag = entry[3]
+                if (flag == EXACT
+                        or flag == LOWER and score >= beta
+                        or flag == UPPER and score <= alpha):
+                    return score
+        tablebase = self.tablebase
+        if tablebase is not None and len(board) <= tablebase.max_pieces:
+            found = tablebase.probe(rules)
+            if found is not None:
+                return _tablebase_score(found, ply)
+
+        color = rules.playersturn
+        moves = rules.legal_moves(color, board)
+        if not moves:
+            return -MATE + ply if rules.is_check(color, board) else 0
+        self.order_moves(moves, tt_move, ply)
+
+        alpha_orig = alpha
+        best_score, best_move = -INF, None
+        for move in moves:
+            startpos, endpos, castling, promote = move
+            capture = endpos in board
+            undo = rules.make_move(startpos, endpos, board, castling, promote)
+            try:
+                score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                rules.unmake_move(undo, board)
+            if score > best_score:
+                best_score, best_move = score, move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if not capture and promote is None:
+                    killers = self.killers[ply]
+                    if killers[0] != move:
+                        killers[1] = killers[0]
+                        killers[0] = move
+                    key_h = (board[startpos].name, endpos)
+                    self.history[key_h] = self.history.get(key_h, 0) + depth * depth
+                break
+
+        if best_score <= alpha_orig:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt.store(key, depth, _to_tt(best_score, ply), flag, best_move)
+        return best_score
+
+    def quiesce(self, alpha, beta, ply):
+        '''駒を取る手だけを読み，局面が落ち着いたところで評価する'''
+        self.nodes += 1
+        self.check_limits()
+        stand_pat = evaluate(self.rules)
+        if stand_pat >= beta or ply >= MAX_PLY - 1:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+        rules = self.rules
+        board = rules.gameboard
+        for move in self.capture_moves():
+            undo = rules.make_move(move[0], move[1], board, False, move[3])
+            try:
+                score = -self.quiesce(-beta, -alpha, ply + 1)
+            finally:
+                rules.unmake_move(undo, board)
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def capture_moves(self):
+        '''
+        手番の側の駒を取る合法手を MVV-LVA の順に出力する．
+        最奥段に進むポーンはクイーンになるものとする．
+        '''
+        rules = self.rules
+        board = rules.gameboard
+        color = rules.playersturn
+        enemy = board.occupied[opponent[color]]
+        last_rank = rules.kind.size - 1 if color == W else 0
+        squares_of = board.geometry.squares_of
+        # 王手とピンを1度だけ求め，自分のキングを攻撃させない行先だけを作る
+        _, evasion, pins = board.pins_and_checks(color)
+        moves = []
+        for startpos, piece in list(board.items()):
+            if piece.color != color:
+                continue
+            targets = board.legal_targets(piece, *startpos, evasion, pins) & enemy
+            for endpos in squares_of(targets):
+                promote = Queen if piece.abbr == 'P' and endpos[1] == last_rank else None
+                score = 10 * piece_values[board[endpos].abbr] - piece_values[piece.abbr]
+                moves.append((score, (startpos, endpos, False, promote)))
+        moves.sort(key=lambda item: -item[0])
+        return [move for _, move in moves]
+
+    def order_moves(self, moves, tt_move, ply):
+        '''
+        置換表の手，駒を取る手 (MVV-LVA)，キラームーブ，ヒストリーの順に並べ替える
+        '''
+        board = self.rules.gameboard
+        killers = self.killers[ply]
+        history = self.history
+
+        def key(move):
+            if move == tt_move:
+                return -3 * INF
+            startpos, endpos = move[0], move[1]
+            victim = board.get(endpos)
+            if victim is not None:
+                return -2 * INF - 10 * piece_values[victim.abbr] + piece_values[board[startpos].abbr]
+            if move[3] is not None:
+                return -2 * INF - piece_values[move[3].abbr]
+            if move == killers[0]:
+                return -INF - 2
+            if move == killers[1]:
+                return -INF - 1
+            return -history.get((board[startpos].name, endpos), 0)
+
+        moves.sort(key=key)
@@ -0,0 +1,559 @@
+'''多くの対局を1つのプロセスで受け持つサーバ
+
+asyncio の TCP サーバで，1行に1つの JSON を送り合う．
+対局はつながりとは別に ID で管理するので，つなぎ直しても同じ対局を続けられる．
+指し手は Game と同じ Rules.valid_moves・castle_or_not・kind.promote2 で確かめる．
+
+待っている対局は Rules.snapshot の小さな形 (PackedPosition) だけを持ち，
+最近指された対局の Rules だけを LRU キャッシュに置くので，
+何千もの対局を開いたままにしてもメモリをあまり使わない．
+
+    py server.py serve --port 8765
+    py server.py load --connections 50 --games 2000 --moves 20000
+
+要求と応答 (どちらも1行の JSON．応答には必ず ok がつく)
+
+    {"op": "new", "game": "Normal"}                      -> {"ok": true, "id": 1, "fen": ..., "turn": "W"}
+        game は Normal, Chess960, withUnicorn．pos_id (チェス960 の番号) か fen も指定できる．
+    {"op": "move", "id": 1, "from": [4, 1], "to": [4, 3]} -> {"ok": true, "fen": ..., "turn": "B", "status": "ongoing"}
+        castling (true / false) はキャスリングするかどうかが決まらないときに，
+        promote (駒の略号 'Q' など) はプロモーションのときに必要．
+        座標の代わりに "san": "e4" でもよい．
+    {"op": "moves", "id": 1}                              -> {"ok": true, "moves": [[[4, 1], [4, 3], false, null], ...]}
+    {"op": "state", "id": 1}                              -> {"ok": true, "fen": ..., "turn": "W", "status": "ongoing"}
+    {"op": "close", "id": 1}                              -> {"ok": true}
+    {"op": "stats"}                                       -> {"ok": true, "games": ..., "active": ..., "connections": ...}
+
+status は Rules.game_status の ongoing, check, checkmate, stalemate,
+insufficient material, fifty-move rule, threefold repetition のいずれかで，
+終わった対局の応答には result ('1-0', '0-1', '1/2-1/2') もつく．
+終わった対局には指せない．誤りは {"ok": false, "error": "..."} で返す．
+'''
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import traceback
+from collections import defaultdict
+from time import perf_counter
+
+from cache import LRUCache
+from fen import get_fen, set_fen
+from pgn import parse_san
+from rules import Rules, game_classes, opponent
+from pieces import *
+
+HOST = '127.0.0.1'
+PORT = 8765
+# Rules のまま持っておく対局の数
+ACTIVE_GAMES = 256
+# 1行の長さの上限 (バイト)
+LINE_LIMIT = 1 << 16
+
+
+class MoveError(ValueError):
+    '''要求が正しくない，または指せない手'''
+
+
+class Session:
+    '''
+    1つの対局．局面は Rules.snapshot の形で持つ．
+
+    Attributes
+    ----------
+    snapshot : tuple
+        最後に指した後の局面．
+    result : GameResult
+        最後に指した後の状態．
+    plies : int
+        指した手数．
+    halfmove_clock : int
+        Rules.halfmove_clock．
+    repetitions : dict > {int: int}
+        Rules.repetitions．Rules がキャッシュから消えても引き分けを判定できるように持っておく．
+    '''
+
+    __slots__ = ('snapshot', 'result', 'plies', 'halfmove_clock', 'repetitions')
+
+    def __init__(self, rules, plies=0):
+        self.plies = plies
+        self.update(rules)
+
+    def update(self, rules):
+        '''指した後の rules の局面と状態を持つ'''
+        self.snapshot = rules.snapshot()
+        self.result = rules.result if rules.result is not None else rules.game_status()
+        self.halfmove_clock = rules.halfmove_clock
+        self.repetitions = rules.repetitions
+
+    def restore(self):
+        '''局面から Rules を作り直す'''
+        rules = Rules.from_snapshot(self.snapshot)
+        rules.halfmove_clock = self.halfmove_clock
+        rules.repetitions = self.repetitions
+        rules.result = self.result
+        return rules
+
+    @property
+    def status(self):
+        return self.result.status
+
+    @property
+    def over(self):
+        return self.result.over
+
+
+def validate_move(rules, startpos, endpos, castling=None, promote=None):
+    '''
+    手番の側の手として startpos から endpos へ動かせるか確かめ，
+    make_move に渡すキャスリングかどうかとプロモーション先を決める．
+    Game と同じく，動ける位置は valid_moves で，
+    キャスリングするかどうか決まらない手は castle_or_not で，
+    プロモーション先は kind.promote2 で確かめる．
+
+    Parameters
+    ----------
+    rules : Rules
+        局面．
+    startpos, endpos : tuple > (int, int)
+        開始位置，終了位置．
+    castling : bool or None, default None
+        キャスリングするかどうか．決まらない手のときだけ使う．
+    promote : str or None, default None
+        プロモーション先の駒の略号．
+
+    Returns
+    -------
+    tuple > (bool, class or None)
+        (キャスリングか, プロモーション先)．
+
+    Raises
+    ------
+    MoveError
+        指せない手．
+    '''
+    board = rules.gameboard
+    piece = board.get(startpos)
+    if piece is None or piece.color != rules.playersturn:
+        raise MoveError(f'no piece of the side to move on {list(startpos)}')
+    if endpos not in rules.valid_moves(piece, startpos, board):
+        raise MoveError(f'illegal move: {list(startpos)} -> {list(endpos)}')
+
+    castle = False
+    if rules.kind.castling and piece.abbr == 'K':
+        # キャスリングとしてもふつうの手としても合法な行先か
+        rules.confirm_castling = False
+        rules.castle_or_not(piece, endpos)
+        ambiguous, rules.confirm_castling = rules.confirm_castling, False
+        options = {castling_move for pos, castling_move
+                   in rules.candidate_moves(piece, startpos, board)
+                   if pos == endpos and rules.is_legal(startpos, endpos, board, castling_move)}
+        if ambiguous and len(options) == 2:
+            if castling is None:
+                raise MoveError('castling must be true or false for this move')
+            castle = bool(castling)
+        else:
+            castle = True in options and False not in options
+
+    last_rank = rules.kind.size - 1 if piece.color == W else 0
+    if piece.abbr == 'P' and endpos[1] == last_rank:
+        choices = {cls.abbr: cls for cls in rules.kind.promote2}
+        if promote not in choices:
+            raise MoveError(f'promote must be one of {sorted(choices)}')
+        return castle, choices[promote]
+    if promote is not None:
+        raise MoveError('promote is only for a pawn reaching the last rank')
+    return castle, None
+
+
+def _position(value):
+    if (not isinstance(value, (list, tuple)) or len(value) != 2
+            or not all(isinstance(v, int) and not isinstance(v, bool) for v in value)):
+        raise MoveError(f'a square must be [x, y]: {value!r}')
+    return tuple(value)
+
+
+def move_json(move):
+    '''Rules.legal_moves の形の指し手を JSON にできる形にする'''
+    startpos, endpos, castling, promote = move
+    return [list(startpos), list(endpos), castling,
+            promote.abbr if promote is not None else None]
+
+
+class GameServer:
+    '''
+    対局を ID で管理し，要求に応える
+
+    Parameters
+    ----------
+    active_games : int, default ACTIVE_GAMES
+        Rules のまま持っておく，最近指された対局の数．
+
+    Attributes
+    ----------
+    sessions : dict > {int: Session}
+        開いている対局．
+    active : LRUCache > {int: Rules}
+        最近指された対局の Rules．
+    connections : int
+        つながっているクライアントの数．
+    '''
+
+    def __init__(self, active_games=ACTIVE_GAMES):
+        self.sessions = {}
+        self.active = LRUCache(maxsize=active_games)
+        self.next_id = 1
+        self.connections = 0
+
+    def rules(self, game_id):
+        '''対局の Rules を返す．キャッシュになければ局面から作り直す．'''
+        session = self.session(game_id)
+        rules = self.active.get(game_id)
+        if rules is None:
+            rules = session.restore()
+            self.active.put(game_id, rules)
+        return rules
+
+    def session(self, game_id):
+        try:
+            return self.sessions[game_id]
+        except (KeyError, TypeError):
+            raise MoveError(f'no such game: {game_id!r}') from None
+
+    def state(self, game_id, rules=None):
+        session = self.session(game_id)
+        rules = rules or self.rules(game_id)
+        response = {'ok': True, 'id': game_id,
+                    'fen': get_fen(rules, fullmove=session.plies//2 + 1),
+                    'turn': rules.playersturn, 'status': session.status}
+        if session.over:
+            response['result'] = session.result.result
+        return response
+
+    def new_game(self, game='Normal', pos_id=None, fen=None):
+        '''
+        対局を始める
+
+        Parameters
+        ----------
+        game : str, default 'Normal'
+            ゲームの種類の名前．
+        pos_id : int or None, default None
+            チェス960 の配置の番号 (0 から 959)．None のときは乱数で決める．
+        fen : str or None, default None
+            開始局面．手番でない側がチェックされている局面は受け付けない．
+
+        Returns
+        -------
+        dict
+            応答．
+        '''
+        kind_cls = game_classes.get(game) if isinstance(game, str) else None
+        if kind_cls is None:
+            raise MoveError(f'game must be one of {sorted(game_classes)}')
+        if pos_id is not None and (not isinstance(pos_id, int) or isinstance(pos_id, bool)
+                                   or not 0 <= pos_id < 960):
+            raise MoveError(f'pos_id must be an integer from 0 to 959: {pos_id!r}')
+        try:
+            kind = kind_cls(pos_id) if pos_id is not None else kind_cls()
+        except (TypeError, ValueError) as e:
+            raise MoveError(str(e)) from None
+        if fen is None:
+            rules = Rules(kind)
+        else:
+            if not isinstance(fen, str):
+                raise MoveError(f'fen must be a string: {fen!r}')
+            rules = Rules()
+            rules.kind = kind
+            try:
+                set_fen(rules, fen)
+            except (ValueError, KeyError, IndexError) as e:
+                raise MoveError(f'bad FEN: {e}') from None
+            board = rules.gameboard
+            for color in (W, B):
+                if bin(board.bitboards.get(color + 'K', 0)).count('1') != 1:
+                    raise MoveError(f'bad FEN: {color} must have one king')
+            if rules.is_check(opponent[rules.playersturn], board):
+                raise MoveError('bad FEN: the side not to move is in check')
+        game_id = self.next_id
+        self.next_id += 1
+        self.sessions[game_id] = Session(rules)
+        self.active.put(game_id, rules)
+        return self.state(game_id, rules)
+
+    def move(self, game_id, request):
+        '''
+        手番の側の手を指す
+
+        Parameters
+        ----------
+        game_id : int
+            対局の ID．
+        request : dict
+            from, to (と castling, promote) または san を持つ要求．
+
+        Returns
+        -------
+        dict
+            応答．
+        '''
+        session = self.session(game_id)
+        if session.over:
+            raise MoveError(f'the game is over ({session.status})')
+        rules = self.rules(game_id)
+        if 'san' in request:
+            try:
+                startpos, endpos, castle, promote = parse_san(rules, str(request['san']))
+            except ValueError as e:
+                raise MoveError(str(e)) from None
+        else:
+            startpos, endpos = _position(request.get('from')), _position(request.get('to'))
+            castle, promote = validate_move(rules, startpos, endpos,
+                                            request.get('castling'), request.get('promote'))
+        rules.push(startpos, endpos, castle, promote)
+        session.plies += 1
+        session.update(rules)
+        return self.state(game_id, rules)
+
+    def handle(self, request):
+        '''
+        1つの要求に応える
+
+        Parameters
+        ----------
+        request : dict
+            要求．
+
+        Returns
+        -------
+        dict
+            応答．
+        '''
+        try:
+            if not isinstance(request, dict):
+                raise MoveError('a request must be a JSON object')
+            op = request.get('op')
+            if op == 'new':
+                return self.new_game(request.get('game', 'Normal'),
+                                     request.get('pos_id'), request.get('fen'))
+            if op == 'stats':
+                return {'ok': True, 'games': len(self.sessions), 'active': len(self.active),
+                        'connections': self.connections}
+            game_id = request.get('id')
+            if op == 'move':
+                return self.move(game_id, request)
+            if op == 'moves':
+                rules = self.rules(game_id)
+                moves = ([] if self.session(game_id).over
+                         else rules.legal_moves(rules.playersturn, rules.gameboard))
+                return {'ok': True, 'id': game_id, 'moves': [move_json(m) for m in moves]}
+            if op == 'state':
+                return self.state(game_id)
+            if op == 'close':
+                self.session(game_id)
+                del self.sessions[game_id]
+                self.active.data.pop(game_id, None)
+                return {'ok': True, 'id': game_id}
+            raise MoveError(f'unknown op: {op!r}')
+        except MoveError as e:
+            return {'ok': False, 'error': str(e)}
+        except Exception as e:
+            # 想定していない誤りでも，応答を返してつながりを保つ
+            traceback.print_exc()
+            return {'ok': False, 'error': f'internal error: {type(e).__name__}'}
+
+    async def serve_client(self, reader, writer):
+        '''1つのつながりの要求に順に応える'''
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    writer.write(b'{"ok": false, "error": "line too long"}\n')
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    response = {'ok': False, 'error': 'invalid JSON'}
+                else:
+                    response = self.handle(request)
+                writer.write(json.dumps(response, separators=(',', ':')).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def serve(self, host=HOST, port=PORT):
+        '''サーバを動かし続ける'''
+        server = await asyncio.start_server(self.serve_client, host, port, limit=LINE_LIMIT)
+        addresses = ', '.join(str(sock.getsockname()) for sock in server.sockets)
+        print(f'serving on {addresses}', file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+
+def percentiles(samples, points=(50, 90, 99, 99.9)):
+    '''
+    処理時間の百分位数
+
+    Parameters
+    ----------
+    samples : list > [float, ...]
+        処理時間 (秒)．
+    points : tuple > (float, ...)
+        求める百分位．
+
+    Returns
+    -------
+    dict > {str: float}
+        'p50' などと 'max' ごとの処理時間 (ミリ秒)．
+    '''
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    result = {}
+    for point in points:
+        index = min(len(ordered) - 1, int(len(ordered) * point / 100))
+        result[f'p{point:g}'] = ordered[index] * 1e3
+    result['max'] = ordered[-1] * 1e3
+    return result
+
+
+class LoadClient:
+    '''
+    サーバに対局を開き，合法手をでたらめに指し続けて応答時間を測る
+
+    Parameters
+    ----------
+    host, port : str, int
+        サーバ．
+    connections : int, default 10
+        つながりの数．
+    games : int, default 100
+        開いておく対局の数．つながりに均等に割り振る．
+    moves : int, default 2000
+        全体で指す手数．
+    game : str, default 'Normal'
+        ゲームの種類．
+    seed : int or None, default None
+        乱数の種．
+    '''
+
+    def __init__(self, host=HOST, port=PORT, connections=10, games=100, moves=2000,
+                 game='Normal', seed=None):
+        self.host = host
+        self.port = port
+        self.connections = connections
+        self.games = games
+        self.moves = moves
+        self.game = game
+        self.rng = random.Random(seed)
+        self.latency = defaultdict(list)
+        self.errors = 0
+        self.finished = 0
+        self.remaining = moves
+
+    async def request(self, reader, writer, request):
+        start = perf_counter()
+        writer.write(json.dumps(request).encode() + b'\n')
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        self.latency[request['op']].append(perf_counter() - start)
+        if not response['ok']:
+            self.errors += 1
+        return response
+
+    async def worker(self, games):
+        reader, writer = await asyncio.open_connection(self.host, self.port, limit=LINE_LIMIT)
+        try:
+            ids = [(await self.request(reader, writer, {'op': 'new', 'game': self.game}))['id']
+                   for _ in range(games)]
+            while ids and self.remaining > 0:
+                for i, game_id in enumerate(ids):
+                    if self.remaining <= 0:
+                        break
+                    moves = (await self.request(reader, writer, {'op': 'moves', 'id': game_id}))['moves']
+                    if not moves:
+                        # 終わった対局は閉じて新しく始める
+                        self.finished += 1
+                        await self.request(reader, writer, {'op': 'close', 'id': game_id})
+                        ids[i] = (await self.request(reader, writer,
+                                                     {'op': 'new', 'game': self.game}))['id']
+                        continue
+                    if self.remaining <= 0:
+                        break
+                    self.remaining -= 1
+                    startpos, endpos, castling, promote = self.rng.choice(moves)
+                    await self.request(reader, writer, {'op': 'move', 'id': game_id,
+                                                        'from': startpos, 'to': endpos,
+                                                        'castling': castling, 'promote': promote})
+        finally:
+            writer.close()
+
+    async def run(self):
+        '''
+        負荷をかけ，結果をまとめる
+
+        Returns
+        -------
+        dict
+            指した手数・1秒あたりの手数・要求ごとの応答時間の百分位数など．
+        '''
+        start = perf_counter()
+        shares = [self.games // self.connections + (i < self.games % self.connections)
+                  for i in range(self.connections)]
+        await asyncio.gather(*(self.worker(n) for n in shares if n))
+        elapsed = perf_counter() - start
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        stats = await self.request(reader, writer, {'op': 'stats'})
+        writer.close()
+        played = len(self.latency['move'])
+        return {'moves': played, 'elapsed': elapsed, 'moves_per_second': played / elapsed,
+                'games_finished': self.finished, 'errors': self.errors,
+                'server': {key: stats[key] for key in ('games', 'active', 'connections')},
+                'latency_ms': {op: percentiles(samples)
+                               for op, samples in self.latency.items() if samples}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve many games over line-delimited JSON, '
+                                                 'or put load on such a server.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help='run the game server')
+    serve.add_argument('--host', default=HOST, help=f'address to listen on (default: {HOST})')
+    serve.add_argument('--port', type=int, default=PORT, help=f'port (default: {PORT})')
+    serve.add_argument('--active', type=int, default=ACTIVE_GAMES,
+                       help=f'games kept unpacked in memory (default: {ACTIVE_GAMES})')
+    load = commands.add_parser('load', help='play random moves against a server and report latency')
+    load.add_argument('--host', default=HOST, help=f'server address (default: {HOST})')
+    load.add_argument('--port', type=int, default=PORT, help=f'port (default: {PORT})')
+    load.add_argument('--connections', type=int, default=10, help='connections (default: 10)')
+    load.add_argument('--games', type=int, default=100, help='games kept open (default: 100)')
+    load.add_argument('--moves', type=int, default=2000, help='moves to play in all (default: 2000)')
+    load.add_argument('--game', choices=sorted(game_classes), default='Normal')
+    load.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(GameServer(args.active).serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        return 0
+    client = LoadClient(args.host, args.port, args.connections, args.games, args.moves,
+                        args.game, args.seed)
+    print(json.dumps(asyncio.run(client.run()), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,511 @@
+'''ポーンのない3駒・4駒の終盤の表 (エンドゲームテーブルベース) を作り，引くモジュール
+
+表は後退解析で作る．Rules.legal_moves で各局面の手を数え，
+詰みの局面から1手ずつさかのぼって勝ち・負けと詰みまでの手数を決める．
+駒を取って駒の少ない終盤に移る手は，先に作った小さい表を引く．
+キャスリングのポテンシャルとアンパッサンはないものとする．
+
+表は駒の組み合わせ ('KQK', 'KRKN', 'KUnK' など．白の駒，黒の駒の順) ごとの
+.npy ファイルで，np.load(mmap_mode='r') で開くので必要な部分だけが読まれる．
+値は手番の側から見たもので，
+
+    0       引き分け (または成り立たない局面)
+    n > 0   勝ち．n 手 (片方の手を1手と数える) で詰ませる
+    n < 0   負け．-n - 1 手で詰まされる
+
+駒を取ったり成ったりしても数え直さないので，50手ルールは考えない．
+
+    py tablebase.py generate KQK KRK KUnK
+    py tablebase.py generate KQKR            # 4駒の表はかなり時間がかかる
+    py tablebase.py probe "8/8/8/4k3/8/8/8/4K2Q w - -"
+'''
+
+import argparse
+import os
+import re
+import sys
+from itertools import product
+from time import perf_counter
+
+import numpy as np
+
+from bitboard import Position, SIZE
+from fen import get_fen, set_fen
+from games import Normal
+from pgn import san
+from pieces import *
+from rules import Rules, opponent
+
+# 表を置くフォルダ
+TB_DIR = '../tablebases'
+# 表を作る駒の数の上限
+MAX_PIECES = 4
+
+# 表に使える駒 (キング以外)．駒の組み合わせの名前はこの順に並べる
+PIECE_ORDER = ('Q', 'R', 'Un', 'B', 'N')
+piece_classes = {cls.abbr: cls for cls in (King, Queen, Rook, Unicorn, Bishop, Knight)}
+_side_re = re.compile(r'K((?:Un|[QRBN])*)')
+
+
+def _sort_key(abbr):
+    return PIECE_ORDER.index(abbr)
+
+
+def parse_material(name):
+    '''
+    駒の組み合わせの名前を白と黒の駒の略号のタプルにする
+
+    Parameters
+    ----------
+    name : str
+        'KQK' や 'KRKN' など．
+
+    Returns
+    -------
+    tuple > (tuple, tuple)
+        (白の駒, 黒の駒)．どちらもキングが先頭．
+    '''
+    match = re.fullmatch(r'(K(?:Un|[QRBN])*)(K(?:Un|[QRBN])*)', name)
+    if match is None:
+        raise ValueError(f'not a pawnless material signature: {name}')
+    sides = tuple(('K',) + tuple(sorted(re.findall(r'Un|[QRBN]', _side_re.fullmatch(side).group(1)),
+                                        key=_sort_key))
+                  for side in match.groups())
+    if sum(map(len, sides)) > MAX_PIECES:
+        raise ValueError(f'tablebases have at most {MAX_PIECES} pieces: {name}')
+    return sides
+
+
+def material_name(white, black):
+    '''parse_material の逆'''
+    return ''.join(white) + ''.join(black)
+
+
+def canonical(white, black):
+    '''
+    白と黒の駒を並べ替え，表を引く向きにする．
+    ポーンがなければ色を入れ替えても同じ局面なので，駒の強い方を白にする．
+
+    Returns
+    -------
+    tuple > (tuple, tuple, bool)
+        (白の駒, 黒の駒, 色を入れ替えたか)．
+    '''
+    white = ('K',) + tuple(sorted(white[1:], key=_sort_key))
+    black = ('K',) + tuple(sorted(black[1:], key=_sort_key))
+
+    def strength(side):
+        return len(side), tuple(-_sort_key(abbr) for abbr in side[1:])
+
+    if strength(black) > strength(white):
+        return black, white, True
+    return white, black, False
+
+
+def decode(value):
+    '''
+    表の値を (結果, 手数) にする
+
+    Returns
+    -------
+    tuple > (int, int or None)
+        結果は 1 -- 勝ち, 0 -- 引き分け, -1 -- 負け．引き分けの手数は None．
+    '''
+    value = int(value)
+    if value > 0:
+        return 1, value
+    if value < 0:
+        return -1, -value - 1
+    return 0, None
+
+
+class EndgameKind:
+    '''
+    表を作るときのゲームの種類．駒は並べず，キャスリングもしない．
+
+    Parameters
+    ----------
+    size : int, default SIZE
+        盤面の大きさ．
+    '''
+    castling = False
+    promote2 = []
+    ID = {}
+
+    def __init__(self, size=SIZE):
+        self.size = size
+        # make_move などがキングとルークの初期位置を引くので，1段目の両端にルークを置いておく．
+        # キャスリングのポテンシャルはないので，実際に駒を並べることはない
+        self.placers = {1: [Rook, King] + [None] * (size - 3) + [Rook], 2: [None] * size}
+
+
+class Tablebase:
+    '''
+    フォルダにある表を引く．表は初めて使うときに mmap で開く．
+    pickle するとフォルダのパスだけを渡し，受け取ったプロセスで開き直す．
+
+    Parameters
+    ----------
+    directory : str or None, default TB_DIR
+        表のフォルダ．None のときは generate で作った表をメモリに置くだけにする．
+    size : int, default SIZE
+        盤面の大きさ．
+    '''
+
+    max_pieces = MAX_PIECES
+
+    def __init__(self, directory=TB_DIR, size=SIZE):
+        self.directory = directory
+        self.size = size
+        self.tables = {}
+        # フォルダに保存しない表
+        self.arrays = {}
+
+    def __getstate__(self):
+        return {'directory': self.directory, 'size': self.size}
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'], state['size'])
+
+    def path(self, name):
+        suffix = '' if self.size == SIZE else f'_{self.size}'
+        return os.path.join(self.directory, f'{name}{suffix}.npy')
+
+    def table(self, name):
+        '''駒の組み合わせ name の表．なければ None．'''
+        if name in self.arrays:
+            return self.arrays[name]
+        if self.directory is None:
+            return None
+        if name not in self.tables:
+            path = self.path(name)
+            self.tables[name] = np.load(path, mmap_mode='r') if os.path.exists(path) else None
+        return self.tables[name]
+
+    def available(self):
+        '''フォルダにある表の名前'''
+        names = set(self.arrays)
+        if self.directory is not None and os.path.isdir(self.directory):
+            for file in os.listdir(self.directory):
+                name, ext = os.path.splitext(file)
+                if ext != '.npy':
+                    continue
+                if self.size == SIZE and '_' not in name:
+                    names.add(name)
+                elif name.endswith(f'_{self.size}'):
+                    names.add(name[:-len(f'_{self.size}')])
+        return sorted(names)
+
+    def probe_pieces(self, pieces, side):
+        '''
+        駒の並びと手番から表の値を引く
+
+        Parameters
+        ----------
+        pieces : iterable > (str, (int, int))
+            (駒の名前, 位置)．
+        side : str > 'W' or 'B'
+            手番．
+
+        Returns
+        -------
+        int or None
+            表の値．表がなければ None．
+        '''
+        pieces = list(pieces)
+        white = sorted((_sort_key(name[1:]) if name[1:] != 'K' else -1, pos)
+                       for name, pos in pieces if name[0] == W)
+        black = sorted((_sort_key(name[1:]) if name[1:] != 'K' else -1, pos)
+                       for name, pos in pieces if name[0] == B)
+        if len(white) == 1 and len(black) == 1:
+            # キングだけなら引き分け
+            return 0
+        w_abbr = tuple('K' if k < 0 else PIECE_ORDER[k] for k, _ in white)
+        b_abbr = tuple('K' if k < 0 else PIECE_ORDER[k] for k, _ in black)
+        w_abbr, b_abbr, swapped = canonical(w_abbr, b_abbr)
+        table = self.table(material_name(w_abbr, b_abbr))
+        if table is None:
+            return None
+        if swapped:
+            white, black = black, white
+            side = opponent[side]
+        return int(table[self.index([pos for _, pos in white + black], side)])
+
+    def index(self, squares, side):
+        '''駒の位置 (白の駒，黒の駒の順) と手番から表の番号を求める'''
+        n = self.size * self.size
+        idx = 0 if side == W else 1
+        for x, y in squares:
+            idx = idx * n + x + self.size*y
+        return idx
+
+    def probe(self, rules):
+        '''
+        rules の局面を表で引く
+
+        Parameters
+        ----------
+        rules : Rules
+            局面．
+
+        Returns
+        -------
+        tuple > (int, int or None) or None
+            decode の結果．表にない局面なら None．
+        '''
+        board = rules.gameboard
+        if (len(board) > self.max_pieces or board.size != self.size
+                or any(rules.can_castling[W]) or any(rules.can_castling[B])):
+            return None
+        if any(piece.abbr not in piece_classes for piece in board.values()):
+            return None
+        value = self.probe_pieces(((piece.name, pos) for pos, piece in board.items()),
+                                  rules.playersturn)
+        return None if value is None else decode(value)
+
+    def best_move(self, rules, legal=None):
+        '''
+        表にある局面で最善の手を選ぶ．
+        勝ちなら最も早く詰ませる手，負けなら最も長く粘る手，引き分けなら引き分けを保つ手．
+
+        Parameters
+        ----------
+        rules : Rules
+            局面．
+        legal : list or None, default None
+            Rules.legal_moves の出力．
+
+        Returns
+        -------
+        tuple or None
+            指し手．表にない局面なら None．
+        '''
+        if self.probe(rules) is None:
+            return None
+        board = rules.gameboard
+        if legal is None:
+            legal = rules.legal_moves(rules.playersturn, board)
+        best, best_key = None, None
+        for move in legal:
+            undo = rules.make_move(move[0], move[1], board, move[2], move[3])
+            try:
+                found = self.probe(rules)
+            finally:
+                rules.unmake_move(undo, board)
+            if found is None:
+                continue
+            # 相手から見た結果なので，相手が早く詰む手が最もよく，相手が勝つなら長く粘る手を選ぶ
+            result, dtm = found
+            key = (-result, -dtm if result < 0 else 0 if result == 0 else dtm)
+            if best_key is None or key > best_key:
+                best, best_key = move, key
+        return best
+
+
+def _new_rules(size):
+    rules = Rules()
+    rules.kind = EndgameKind(size)
+    rules.gameboard = Position(size=size)
+    rules.can_castling = {W: [False, False], B: [False, False]}
+    return rules
+
+
+def generate(name, tablebase=None, log=None):
+    '''
+    駒の組み合わせ name の表を後退解析で作る．
+    駒を取った後の小さい表がなければ先に作る．
+
+    Parameters
+    ----------
+    name : str
+        'KQK' など．
+    tablebase : Tablebase or None, default None
+        小さい表を引き，作った表を保存する先．None のときは TB_DIR の Tablebase．
+    log : file-like or None, default None
+        進み具合の表示先．
+
+    Returns
+    -------
+    np.ndarray > dtype int16
+        表．
+    '''
+    tablebase = tablebase if tablebase is not None else Tablebase()
+    white, black = parse_material(name)
+    white, black, _ = canonical(white, black)
+    name = material_name(white, black)
+    # 駒を取った後の表
+    for side, rest in ((white, black), (black, white)):
+        for i in range(1, len(side)):
+            smaller = side[:i] + side[i + 1:]
+            if len(smaller) + len(rest) > 2:
+                w, b, _ = canonical(smaller, rest) if side is white else canonical(rest, smaller)
+                sub = material_name(w, b)
+                if tablebase.table(sub) is None:
+                    generate(sub, tablebase, log)
+
+    start = perf_counter()
+    size = tablebase.size
+    n = size * size
+    names = [W + abbr for abbr in white] + [B + abbr for abbr in black]
+    count = len(names)
+    total = 2 * n ** count
+    rules = _new_rules(size)
+    board = rules.gameboard
+
+    legal = np.zeros(total, dtype=bool)
+    done = np.zeros(total, dtype=bool)
+    # 結果の決まっていない，表の中に留まる手の数
+    remaining = np.zeros(total, dtype=np.uint8)
+    # 駒を取る手で引き分け以上にできる
+    escape = np.zeros(total, dtype=bool)
+    # 駒を取る手で負けるときの最も長い手数
+    worst_loss = np.zeros(total, dtype=np.int16)
+    scores = np.zeros(total, dtype=np.int16)
+    # 手数ごとの，結果の決まりそうな局面 [(番号, 勝ちか), ...]
+    buckets = {}
+
+    def push(d, idx, win):
+        buckets.setdefault(d, []).append((idx, win))
+
+    squares = [(x, y) for y in range(size) for x in range(size)]
+    # 1. すべての局面の手を数える
+    for side_index, side in enumerate((W, B)):
+        for placement in product(range(n), repeat=count):
+            if len(set(placement)) < count:
+                continue
+            board.clear()
+            for piece_name, sq in zip(names, placement):
+                board[squares[sq]] = piece_classes[piece_name[1:]](piece_name[0])
+            # 手番でない側がチェックされている局面は成り立たない
+            if rules.is_check(opponent[side], board):
+                continue
+            idx = side_index
+            for sq in placement:
+                idx = idx * n + sq
+            legal[idx] = True
+            rules.playersturn = side
+            moves = rules.legal_moves(side, board)
+            if not moves:
+                if rules.is_check(side, board):
+                    push(0, idx, False)
+                else:
+                    done[idx] = True
+                continue
+            best_win = None
+            for startpos, endpos, _, _ in moves:
+                if endpos not in board:
+                    remaining[idx] += 1
+                    continue
+                undo = rules.make_move(startpos, endpos, board)
+                try:
+                    value = tablebase.probe_pieces(
+                        ((piece.name, pos) for pos, piece in board.items()), opponent[side])
+                finally:
+                    rules.unmake_move(undo, board)
+                result, dtm = decode(value)
+                if result < 0:
+                    best_win = dtm + 1 if best_win is None else min(best_win, dtm + 1)
+                    escape[idx] = True
+                elif result == 0:
+                    escape[idx] = True
+                else:
+                    worst_loss[idx] = max(worst_loss[idx], dtm + 1)
+            if best_win is not None:
+                push(best_win, idx, True)
+            elif remaining[idx] == 0 and not escape[idx]:
+                push(int(worst_loss[idx]), idx, False)
+    if log is not None:
+        print(f'{name}: {int(legal.sum())} positions counted in {perf_counter() - start:.1f} s',
+              file=log, flush=True)
+
+    # 2. 結果の決まった局面から1手ずつさかのぼる
+    while buckets:
+        d = min(buckets)
+        for idx, win in buckets.pop(d):
+            if done[idx]:
+                continue
+            done[idx] = True
+            scores[idx] = d if win else -d - 1
+            # 局面を組み立て，直前に動いた側 (手番でない側) の駒を戻す
+            side_index, rest = divmod(idx, n ** count)
+            placement = []
+            for _ in range(count):
+                rest, sq = divmod(rest, n)
+                placement.append(sq)
+            placement.reverse()
+            board.clear()
+            for piece_name, sq in zip(names, placement):
+                board[squares[sq]] = piece_classes[piece_name[1:]](piece_name[0])
+            mover = B if side_index == 0 else W
+            occupied = board.occupied[W] | board.occupied[B]
+            for slot, piece_name in enumerate(names):
+                if piece_name[0] != mover:
+                    continue
+                pos = squares[placement[slot]]
+                targets = board.attacks_from(board[pos], *pos) & ~occupied
+                for x, y in board.geometry.squares_of(targets):
+                    prev = 1 - side_index
+                    for i, sq in enumerate(placement):
+                        prev = prev * n + (x + size*y if i == slot else sq)
+                    if not legal[prev] or done[prev]:
+                        continue
+                    if not win:
+                        push(d + 1, prev, True)
+                    else:
+                        remaining[prev] -= 1
+                        if remaining[prev] == 0 and not escape[prev]:
+                            push(max(d + 1, int(worst_loss[prev])), prev, False)
+
+    if tablebase.directory is not None:
+        os.makedirs(tablebase.directory, exist_ok=True)
+        out = np.lib.format.open_memmap(tablebase.path(name), mode='w+',
+                                        dtype=np.int16, shape=scores.shape)
+        out[:] = scores
+        out.flush()
+        del out
+        tablebase.tables.pop(name, None)
+    else:
+        tablebase.arrays[name] = scores
+    if log is not None:
+        wins = int((scores > 0).sum())
+        losses = int((scores < 0).sum())
+        longest = int(scores.max()) if wins else 0
+        print(f'{name}: {wins} wins, {losses} losses, longest mate {longest} plies '
+              f'({perf_counter() - start:.1f} s)', file=log, flush=True)
+    return scores
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate and probe pawnless endgame tablebases.')
+    parser.add_argument('--dir', default=TB_DIR, help=f'tablebase directory (default: {TB_DIR})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    gen = commands.add_parser('generate', help='generate tables, e.g. KQK KRK KUnK KQKR')
+    gen.add_argument('materials', nargs='+')
+    probe = commands.add_parser('probe', help='look up a FEN position and its best move')
+    probe.add_argument('fen')
+    args = parser.parse_args(argv)
+
+    tablebase = Tablebase(args.dir)
+    if args.command == 'generate':
+        for name in args.materials:
+            generate(name, tablebase, log=sys.stderr)
+        return 0
+
+    rules = Rules()
+    rules.kind = Normal()
+    set_fen(rules, args.fen)
+    found = tablebase.probe(rules)
+    if found is None:
+        print('not in the tablebase')
+        return 1
+    result, dtm = found
+    text = {1: f'win in {dtm} plies', 0: 'draw', -1: f'loss in {dtm} plies'}[result]
+    move = tablebase.best_move(rules)
+    if move is not None:
+        text += f', best move {san(rules, move)}'
+    print(f'{get_fen(rules)}: {text}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
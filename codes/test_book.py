@@ -0,0 +1,93 @@
+'''book.py のテスト
+
+    py -m unittest test_book
+'''
+
+import os
+import random
+import tempfile
+import unittest
+
+from book import OpeningBook, build_book, decode_move, encode_move, write_book
+from games import Normal
+from pgn import read_games
+from pieces import *
+from rules import Rules
+
+PGN = '''[Event "a"]
+
+1. e4 e5 2. Nf3 Nc6 *
+
+[Event "b"]
+
+1. e4 c5 *
+
+[Event "c"]
+
+1. d4 d5 *
+'''
+
+
+class BookTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'book.bin')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_encode_move(self):
+        for move in [((4, 1), (4, 3), False, None), ((4, 0), (6, 0), True, None),
+                     ((0, 6), (0, 7), False, Queen), ((7, 6), (7, 7), False, Unicorn)]:
+            self.assertEqual(decode_move(*encode_move(move)), move)
+
+    def test_binary_search(self):
+        # 同じハッシュの項目が並ぶところも含めて，どのハッシュも二分探索で見つかるか
+        rng = random.Random(0)
+        keys = sorted({rng.randrange(1, (1 << 64) - 1) for _ in range(300)})
+        counts = {}
+        for i, key in enumerate(keys):
+            for j in range(i % 3 + 1):
+                counts[(key, j, 16 + j, 0, 0)] = j + 1
+        self.assertEqual(write_book(counts, self.path), len(counts))
+        with OpeningBook(self.path) as book:
+            self.assertEqual(len(book), len(counts))
+            for i, key in enumerate(keys):
+                # 出現回数の多い順に並ぶ
+                expected = [(j, 16 + j, 0, 0, j + 1) for j in reversed(range(i % 3 + 1))]
+                self.assertEqual(book.entries(key), expected)
+            for key in (0, keys[0] - 1, keys[100] + 1, keys[-1] + 1):
+                self.assertEqual(book.entries(key), [])
+
+    def test_min_count(self):
+        counts = {(5, 0, 16, 0, 0): 1, (5, 1, 17, 0, 0): 3}
+        self.assertEqual(write_book(counts, self.path, min_count=2), 1)
+        with OpeningBook(self.path) as book:
+            self.assertEqual(book.entries(5), [(1, 17, 0, 0, 3)])
+
+    def test_build_from_pgn(self):
+        build_book(read_games(PGN.splitlines()), self.path)
+        with OpeningBook(self.path) as book:
+            rules = Rules(Normal())
+            legal = rules.legal_moves(rules.playersturn, rules.gameboard)
+            self.assertEqual(book.moves(rules, legal),
+                             [(((4, 1), (4, 3), False, None), 2),
+                              (((3, 1), (3, 3), False, None), 1)])
+            rules.push((4, 1), (4, 3))
+            self.assertEqual(sorted(move for move, _ in book.moves(rules)),
+                             [((2, 6), (2, 4), False, None), ((4, 6), (4, 4), False, None)])
+            # 定跡にない局面
+            rules.push((2, 6), (2, 5))
+            self.assertEqual(book.moves(rules), [])
+            self.assertIsNone(book.choose(rules))
+
+    def test_not_a_book(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a book at all')
+        with self.assertRaises(ValueError):
+            OpeningBook(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+'''server.py のテスト
+
+    py -m unittest test_server
+'''
+
+import unittest
+
+from pgn import new_rules
+from pieces import *
+from server import MoveError, validate_move
+
+
+def position(fen, variant='Standard'):
+    rules, _ = new_rules({'Variant': variant, 'FEN': fen})
+    return rules
+
+
+class ValidateMoveTest(unittest.TestCase):
+
+    def test_ordinary_move(self):
+        rules = position('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1')
+        self.assertEqual(validate_move(rules, (4, 1), (4, 3)), (False, None))
+        self.assertEqual(validate_move(rules, (6, 0), (5, 2)), (False, None))
+        with self.assertRaises(MoveError):
+            validate_move(rules, (4, 1), (4, 4))
+        # 相手の駒と空のマス
+        with self.assertRaises(MoveError):
+            validate_move(rules, (4, 6), (4, 4))
+        with self.assertRaises(MoveError):
+            validate_move(rules, (4, 3), (4, 4))
+
+    def test_castling(self):
+        rules = position('r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1')
+        self.assertEqual(validate_move(rules, (4, 0), (6, 0)), (True, None))
+        self.assertEqual(validate_move(rules, (4, 0), (2, 0)), (True, None))
+        self.assertEqual(validate_move(rules, (4, 0), (5, 0)), (False, None))
+        rules = position('r3k2r/8/8/8/8/8/8/R3K2R b KQkq - 0 1')
+        self.assertEqual(validate_move(rules, (4, 7), (6, 7)), (True, None))
+
+    def test_castling_not_allowed(self):
+        # キャスリングのポテンシャルがない
+        with self.assertRaises(MoveError):
+            validate_move(position('r3k2r/8/8/8/8/8/8/R3K2R w - - 0 1'), (4, 0), (6, 0))
+        # キングの通るマスが攻撃されている
+        with self.assertRaises(MoveError):
+            validate_move(position('r3k2r/8/8/8/8/8/5r2/R3K2R w KQkq - 0 1'), (4, 0), (6, 0))
+
+    def test_chess960_castling(self):
+        rules = position('4k3/8/8/8/8/8/8/RK4R1 w AG - 0 1', 'Chess960')
+        # c1 へはキャスリングでもふつうの手でも行けるので，どちらか指定する
+        with self.assertRaises(MoveError):
+            validate_move(rules, (1, 0), (2, 0))
+        self.assertEqual(validate_move(rules, (1, 0), (2, 0), castling=True), (True, None))
+        self.assertEqual(validate_move(rules, (1, 0), (2, 0), castling=False), (False, None))
+        # g1 へはキャスリングでしか行けない
+        self.assertEqual(validate_move(rules, (1, 0), (6, 0)), (True, None))
+        self.assertEqual(validate_move(rules, (1, 0), (6, 0), castling=False), (True, None))
+
+    def test_promotion(self):
+        rules = position('7k/P7/8/8/8/8/8/K7 w - - 0 1')
+        for cls in rules.kind.promote2:
+            self.assertEqual(validate_move(rules, (0, 6), (0, 7), promote=cls.abbr), (False, cls))
+        for promote in (None, 'K', 'P', 'Un'):
+            with self.assertRaises(MoveError):
+                validate_move(rules, (0, 6), (0, 7), promote=promote)
+        # 最奥段に進まない手には promote をつけない
+        with self.assertRaises(MoveError):
+            validate_move(rules, (0, 0), (1, 0), promote='Q')
+
+    def test_promotion_to_unicorn(self):
+        rules = position('7k/P7/8/8/8/8/8/K7 w - - 0 1', 'withUnicorn')
+        self.assertEqual(validate_move(rules, (0, 6), (0, 7), promote='Un'), (False, Unicorn))
+
+
+if __name__ == '__main__':
+    unittest.main()
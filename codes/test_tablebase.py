@@ -0,0 +1,64 @@
+'''tablebase.py のテスト
+
+KQK と KRK の表をメモリに作ってから引くので，1, 2分かかる．
+
+    py -m unittest test_tablebase
+'''
+
+import unittest
+
+import numpy as np
+
+from pgn import new_rules
+from tablebase import Tablebase, generate
+
+
+def position(fen):
+    rules, _ = new_rules({'FEN': fen})
+    return rules
+
+
+class TablebaseTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tablebase = Tablebase(None)
+        generate('KQK', cls.tablebase)
+        generate('KRK', cls.tablebase)
+
+    def probe(self, fen):
+        return self.tablebase.probe(position(fen))
+
+    def test_longest_win(self):
+        # 最も長い詰みは KQK が10手，KRK が16手 (詰ませる側の手番から数えて19手，31手)
+        self.assertEqual(int(np.max(self.tablebase.table('KQK'))), 19)
+        self.assertEqual(int(np.max(self.tablebase.table('KRK'))), 31)
+
+    def test_mate_in_one(self):
+        self.assertEqual(self.probe('k7/7Q/1K6/8/8/8/8/8 w - - 0 1'), (1, 1))
+        self.assertEqual(self.probe('k7/8/1K6/8/8/8/8/6R1 w - - 0 1'), (1, 1))
+        # 黒が駒を持つ局面は色を入れ替えて引く
+        self.assertEqual(self.probe('K7/8/1k6/8/8/8/8/6q1 b - - 0 1'), (1, 1))
+
+    def test_checkmate_and_stalemate(self):
+        self.assertEqual(self.probe('kQ6/2K5/8/8/8/8/8/8 b - - 0 1'), (-1, 0))
+        self.assertEqual(self.probe('R1k5/8/2K5/8/8/8/8/8 b - - 0 1'), (-1, 0))
+        self.assertEqual(self.probe('k7/2Q5/1K6/8/8/8/8/8 b - - 0 1'), (0, None))
+
+    def test_hanging_piece(self):
+        # 取られるルークやクイーンは引き分け
+        self.assertEqual(self.probe('8/8/8/8/8/8/kR6/7K b - - 0 1'), (0, None))
+        self.assertEqual(self.probe('8/8/8/8/8/8/kQ6/7K b - - 0 1'), (0, None))
+
+    def test_best_move_mates(self):
+        rules = position('k7/7Q/1K6/8/8/8/8/8 w - - 0 1')
+        move = self.tablebase.best_move(rules)
+        self.assertEqual(rules.push(*move).status, 'checkmate')
+
+    def test_not_in_tablebase(self):
+        self.assertIsNone(self.probe('k7/8/1K6/8/8/8/P7/8 w - - 0 1'))
+        self.assertIsNone(self.probe('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+'''tournament.py のテスト
+
+    py -m unittest test_tournament
+'''
+
+import math
+import unittest
+
+from tournament import (check_settings, elo, expected_score, match_stats, parse_engine,
+                        score_of, sprt, summarize)
+
+
+def record(white, black, result, settings=None):
+    return {'round': 0, 'white': white, 'black': black, 'result': result, 'plies': 10,
+            'cpu': {'W': 1.0, 'B': 2.0}, 'nodes': {'W': 100, 'B': 300},
+            'engines': settings or {white: {}, black: {}}}
+
+
+class StatsTest(unittest.TestCase):
+
+    def test_elo(self):
+        # 得点率 3/4 は 400 log10(3) の差
+        self.assertAlmostEqual(elo(0.75), 400 * math.log10(3))
+        self.assertAlmostEqual(elo(0.5), 0.0)
+        self.assertAlmostEqual(elo(0.25), -elo(0.75))
+        for diff in (-300, -20, 0, 5, 100):
+            self.assertAlmostEqual(elo(expected_score(diff)), diff)
+
+    def test_match_stats(self):
+        stats = match_stats(3, 0, 1)
+        self.assertEqual(stats['score'], 0.75)
+        self.assertAlmostEqual(stats['elo'], 190.8485018879)
+        # LOS = Φ((W - L) / √(W + L)) = Φ(1)
+        self.assertAlmostEqual(stats['los'], 0.8413447461)
+        stats = match_stats(10, 5, 10)
+        self.assertAlmostEqual(stats['elo'], 0.0)
+        self.assertAlmostEqual(stats['elo_low'], -stats['elo_high'])
+        self.assertEqual(stats['los'], 0.5)
+        self.assertEqual(match_stats(0, 0, 0),
+                         {'elo': 0.0, 'elo_low': 0.0, 'elo_high': 0.0, 'los': 0.5, 'score': 0.5})
+
+    def test_sprt(self):
+        result = sprt(0, 0, 0)
+        self.assertEqual(result['llr'], 0.0)
+        self.assertIsNone(result['verdict'])
+        # 境界は log(β / (1 - α)) と log((1 - β) / α)
+        self.assertAlmostEqual(result['lower'], math.log(0.05 / 0.95))
+        self.assertAlmostEqual(result['upper'], math.log(0.95 / 0.05))
+        # 得点率 0.7，分散 0.16 の100局で，elo0 = 0, elo1 = 5
+        self.assertAlmostEqual(sprt(60, 20, 20)['llr'], 0.8832073384)
+        self.assertIsNone(sprt(60, 20, 20)['verdict'])
+        self.assertEqual(sprt(600, 200, 200)['verdict'], 'H1')
+        self.assertEqual(sprt(200, 200, 600)['verdict'], 'H0')
+        # 引き分けだけでは分散が 0 なので決まらない
+        self.assertEqual(sprt(0, 50, 0)['llr'], 0.0)
+
+
+class ResultsTest(unittest.TestCase):
+
+    def test_score_of(self):
+        self.assertEqual(score_of(record('a', 'b', '1-0'), 'a'), 1.0)
+        self.assertEqual(score_of(record('a', 'b', '1-0'), 'b'), 0.0)
+        self.assertEqual(score_of(record('a', 'b', '0-1'), 'b'), 1.0)
+        self.assertEqual(score_of(record('a', 'b', '1/2-1/2'), 'a'), 0.5)
+
+    def test_summarize(self):
+        records = [record('a', 'b', '1-0'), record('b', 'a', '1-0'), record('b', 'a', '1/2-1/2'),
+                   record('a', 'c', '0-1')]
+        summary = summarize(records)
+        pairs = {(p['engine'], p['opponent']): (p['wins'], p['draws'], p['losses'])
+                 for p in summary['pairs']}
+        self.assertEqual(pairs, {('a', 'b'): (1, 1, 1), ('a', 'c'): (0, 0, 1)})
+        a = summary['engines']['a']
+        self.assertEqual((a['games'], a['score']), (4, 1.5))
+        # 白で2局 (5手ずつ)，黒で2局 (5手ずつ)
+        self.assertEqual(a['moves'], 20)
+        self.assertEqual(a['cpu'], 6.0)
+        self.assertEqual(a['nodes_per_cpu_second'], 800 / 6.0)
+
+    def test_check_settings(self):
+        engines = dict(parse_engine(spec) for spec in ('a:nodes=300', 'b:nodes=300,tt=4096'))
+        same = {'a': {'node_limit': 300}, 'b': {'node_limit': 300, 'tt_size': 4096}}
+        check_settings([record('a', 'b', '1-0', same)], engines)
+        # ほかの名前の対局は比べない
+        check_settings([record('c', 'd', '1-0', {'c': {}, 'd': {}})], engines)
+        changed = dict(same, b={'node_limit': 300, 'tt_size': 8192})
+        with self.assertRaises(ValueError):
+            check_settings([record('a', 'b', '1-0', changed)], engines)
+        with self.assertRaises(ValueError):
+            check_settings([dict(record('b', 'c', '1-0'), engines={})], engines)
+
+
+if __name__ == '__main__':
+    unittest.main()
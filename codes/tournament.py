@@ -0,0 +1,539 @@
+'''探索の設定どうしを対局させて強さを比べるコマンド
+
+設定の組ごとに，同じ序盤から先手と後手を入れ替えた2局ずつを，
+games.game_dict のゲームの種類を順に使ってワーカープロセスで並列に指す．
+1局ごとの結果は終わった順に JSON Lines でファイルに追記するので，
+途中で止めても同じコマンドで続きから指せる (設定を変えたときは別のファイルか名前にする)．
+最後に組ごとの勝ち・引き分け・負けから Elo の差と SPRT の対数尤度比を表示する．
+
+    py tournament.py --engine base:time=0.1 --engine tt20:time=0.1,tt=1048576 --games 200 -o results.jsonl
+    py tournament.py --engine base:nodes=2000 --engine new:nodes=2000,module=search_new --sprt 0 10
+    py tournament.py --report results.jsonl
+
+設定は 名前:キー=値,... の形で書く．キーは
+    time (1手の思考時間 (秒)), nodes (1手の局面数の上限), depth (深さの上限),
+    tt (置換表の項目数), book (定跡ファイル), tablebase (終盤の表のフォルダ),
+    module (Engine を持つモジュール．既定は search)
+'''
+
+import argparse
+import importlib
+import json
+import math
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import combinations
+from time import perf_counter, process_time
+
+from fen import get_fen
+from games import game_dict, Chess960
+from pgn import export_game, format_game, PGNGame
+from rules import Rules
+from pieces import *
+
+# 設定のキーと Engine の引数
+ENGINE_OPTIONS = {'time': ('time_limit', float), 'nodes': ('node_limit', int),
+                  'depth': ('max_depth', int), 'tt': ('tt_size', int),
+                  'book': ('book', str), 'tablebase': ('tablebase', str),
+                  'module': ('module', str)}
+# 対局するゲームの種類
+VARIANTS = tuple(kind for kinds in game_dict.values() for kind in kinds)
+variant_classes = {kind.__name__: kind for kind in VARIANTS}
+# 引き分けにする手数 (1手は片方の指し手)
+MAX_PLIES = 400
+
+
+def parse_engine(spec):
+    '''
+    名前:キー=値,... の形の設定を読む
+
+    Returns
+    -------
+    tuple > (str, dict)
+        (名前, Engine の引数)．モジュールは 'module' に入る．
+
+    Raises
+    ------
+    ValueError
+        読めない設定．
+    '''
+    name, _, options = spec.partition(':')
+    if not name:
+        raise ValueError(f'an engine needs a name: {spec}')
+    kwargs = {}
+    for item in filter(None, options.split(',')):
+        key, sep, value = item.partition('=')
+        if not sep or key not in ENGINE_OPTIONS:
+            raise ValueError(f'unknown engine option {item!r}; use {", ".join(ENGINE_OPTIONS)}')
+        arg, convert = ENGINE_OPTIONS[key]
+        kwargs[arg] = None if value.lower() == 'none' else convert(value)
+    return name, kwargs
+
+
+def make_engine(kwargs):
+    '''parse_engine の引数から探索を作る'''
+    kwargs = dict(kwargs)
+    module = importlib.import_module(kwargs.pop('module', None) or 'search')
+    if kwargs.get('book'):
+        from book import OpeningBook
+        kwargs['book'] = OpeningBook(kwargs['book'])
+    if kwargs.get('tablebase'):
+        from tablebase import Tablebase
+        kwargs['tablebase'] = Tablebase(kwargs['tablebase'])
+    return module.Engine(**kwargs)
+
+
+def opening(kind_cls, seed, plies):
+    '''
+    乱数の種 seed から序盤の局面を作る．
+    同じ種からは同じ局面になるので，先後を入れ替えた2局で同じ序盤を使える．
+
+    Parameters
+    ----------
+    kind_cls : class
+        ゲームの種類．
+    seed : int
+        乱数の種．
+    plies : int
+        でたらめに指す手数．
+
+    Returns
+    -------
+    Rules
+    '''
+    rng = random.Random(seed)
+    while True:
+        kind = kind_cls(rng=rng) if kind_cls is Chess960 else kind_cls()
+        rules = Rules(kind)
+        for _ in range(plies):
+            moves = rules.legal_moves(rules.playersturn, rules.gameboard)
+            if not moves:
+                break
+            move = rng.choice(moves)
+            rules.make_move(move[0], move[1], rules.gameboard, move[2], move[3])
+        # 序盤だけで終わってしまう局面は選び直す
+        if rules.legal_moves(rules.playersturn, rules.gameboard):
+            return rules
+
+
+def play_game(job, engines, max_plies=MAX_PLIES):
+    '''
+    1局を指す (ワーカープロセスで呼ぶ)
+
+    Parameters
+    ----------
+    job : dict
+        round, white, black, variant, seed, opening_plies を持つ対局の指定．
+    engines : dict > {str: dict}
+        名前ごとの Engine の引数．
+    max_plies : int, default MAX_PLIES
+        この手数で引き分けにする．
+
+    Returns
+    -------
+    dict
+        job に result, reason, plies, fen (開始局面), headers (PGN のタグ), moves (SAN),
+        cpu, nodes, depth (色ごとの CPU 時間の合計 (秒)，局面数，読んだ深さの平均),
+        engines (対局した2つの設定の Engine の引数) を加えたもの．
+    '''
+    rules = opening(variant_classes[job['variant']], job['seed'], job['opening_plies'])
+    start = Rules.from_snapshot(rules.snapshot())
+    players = {W: make_engine(engines[job['white']]), B: make_engine(engines[job['black']])}
+    cpu = {W: 0.0, B: 0.0}
+    nodes = {W: 0, B: 0}
+    depths = {W: [], B: []}
+    played = []
+    result, reason = '1/2-1/2', 'max plies'
+    # 50手ルールと同じ局面の繰り返しは序盤の後から数える
+    rules.record_position(reset=True)
+    status = rules.game_status()
+    for _ in range(max_plies):
+        if status.over:
+            result, reason = status.result, status.status
+            break
+        moves = rules.legal_moves(rules.playersturn, rules.gameboard)
+        color = rules.playersturn
+        engine = players[color]
+        before = process_time()
+        move = engine.search(rules)
+        cpu[color] += process_time() - before
+        nodes[color] += engine.nodes
+        if engine.depth:
+            depths[color].append(engine.depth)
+        if move not in moves:
+            # 合法でない手を返した側の負け
+            result, reason = ('0-1' if color == W else '1-0'), 'illegal move'
+            break
+        status = rules.push(*move)
+        played.append(move)
+    game = export_game(start, played, result=result)
+    return dict(job, result=result, reason=reason, plies=len(played),
+                fen=get_fen(start), headers=game.headers, moves=game.moves,
+                engines={name: engines[name] for name in (job['white'], job['black'])},
+                cpu={color: cpu[color] for color in (W, B)},
+                nodes={color: nodes[color] for color in (W, B)},
+                depth={color: sum(d) / len(d) if d else 0.0 for color, d in depths.items()})
+
+
+def schedule(names, games, variants, opening_plies, seed=0):
+    '''
+    対局の指定を作る．組ごとに，同じ序盤で先後を入れ替えた2局を続けて並べる．
+
+    Parameters
+    ----------
+    names : list > [str, ...]
+        設定の名前．すべての組み合わせで対局する．
+    games : int
+        組ごとの対局数 (偶数にそろえる)．
+    variants : list > [str, ...]
+        ゲームの種類の名前．序盤ごとに順に使う．
+    opening_plies : int
+        序盤にでたらめに指す手数．
+    seed : int, default 0
+        序盤の乱数の種の基準．
+
+    Returns
+    -------
+    list > [dict, ...]
+    '''
+    jobs = []
+    for a, b in combinations(names, 2):
+        for pair in range((games + 1) // 2):
+            variant = variants[pair % len(variants)]
+            for white, black in ((a, b), (b, a)):
+                jobs.append({'round': len(jobs), 'white': white, 'black': black,
+                             'variant': variant, 'seed': seed + pair,
+                             'opening_plies': opening_plies})
+    return jobs
+
+
+def _key(job):
+    return (job['white'], job['black'], job['variant'], job['seed'], job['opening_plies'])
+
+
+def load_results(path):
+    '''結果のファイルを読む．なければ空のリスト．'''
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check_settings(records, engines):
+    '''
+    records の対局が engines と同じ名前で別の設定を使っていれば ValueError を送出する．
+    名前だけで続きを指すと，設定を変えても前の対局が使われてしまうため．
+
+    Parameters
+    ----------
+    records : list > [dict, ...]
+        play_game の返り値．
+    engines : dict > {str: dict}
+        名前ごとの Engine の引数．
+
+    Raises
+    ------
+    ValueError
+        設定の違う対局がある．
+    '''
+    # ファイルに書いたものと比べられるよう，JSON を通した形にそろえる
+    settings = json.loads(json.dumps(engines))
+    for record in records:
+        stored = record.get('engines', {})
+        for name in (record['white'], record['black']):
+            if name in settings and stored.get(name) != settings[name]:
+                raise ValueError(f'{name!r} played round {record["round"] + 1} with other settings '
+                                 f'({stored.get(name)}); use another output file or engine name')
+
+
+def score_of(record, name):
+    '''対局の結果を name から見た点数 (1, 0.5, 0) にする'''
+    if record['result'] == '1/2-1/2':
+        return 0.5
+    white_won = record['result'] == '1-0'
+    return 1.0 if white_won == (record['white'] == name) else 0.0
+
+
+def elo(score):
+    '''期待得点を Elo の差にする'''
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def expected_score(elo_diff):
+    '''Elo の差を期待得点にする'''
+    return 1 / (1 + 10 ** (-elo_diff / 400))
+
+
+def match_stats(wins, draws, losses):
+    '''
+    勝ち・引き分け・負けの数から Elo の差とその 95% 信頼区間，優位の確率を求める
+
+    Returns
+    -------
+    dict
+        elo, elo_low, elo_high, los (優位の確率), score (得点率)．
+    '''
+    n = wins + draws + losses
+    if n == 0:
+        return {'elo': 0.0, 'elo_low': 0.0, 'elo_high': 0.0, 'los': 0.5, 'score': 0.5}
+    score = (wins + draws / 2) / n
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / n
+    margin = 1.959964 * math.sqrt(variance / n)
+    los = 0.5 * (1 + math.erf((wins - losses) / math.sqrt(2 * (wins + losses)))) if wins + losses else 0.5
+    return {'elo': elo(score), 'elo_low': elo(score - margin), 'elo_high': elo(score + margin),
+            'los': los, 'score': score}
+
+
+def sprt(wins, draws, losses, elo0=0.0, elo1=5.0, alpha=0.05, beta=0.05):
+    '''
+    SPRT の対数尤度比を，得点の分布を正規分布で近似して求める
+
+    Parameters
+    ----------
+    wins, draws, losses : int
+        勝ち・引き分け・負けの数．
+    elo0, elo1 : float, default 0.0, 5.0
+        帰無仮説と対立仮説の Elo の差．
+    alpha, beta : float, default 0.05
+        第1種・第2種の誤りの確率．
+
+    Returns
+    -------
+    dict
+        llr (対数尤度比), lower, upper (判定の境界),
+        verdict ('H1' -- 強くなった, 'H0' -- 強くなっていない, None -- まだ決まらない)．
+    '''
+    lower = math.log(beta / (1 - alpha))
+    upper = math.log((1 - beta) / alpha)
+    n = wins + draws + losses
+    llr = 0.0
+    if n and wins + losses:
+        score = (wins + draws / 2) / n
+        variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / n
+        if variance > 0:
+            s0, s1 = expected_score(elo0), expected_score(elo1)
+            llr = n * (s1 - s0) * (2 * score - s0 - s1) / (2 * variance)
+    verdict = 'H1' if llr >= upper else 'H0' if llr <= lower else None
+    return {'llr': llr, 'lower': lower, 'upper': upper, 'verdict': verdict}
+
+
+def summarize(records, sprt_bounds=(0.0, 5.0), alpha=0.05, beta=0.05):
+    '''
+    結果を組ごとにまとめる
+
+    Parameters
+    ----------
+    records : list > [dict, ...]
+        play_game の返り値．
+    sprt_bounds : tuple > (float, float), default (0.0, 5.0)
+        SPRT の elo0, elo1．
+    alpha, beta : float, default 0.05
+        SPRT の誤りの確率．
+
+    Returns
+    -------
+    dict
+        pairs (組ごとの成績．最初の名前から見る) と engines (設定ごとの CPU 時間と局面数)．
+    '''
+    pairs = {}
+    engines = {}
+    for record in records:
+        a, b = sorted((record['white'], record['black']))
+        wdl = pairs.setdefault((a, b), [0, 0, 0])
+        score = score_of(record, a)
+        wdl[0 if score == 1 else 1 if score == 0.5 else 2] += 1
+        for color, name in ((W, record['white']), (B, record['black'])):
+            total = engines.setdefault(name, {'games': 0, 'moves': 0, 'cpu': 0.0,
+                                              'nodes': 0, 'score': 0.0})
+            total['games'] += 1
+            total['moves'] += (record['plies'] + (color == W)) // 2
+            total['cpu'] += record['cpu'][color]
+            total['nodes'] += record['nodes'][color]
+            total['score'] += score_of(record, name)
+    result = {'pairs': [], 'engines': {}}
+    for (a, b), (wins, draws, losses) in sorted(pairs.items()):
+        result['pairs'].append(dict(engine=a, opponent=b, wins=wins, draws=draws, losses=losses,
+                                    **match_stats(wins, draws, losses),
+                                    sprt=sprt(wins, draws, losses, *sprt_bounds, alpha, beta)))
+    for name, total in sorted(engines.items()):
+        result['engines'][name] = dict(
+            total,
+            cpu_per_move=total['cpu'] / total['moves'] if total['moves'] else 0.0,
+            nodes_per_cpu_second=total['nodes'] / total['cpu'] if total['cpu'] else 0.0)
+    return result
+
+
+def print_summary(summary, stream=None):
+    '''summarize の結果を表にして表示する'''
+    stream = stream if stream is not None else sys.stdout
+    print(f'{"engine":<16}{"games":>7}{"score":>9}{"cpu/move":>10}{"nodes/cpu-s":>13}', file=stream)
+    for name, total in summary['engines'].items():
+        print(f'{name:<16}{total["games"]:>7}{total["score"]:>9.1f}'
+              f'{total["cpu_per_move"]:>9.3f}s{total["nodes_per_cpu_second"]:>13.0f}', file=stream)
+    for pair in summary['pairs']:
+        test = pair['sprt']
+        verdict = test['verdict'] or 'continue'
+        print(f'\n{pair["engine"]} vs {pair["opponent"]}: +{pair["wins"]} ={pair["draws"]} -{pair["losses"]}'
+              f'  score {pair["score"]:.3f}'
+              f'  Elo {pair["elo"]:+.1f} [{pair["elo_low"]:+.1f}, {pair["elo_high"]:+.1f}]'
+              f'  LOS {pair["los"]:.3f}', file=stream)
+        print(f'SPRT LLR {test["llr"]:+.2f} [{test["lower"]:+.2f}, {test["upper"]:+.2f}]: {verdict}',
+              file=stream)
+
+
+def run_tournament(engines, games=100, variants=None, opening_plies=4, workers=None,
+                   output=None, pgn=None, seed=0, max_plies=MAX_PLIES,
+                   sprt_bounds=None, alpha=0.05, beta=0.05, log=None):
+    '''
+    対局をワーカープロセスで並列に指し，結果を1局ずつファイルに追記する
+
+    Parameters
+    ----------
+    engines : dict > {str: dict}
+        名前ごとの Engine の引数 (parse_engine の出力)．
+    games : int, default 100
+        組ごとの対局数．
+    variants : list > [str, ...] or None, default None
+        ゲームの種類の名前．None のときは game_dict のすべて．
+    opening_plies : int, default 4
+        序盤にでたらめに指す手数．
+    workers : int or None, default None
+        プロセス数．None のときは CPU の数．
+    output : str or None, default None
+        結果を追記する JSON Lines のファイル．すでにある対局は指さない．
+        同じ名前の設定が変わっていれば続きを指さずに ValueError を送出する．
+    pgn : str or None, default None
+        棋譜を追記する PGN のファイル．
+    seed : int, default 0
+        序盤の乱数の種の基準．
+    max_plies : int, default MAX_PLIES
+        この手数で引き分けにする．
+    sprt_bounds : tuple > (float, float) or None, default None
+        与えたときは，2つの設定の SPRT の判定が決まった時点で打ち切る．
+    alpha, beta : float, default 0.05
+        SPRT の誤りの確率．
+    log : file-like or None, default None
+        1局ごとの経過の表示先．
+
+    Returns
+    -------
+    list > [dict, ...]
+        これまでの対局の結果すべて．
+
+    Raises
+    ------
+    ValueError
+        output に同じ名前で設定の違う対局がある．
+    '''
+    variants = variants or [kind.__name__ for kind in VARIANTS]
+    records = load_results(output)
+    check_settings(records, engines)
+    done = {_key(record) for record in records}
+    jobs = [job for job in schedule(list(engines), games, variants, opening_plies, seed)
+            if _key(job) not in done]
+    if log is not None and records:
+        print(f'{len(records)} games already in {output}, {len(jobs)} to play', file=log)
+    out = open(output, 'a', encoding='utf-8') if output else None
+    pgn_out = open(pgn, 'a', encoding='utf-8') if pgn else None
+    start = perf_counter()
+    try:
+        with ProcessPoolExecutor(workers or os.cpu_count()) as executor:
+            futures = [executor.submit(play_game, job, engines, max_plies) for job in jobs]
+            try:
+                for count, future in enumerate(as_completed(futures), 1):
+                    record = future.result()
+                    records.append(record)
+                    if out is not None:
+                        out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                        out.flush()
+                    if pgn_out is not None:
+                        headers = dict(record['headers'], Event='tournament',
+                                       Round=str(record['round'] + 1), White=record['white'],
+                                       Black=record['black'], Termination=record['reason'])
+                        game = PGNGame(headers, record['moves'], record['result'])
+                        pgn_out.write(format_game(game) + '\n')
+                        pgn_out.flush()
+                    if log is not None:
+                        print(f'[{count}/{len(jobs)} {perf_counter() - start:.0f}s] '
+                              f'{record["white"]} - {record["black"]} ({record["variant"]}): '
+                              f'{record["result"]} {record["reason"]} in {record["plies"]} plies',
+                              file=log, flush=True)
+                    if sprt_bounds is not None and len(engines) == 2:
+                        names = sorted(engines)
+                        wdl = [0, 0, 0]
+                        # ファイルにある別の組の対局は数えない
+                        for r in records:
+                            if {r['white'], r['black']} != set(names):
+                                continue
+                            score = score_of(r, names[0])
+                            wdl[0 if score == 1 else 1 if score == 0.5 else 2] += 1
+                        if sprt(*wdl, *sprt_bounds, alpha, beta)['verdict'] is not None:
+                            if log is not None:
+                                print('SPRT finished', file=log)
+                            break
+            finally:
+                for future in futures:
+                    future.cancel()
+    finally:
+        if out is not None:
+            out.close()
+        if pgn_out is not None:
+            pgn_out.close()
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play engine settings against each other '
+                                                 'and estimate the Elo difference.')
+    parser.add_argument('--engine', action='append', default=[], metavar='NAME:KEY=VALUE,...',
+                        help='an engine setting; give two or more '
+                             f'(keys: {", ".join(ENGINE_OPTIONS)})')
+    parser.add_argument('--games', type=int, default=100,
+                        help='games per pair of engines (default: 100)')
+    parser.add_argument('--variants', nargs='+', choices=sorted(variant_classes),
+                        help='variants to play, in turn (default: all)')
+    parser.add_argument('--opening-plies', type=int, default=4,
+                        help='random moves played before the engines take over (default: 4)')
+    parser.add_argument('--max-plies', type=int, default=MAX_PLIES,
+                        help=f'adjudicate a draw after this many plies (default: {MAX_PLIES})')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='number of worker processes (default: CPU count)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the openings (default: 0)')
+    parser.add_argument('-o', '--output', help='JSON lines file to append results to; '
+                                               'games already in it are not played again, '
+                                               'so the engine settings must not change')
+    parser.add_argument('--pgn', help='PGN file to append the games to')
+    parser.add_argument('--sprt', nargs=2, type=float, metavar=('ELO0', 'ELO1'),
+                        help='with two engines, stop once the SPRT of ELO0 against ELO1 is decided')
+    parser.add_argument('--alpha', type=float, default=0.05, help='SPRT type I error (default: 0.05)')
+    parser.add_argument('--beta', type=float, default=0.05, help='SPRT type II error (default: 0.05)')
+    parser.add_argument('--report', metavar='RESULTS', help='only summarize an existing results file')
+    args = parser.parse_args(argv)
+    bounds = tuple(args.sprt) if args.sprt else (0.0, 5.0)
+
+    if args.report:
+        records = load_results(args.report)
+    else:
+        try:
+            engines = dict(parse_engine(spec) for spec in args.engine)
+        except ValueError as e:
+            parser.error(str(e))
+        if len(engines) < 2:
+            parser.error('give at least two engines with different names')
+        try:
+            check_settings(load_results(args.output), engines)
+        except ValueError as e:
+            parser.error(str(e))
+        records = run_tournament(engines, args.games, args.variants, args.opening_plies,
+                                 args.workers, args.output, args.pgn, args.seed, args.max_plies,
+                                 tuple(args.sprt) if args.sprt else None,
+                                 args.alpha, args.beta, log=sys.stderr)
+    print_summary(summarize(records, bounds, args.alpha, args.beta))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,12 +1,161 @@
+import os
 from math import pi, sin, cos
 from OpenGL.GL import *
 from OpenGL.GLUT import *
 
+import numpy as np
 from PIL import Image
 
+from bitboard import geometry, STANDARD
+
+# 駒の画像のフォルダ
+IMG_DIR = '../img'
+# 駒1つ分の四角形の頂点 (左下・右下・右上・左上)
+_quad_vertices = np.array([[-0.5, -0.5], [0.5, -0.5], [0.5, 0.5], [-0.5, 0.5]], dtype=np.float32)
+# 画像をまとめた画素を保存するファイル
+ATLAS_CACHE = os.path.join(IMG_DIR, 'atlas_cache.npz')
+
+
+class TextureAtlas:
+    '''
+    駒の画像をすべて1枚のテクスチャに並べたもの．
+    並べた画素はディスクに保存し，画像が変わっていなければ
+    次回からは PIL で読み込まずに保存したものを使う．
+
+    Parameters
+    ----------
+    img_dir : str, default IMG_DIR
+        画像のフォルダ．その下のフォルダにある png をすべて並べる．
+    cache_path : str or None, default ATLAS_CACHE
+        画素を保存するファイル．None のときは保存しない．
+    padding : int, default 1
+        隣の画像がにじまないように空けておく画素数．
+    '''
+
+    def __init__(self, img_dir=IMG_DIR, cache_path=ATLAS_CACHE, padding=1):
+        self.img_dir = img_dir
+        self.cache_path = cache_path
+        self.padding = padding
+        # テクスチャ名 (最初に bind したときに作る)
+        self.texture = None
+        # 画像の名前とテクスチャ座標 (左, 上, 右, 下)
+        self.rects = {}
+
+    def files(self):
+        '''{画像の名前: パス} を返す'''
+        files = {}
+        for folder in sorted(os.listdir(self.img_dir)):
+            folder = os.path.join(self.img_dir, folder)
+            if os.path.isdir(folder):
+                for filename in sorted(os.listdir(folder)):
+                    if filename.endswith('.png'):
+                        files[filename[:-len('.png')]] = os.path.join(folder, filename)
+        return files
+
+    @staticmethod
+    def signature(files):
+        '''画像が変わったかを調べるための文字列'''
+        return '|'.join(f'{name}:{os.path.getmtime(path)}:{os.path.getsize(path)}'
+                        for name, path in sorted(files.items()))
+
+    def build(self, files):
+        '''
+        画像を PIL で読み込み，格子状に並べる
+
+        Returns
+        -------
+        pixels : np.ndarray > shape (高さ, 幅, 4), dtype uint8
+        names : list > [str, ...]
+        boxes : np.ndarray > shape (画像数, 4)
+            各画像の (x, y, 幅, 高さ)．画素単位．
+        '''
+        names = sorted(files)
+        images = [np.asarray(Image.open(files[name]).convert('RGBA')) for name in names]
+        cell = max(max(img.shape[0], img.shape[1]) for img in images) + 2 * self.padding
+        cols = int(np.ceil(np.sqrt(len(images))))
+        rows = -(-len(images) // cols)
+        pixels = np.zeros((rows * cell, cols * cell, 4), dtype=np.uint8)
+        boxes = np.zeros((len(images), 4), dtype=np.int32)
+        for k, img in enumerate(images):
+            x = (k % cols) * cell + self.padding
+            y = (k // cols) * cell + self.padding
+            h, w = img.shape[:2]
+            pixels[y:y + h, x:x + w] = img
+            boxes[k] = (x, y, w, h)
+        return pixels, names, boxes
+
+    def load(self):
+        '''
+        並べた画素を返す．保存したものが使えればそれを読む．
+
+        Returns
+        -------
+        pixels, names, boxes
+            build と同じ．
+        '''
+        files = self.files()
+        signature = self.signature(files)
+        if self.cache_path is not None and os.path.exists(self.cache_path):
+            try:
+                with np.load(self.cache_path, allow_pickle=False) as cache:
+                    if str(cache['signature']) == signature:
+                        return cache['pixels'], list(cache['names']), cache['boxes']
+            except (OSError, ValueError, KeyError):
+                pass
+        pixels, names, boxes = self.build(files)
+        if self.cache_path is not None:
+            try:
+                tmp = self.cache_path + '.tmp.npz'
+                np.savez(tmp, pixels=pixels, names=np.array(names), boxes=boxes,
+                         signature=np.array(signature))
+                os.replace(tmp, self.cache_path)
+            except OSError:
+                pass
+        return pixels, names, boxes
+
+    def upload(self):
+        '''テクスチャを作り，画素を送る'''
+        pixels, names, boxes = self.load()
+        height, width = pixels.shape[:2]
+        self.rects = {name: (x / width, y / height, (x + w) / width, (y + h) / height)
+                      for name, (x, y, w, h) in zip(names, boxes)}
+        self.texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height, 0,
+            GL_RGBA, GL_UNSIGNED_BYTE, np.ascontiguousarray(pixels).tobytes())
+        glTexParameter(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameter(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+
+    def bind(self):
+        '''テクスチャを有効化する．初回は画素を読み込んで送る．'''
+        if self.texture is None:
+            self.upload()
+        else:
+            glBindTexture(GL_TEXTURE_2D, self.texture)
+
+    def texcoords(self, name):
+        '''
+        画像を四角形に貼るテクスチャ座標を返す
+
+        Returns
+        -------
+        np.ndarray > shape (4, 2)
+            左下・右下・右上・左上の順．
+        '''
+        left, top, right, bottom = self.rects[name]
+        return np.array([[left, bottom], [right, bottom], [right, top], [left, top]],
+                        dtype=np.float32)
+
+
+# 駒の画像をまとめたテクスチャ
+atlas = TextureAtlas()
+# 画像ID と画像の名前
+sprite_names = {}
+
 
 def set_img(name, path, imgID):
-    '''画像の設定: name.pngを読み込む
+    '''画像の設定: 画像ID に name.png を割り当てる．
+    画素は最初の bind_atlas のときにまとめて読み込む．
 
     Parameters
     ----------
@@ -17,20 +166,17 @@ def set_img(name, path, imgID):
     imgID : int
             指定する画像ID．
     '''
-    img = Image.open(f'../img/{path}/{name}.png')   # 画像を読み込む
-    w, h = img.size                                 # 画像の横幅、縦幅
-    glBindTexture(GL_TEXTURE_2D, imgID)             # imgID のテクスチャを有効化する
-	# 画像とテクスチャを関連づける
-    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, w, h, 0,
-        GL_RGBA, GL_UNSIGNED_BYTE, img.tobytes())
-	# テクスチャの設定
-    glTexParameter(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-    glTexParameter(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+    sprite_names[imgID] = name
+
+
+def bind_atlas():
+    '''駒の画像のテクスチャを有効化する．描画のはじめに1回呼ぶ．'''
+    atlas.bind()
 
 
 def draw_img(x, y, imgID):
     '''
-	画像を描画する
+	画像を描画する．テクスチャは bind_atlas で有効化しておくこと．
 
     Parameters
     ----------
@@ -39,27 +185,22 @@ def draw_img(x, y, imgID):
     imgID : int
         画像ID．
     '''
+    texcoords = atlas.texcoords(sprite_names[imgID])
     glPushMatrix()          # 変形範囲の開始
-    glBindTexture(GL_TEXTURE_2D, imgID)     # imgID のテクスチャを有効化する
     glTranslate(x, y, 0)    # 平行移動
     glColor(1, 1, 1)        # 色指定
 
 	# テクスチャ座標を指定する
     glBegin(GL_QUADS)
-    glTexCoord(0.0, 1.0)
-    glVertex(-1.0 / 2, -1.0 / 2)
-    glTexCoord(1.0, 1.0)
-    glVertex(1.0 / 2, -1.0 / 2)
-    glTexCoord(1.0, 0.0)
-    glVertex(1.0 / 2, 1.0 / 2)
-    glTexCoord(0.0, 0.0)
-    glVertex(-1.0 / 2, 1.0 / 2)
+    for (s, t), (vx, vy) in zip(texcoords, _quad_vertices):
+        glTexCoord(float(s), float(t))
+        glVertex(float(vx), float(vy))
     glEnd()
 
     glPopMatrix()           # 変形範囲の終了
 
 
-def window2world(x, y, wsize):
+def window2world(x, y, wsize, size=8):
     '''
     ウィンドウ座標を世界座標に変換する
 
@@ -69,18 +210,34 @@ def window2world(x, y, wsize):
         変換するもとの座標．
     wsize : int
         画面の大きさ．
+    size : int, default 8
+        盤面の大きさ．set_view に渡したものと同じにする．
 
     Returns
     -------
     list > [float, float]
         変換先の座標．
     '''
-    return [9*x / wsize - 1, 7 - (9*y / wsize - 1)]
+    return [(size + 1)*x / wsize - 1, size - 1 - ((size + 1)*y / wsize - 1)]
+
+
+def set_view(size=8):
+    '''
+    大きさ size の盤面と，ファイル・ランクの文字の余白が画面に収まるように投影を設定する
+
+    Parameters
+    ----------
+    size : int, default 8
+        盤面の大きさ．
+    '''
+    glLoadIdentity()
+    glOrtho(-1.0, float(size), -1.0, float(size), -4, 4)
 
 
 def draw_pieces(gameboard, imgID_dict, size=8):
     '''
-	駒を描画する
+	駒を描画する．すべての駒を1回の描画命令にまとめる．
+	テクスチャは bind_atlas で有効化しておくこと．
 
     Parematers
     ----------
@@ -91,12 +248,23 @@ def draw_pieces(gameboard, imgID_dict, size=8):
     size : int, default 8
         盤面の大きさ．
     '''
+    pieces = [((i, j), piece) for (i, j), piece in gameboard.items()
+              if 0 <= i < size and 0 <= j < size]
+    if not pieces:
+        return
+    centers = np.array([pos for pos, _ in pieces], dtype=np.float32)
+    vertices = (centers[:, None, :] + _quad_vertices).reshape(-1, 2)
+    texcoords = np.concatenate([atlas.texcoords(sprite_names[imgID_dict[piece.name]])
+                                for _, piece in pieces])
     glEnable(GL_TEXTURE_2D)		# テクスチャマッピングを有効化
-    for i in range(size):
-        for j in range(size):
-            piece = gameboard.get((i, j))  # (i, j)にある駒オブジェクトを取得
-            if piece:
-                draw_img(i, j, imgID_dict[piece.name])
+    glColor(1, 1, 1)
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+    glVertexPointer(2, GL_FLOAT, 0, vertices)
+    glTexCoordPointer(2, GL_FLOAT, 0, texcoords)
+    glDrawArrays(GL_QUADS, 0, len(vertices))
+    glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+    glDisableClientState(GL_VERTEX_ARRAY)
     glDisable(GL_TEXTURE_2D)  # テクスチャマッピングを無効化
 
 
@@ -258,36 +426,131 @@ def draw_game_menu():
                     game_name_dict[i][j])
 
 
-dark_squares_list = ([(i, j) for i in range(0, 8, 2) for j in range(0, 8, 2)]
-    + [(i, j) for i in range(1, 8, 2) for j in range(1, 8, 2)])
+def dark_squares_of(size=8):
+    '''
+    大きさ size の盤面の暗いマスの集合．
+    bitboard.Geometry が大きさごとに一度だけ作るマスの色の表から求める．
+
+    Parameters
+    ----------
+    size : int, default 8
+        盤面の大きさ．
+
+    Returns
+    -------
+    frozenset > {(int, int), ...}
+    '''
+    geo = geometry(size)
+    return frozenset(geo.squares_of(geo.dark))
+
+
+dark_squares_list = list(STANDARD.squares_of(STANDARD.dark))
+# マスが暗いかを定数時間で調べるための集合
+dark_squares = frozenset(dark_squares_list)
 
 
-def draw_squares():
+def draw_squares(size=8):
     '''マス目を描画する'''
-    for i in range(8):
-        for j in range(8):
-            if (i, j) in dark_squares_list:
+    dark = dark_squares if size == 8 else dark_squares_of(size)
+    glBegin(GL_QUADS)
+    for i in range(size):
+        for j in range(size):
+            if (i, j) in dark:
                 glColor(0.82, 0.55, 0.28)
-                square(i, j)
             else:
                 glColor(1.00, 0.81, 0.62)
-                square(i, j)
+            glVertex(i - 1.0 / 2, j - 1.0 / 2)
+            glVertex(i + 1.0 / 2, j - 1.0 / 2)
+            glVertex(i + 1.0 / 2, j + 1.0 / 2)
+            glVertex(i - 1.0 / 2, j + 1.0 / 2)
+    glEnd()
 
 
-def draw_file():
+def draw_file(size=8):
     '''ファイルの文字を描画する'''
     glColor(1.0, 1.0, 1.0)
-    for x in range(8):
+    for x in range(size):
         draw_str(x, -0.75, chr(x + 97))
 
 
-def draw_rank():
+def draw_rank(size=8):
     '''ランクの文字を描画する'''
     glColor(1.0, 1.0, 1.0)
-    for y in range(8):
+    for y in range(size):
         draw_str(-0.75, y, str(y + 1))
 
 
+class DisplayListCache:
+    '''
+    描画内容をディスプレイリストに記録しておき，
+    key が前回と変わったときだけ記録し直す．変わらなければリストを呼ぶだけにする．
+
+    Attributes
+    ----------
+    builds : int
+        記録し直した回数．
+    calls : int
+        記録したリストをそのまま呼んだ回数．
+    '''
+
+    # まだ何も記録していないことを表す key
+    _EMPTY = object()
+
+    def __init__(self):
+        self.list_id = None
+        self.key = self._EMPTY
+        self.builds = 0
+        self.calls = 0
+
+    def draw(self, key, render, *args):
+        '''
+        Parameters
+        ----------
+        key : hashable
+            描画内容を決める値．
+        render : callable
+            描画する関数．render(*args) を呼ぶ．
+        '''
+        if self.list_id is None:
+            self.list_id = glGenLists(1)
+        if key != self.key:
+            glNewList(self.list_id, GL_COMPILE_AND_EXECUTE)
+            render(*args)
+            glEndList()
+            self.key = key
+            self.builds += 1
+        else:
+            glCallList(self.list_id)
+            self.calls += 1
+
+    def invalidate(self):
+        '''次の draw で記録し直す'''
+        self.key = self._EMPTY
+
+
+def _draw_static_board(size):
+    draw_squares(size)
+    draw_file(size)
+    draw_rank(size)
+
+
+# 盤面 (マス目とファイル・ランクの文字) のディスプレイリスト
+board_layer = DisplayListCache()
+
+
+def draw_board(size=8):
+    '''
+    盤面を描画する．
+    初回と大きさが変わったときにディスプレイリストに記録し，以降はそれを呼び出すだけにする．
+
+    Parameters
+    ----------
+    size : int, default 8
+        盤面の大きさ．
+    '''
+    board_layer.draw(size, _draw_static_board, size)
+
+
 def draw_available_moves(poslist, opponent=None):
     '''動かせる位置を描画する
 
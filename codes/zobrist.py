@@ -0,0 +1,76 @@
+'''ゾブリストハッシュで局面を整数にするモジュール
+
+盤面の部分は bitboard.Position が駒の出し入れのたびに更新し，
+手番・キャスリングのポテンシャル・アンパッサン用の位置は
+state_hash で合成する．
+'''
+
+from random import Random
+
+# 値を用意する盤面の大きさの上限
+MAX_SIZE = 16
+_SQUARES = [(x, y) for y in range(MAX_SIZE) for x in range(MAX_SIZE)]
+
+# 毎回同じ値になるように乱数の種を固定する
+_rng = Random(0x5EED)
+
+# 駒の名前ごと・マスごとの値
+PIECE_KEYS = {color + abbr: {pos: _rng.getrandbits(64) for pos in _SQUARES}
+              for color in ('W', 'B') for abbr in ('N', 'R', 'B', 'Q', 'K', 'P', 'Un')}
+# 黒番のときの値
+SIDE_KEY = _rng.getrandbits(64)
+# キャスリングのポテンシャルごとの値
+CASTLING_KEYS = {color: (_rng.getrandbits(64), _rng.getrandbits(64))
+                 for color in ('W', 'B')}
+# 2歩進んだポーンの位置ごとの値
+EN_PASSANT_KEYS = {pos: _rng.getrandbits(64) for pos in _SQUARES}
+
+
+def board_hash(gameboard):
+    '''
+    盤面のハッシュを最初から計算する
+
+    Parameters
+    ----------
+    gameboard : dict > {(int, int): obj, ...}
+        盤面．
+
+    Returns
+    -------
+    int
+    '''
+    h = 0
+    for pos, piece in gameboard.items():
+        h ^= PIECE_KEYS[piece.name][pos]
+    return h
+
+
+def state_hash(board_h, playersturn, can_castling, advanced2_pos):
+    '''
+    盤面のハッシュに手番などの状態を合成する
+
+    Parameters
+    ----------
+    board_h : int
+        盤面のハッシュ．
+    playersturn : str > 'W' or 'B'
+        手番．
+    can_castling : dict > {str: [bool, bool]}
+        キャスリングのポテンシャル．
+    advanced2_pos : tuple > (int, int) or None
+        直前に2歩進んだポーンの位置．
+
+    Returns
+    -------
+    int
+    '''
+    h = board_h
+    if playersturn == 'B':
+        h ^= SIDE_KEY
+    for color in ('W', 'B'):
+        for side in (0, 1):
+            if can_castling[color][side]:
+                h ^= CASTLING_KEYS[color][side]
+    if advanced2_pos:
+        h ^= EN_PASSANT_KEYS[advanced2_pos]
+    return h